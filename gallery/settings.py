@@ -100,6 +100,26 @@ DATABASES = {
 if 'test' in sys.argv and '--keepdb' in sys.argv:
     DATABASES['default']['TEST']['NAME'] = '/dev/shm/gallery_api.test.db.sqlite3'
 
+# Cache
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+# Shared by every process: photoblog keeps its invalidations, locks and
+# versions in it, see photoblog/cache.py
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+    }
+}
+if 'test' in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    # Tests run in a single process
+    SILENCED_SYSTEM_CHECKS = ['photoblog.W001']
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
@@ -193,3 +213,51 @@ DEBUG_TOOLBAR_PATCH_SETTINGS = False
 INTERNAL_IPS = (
     '127.0.0.1'
 )
+
+# photoblog image renditions, see photoblog/renditions.py
+PHOTOBLOG_RENDITIONS = {
+    'thumbnail': {'width': 320, 'quality': 70, 'format': 'JPEG'},
+    'medium': {'width': 800, 'quality': 80, 'format': 'JPEG'},
+    'large': {'width': 1600, 'quality': 85, 'format': 'JPEG'},
+}
+
+# photoblog image worker processes, see photoblog/workers.py
+PHOTOBLOG_IMAGE_WORKERS = os.cpu_count() or 1
+PHOTOBLOG_IMAGE_QUEUE_SIZE = 64
+
+# photoblog chunked uploads, see photoblog/uploads.py
+PHOTOBLOG_UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
+PHOTOBLOG_UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+PHOTOBLOG_UPLOAD_MAX_AGE = 24 * 60 * 60
+
+# photoblog read-through cache of published items, see photoblog/cache.py
+PHOTOBLOG_CACHE = 'default'
+PHOTOBLOG_CACHE_TIMEOUT = 24 * 60 * 60
+PHOTOBLOG_LISTING_TIMEOUT = 300
+PHOTOBLOG_CACHE_LOCK_TIMEOUT = 10
+PHOTOBLOG_CACHE_BETA = 1.0
+PHOTOBLOG_CACHE_STATS_INTERVAL = 10
+
+# photoblog full-page cache, see photoblog/pagecache.py
+PHOTOBLOG_PAGE_TIMEOUT = 300
+PHOTOBLOG_PAGE_PARAMS = ['cursor', 'category', 'price', 'size', 'collection']
+
+# photoblog faceted browsing, see photoblog/facets.py
+PHOTOBLOG_PRICE_RANGES = [100, 500, 1000, 5000]
+PHOTOBLOG_SIZE_BUCKETS = [('small', 30), ('medium', 100), ('large', None)]
+
+# photoblog search-as-you-type suggestions, see photoblog/autocomplete.py
+PHOTOBLOG_AUTOCOMPLETE_LIMIT = 10
+PHOTOBLOG_AUTOCOMPLETE_INTERVAL = 1
+
+# photoblog "more like this", see photoblog/similarity.py
+PHOTOBLOG_SIMILARITY_INDEX = os.path.join(MEDIA_ROOT, 'similarity',
+                                          'index.npy')
+PHOTOBLOG_SIMILARITY_COLOR_WEIGHT = 0.5
+
+# photoblog color palettes, see photoblog/palettes.py
+PHOTOBLOG_PALETTE_SIZE = 5
+PHOTOBLOG_COLOR_RADIUS = 20
+
+# photoblog near-duplicate detection, see photoblog/duplicates.py
+PHOTOBLOG_DUPLICATE_DISTANCE = 6
@@ -21,12 +21,15 @@ from django.contrib import admin
 from django.urls import include, path
 from django.views.i18n import JavaScriptCatalog
 
+from photoblog.urls import tile_urlpatterns
+
 home = apps.get_app_config('home').name
 photoblog = apps.get_app_config('photoblog').name
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('i18n/', include('django.conf.urls.i18n')),
+    path('gallery/tiles/', include(tile_urlpatterns)),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
 urlpatterns += i18n_patterns(
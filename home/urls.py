@@ -1,10 +1,12 @@
 from django.conf import settings
 from django.urls import path
 
+from photoblog.pagecache import page_cache
+
 from . import views
 
 app_name = 'home'
 
 urlpatterns = [
-    path('', views.home, name='home')
+    path('', page_cache(views.home), name='home')
 ]
@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class PhotoblogConfig(AppConfig):
     name = 'photoblog'
+
+    def ready(self):
+        from django.core import checks
+        from photoblog import cache
+        from photoblog import signals  # noqa: F401 pylint: disable=unused-import
+
+        checks.register(cache.check_shared_cache, checks.Tags.caches)
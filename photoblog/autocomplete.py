@@ -0,0 +1,328 @@
+"""In-process prefix index for search-as-you-type suggestions.
+
+Titles of published Entries, Stories and Collections, and Category names,
+are kept in memory per language, in a sorted array of (key, model, pk)
+searched with bisect. Every word of a title starts a key, so 'sea'
+suggests 'Over the sea'. Keys are lowercased and stripped of accents.
+Suggestions are served without touching the database.
+
+Each process builds its index on first use, from the translation
+columns. The signal handlers in photoblog.signals update it in place,
+bump a version shared through photoblog.cache and log the (model, pk)
+changed under that version. At most every PHOTOBLOG_AUTOCOMPLETE_INTERVAL
+seconds, lookups compare the shared version to theirs: the items changed
+by other processes meanwhile are read again from the database and
+patched in. Only when the log is incomplete, evicted or too long is the
+whole index rebuilt, outside the lock, and swapped in. The version and
+the log only reach the other processes if the cache is shared by all of
+them, which photoblog.cache requires (see check_shared_cache()); with a
+per-process cache, changes made elsewhere are missed until a restart.
+
+Scheduled items are indexed with their publication time and only
+suggested once it has passed.
+
+Settings:
+
+    PHOTOBLOG_AUTOCOMPLETE_LIMIT -- maximum suggestions (default 10)
+    PHOTOBLOG_AUTOCOMPLETE_INTERVAL -- seconds between checks for changes
+                                       made by other processes (default 1)
+"""
+import bisect
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from photoblog import cache, search
+
+VERSION_KEY = 'photoblog:autocomplete:version'
+CHANGE_KEY = 'photoblog:autocomplete:change:{version}'
+# Seconds changes stay in the log, and the most patched at once
+CHANGE_TIMEOUT = 3600
+MAX_CHANGES = 200
+
+# model name -> translated field suggested
+FIELDS = {
+    'entry': 'title',
+    'story': 'title',
+    'collection': 'title',
+    'category': 'name',
+}
+
+_lock = threading.RLock()
+_state = {'version': None, 'indexes': {}, 'checked_at': None}
+
+
+def limit() -> int:
+    return getattr(settings, 'PHOTOBLOG_AUTOCOMPLETE_LIMIT', 10)
+
+
+def interval() -> float:
+    return getattr(settings, 'PHOTOBLOG_AUTOCOMPLETE_INTERVAL', 1)
+
+
+def normalize(text: str) -> str:
+    """Returns 'text' lowercased, without accents and with single
+    spaces."""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.casefold().split())
+
+
+def keys_of(label: str) -> list:
+    """Returns the keys 'label' is found by: the label from each of its
+    words on."""
+    words = normalize(label).split(' ')
+    return [' '.join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+class PrefixIndex:
+    """Labels of one language, found by the prefix of any of their
+    words. Not thread safe on its own, see the module lock."""
+
+    def __init__(self, rows=()):
+        """Builds the index from 'rows' of (model, pk, label,
+        published_at) at once."""
+        self.labels = {}
+        for model, pk, label, published_at in rows:
+            if label:
+                self.labels[(model, pk)] = (label, published_at)
+        self.keys = sorted((key, model, pk)
+                           for (model, pk), (label, _) in self.labels.items()
+                           for key in keys_of(label))
+
+    def __len__(self):
+        return len(self.labels)
+
+    def add(self, model: str, pk: int, label: str, published_at) -> None:
+        """Adds or replaces the label of 'model' 'pk'."""
+        self.remove(model, pk)
+        if not label:
+            return
+        self.labels[(model, pk)] = (label, published_at)
+        for key in keys_of(label):
+            bisect.insort(self.keys, (key, model, pk))
+
+    def remove(self, model: str, pk: int) -> None:
+        """Removes the label of 'model' 'pk', if any."""
+        found = self.labels.pop((model, pk), None)
+        if found is None:
+            return
+        for key in keys_of(found[0]):
+            i = bisect.bisect_left(self.keys, (key, model, pk))
+            if i < len(self.keys) and self.keys[i] == (key, model, pk):
+                del self.keys[i]
+
+    def lookup(self, prefix: str, count: int, now=None) -> list:
+        """Returns up to 'count' (model, pk, label) whose words start with
+        'prefix', in alphabetical order of the matching words, leaving
+        out items published after 'now' (default timezone.now())."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        now = now or timezone.now()
+        found = []
+        seen = set()
+        i = bisect.bisect_left(self.keys, (prefix,))
+        while i < len(self.keys) and len(found) < count:
+            key, model, pk = self.keys[i]
+            if not key.startswith(prefix):
+                break
+            i += 1
+            label, published_at = self.labels[(model, pk)]
+            if (model, pk) in seen or \
+                    (published_at is not None and published_at > now):
+                continue
+            seen.add((model, pk))
+            found.append((model, pk, label))
+        return found
+
+
+def searchable_models() -> list:
+    from photoblog.models import Category, Collection, Entry, Story
+
+    return [Entry, Story, Collection, Category]
+
+
+def rows_of(instance) -> dict:
+    """Returns the (model, pk, label, published_at) of 'instance' by
+    language, or an empty dict if it can't be suggested."""
+    from photoblog.models import Item
+
+    model = instance._meta.model_name
+    published_at = None
+    if isinstance(instance, Item):
+        if instance.published_at is None:
+            # Drafts are never suggested
+            return {}
+        published_at = instance.published_at
+    labels = search.translations(instance, FIELDS[model])
+    return {language: (model, instance.pk, label, published_at)
+            for language, label in labels.items()}
+
+
+def build() -> dict:
+    """Returns a PrefixIndex per language, loaded from the database."""
+    from photoblog.models import Item
+
+    rows = {language: [] for language in search.languages()}
+    for model in searchable_models():
+        field = FIELDS[model._meta.model_name]
+        columns = [f'{field}_{code}' for code in rows]
+        queryset = model.objects.all()
+        if issubclass(model, Item):
+            queryset = queryset.exclude(published_at=None)
+            columns.append('published_at')
+        for instance in queryset.only(*columns).iterator():
+            for language, row in rows_of(instance).items():
+                rows[language].append(row)
+    return {language: PrefixIndex(found) for language, found in rows.items()}
+
+
+def reset() -> None:
+    """Drops the index of this process, rebuilt on next use."""
+    with _lock:
+        _state['version'] = None
+        _state['indexes'] = {}
+        _state['checked_at'] = None
+
+
+def get_index(language: str) -> PrefixIndex:
+    """Returns the index of 'language', catching up with the changes made
+    by other processes if it is time to check for them."""
+    now = time.monotonic()
+    with _lock:
+        current = _state['version']
+        due = current is None or _state['checked_at'] is None \
+            or now - _state['checked_at'] >= interval()
+        if due:
+            _state['checked_at'] = now
+    if due:
+        _catch_up(current)
+    with _lock:
+        return _state['indexes'].get(language, PrefixIndex())
+
+
+def _catch_up(current) -> None:
+    """Brings the indexes from version 'current' to the shared version,
+    from the change log or else by a rebuild, without holding the lock
+    while reading the database."""
+    backend = cache.get_cache()
+    version = backend.get(VERSION_KEY, 0)
+    if version == current:
+        return
+    changes = None
+    if current is not None and 0 < version - current <= MAX_CHANGES:
+        keys = [CHANGE_KEY.format(version=v)
+                for v in range(current + 1, version + 1)]
+        logged = backend.get_many(keys)
+        if len(logged) == len(keys):
+            changes = {change for key in keys for change in logged[key]}
+    if changes is None:
+        indexes = build()
+        with _lock:
+            _state['indexes'] = indexes
+            _state['version'] = version
+        return
+    rows = _reload(changes)
+    with _lock:
+        if _state['version'] != current:
+            # Caught up by another thread meanwhile
+            return
+        for (model, pk), found in rows.items():
+            _patch(_state['indexes'], model, pk, found)
+        _state['version'] = version
+
+
+def _reload(changes) -> dict:
+    """Returns the rows by language of the (model, pk) 'changes', read
+    from the database, by (model, pk)."""
+    models = {model._meta.model_name: model for model in searchable_models()}
+    pks = {}
+    for model, pk in changes:
+        pks.setdefault(model, []).append(pk)
+    rows = {change: {} for change in changes}
+    for model, found in pks.items():
+        for instance in models[model].objects.filter(pk__in=found):
+            rows[(model, instance.pk)] = rows_of(instance)
+    return rows
+
+
+def _patch(indexes, model: str, pk: int, rows: dict) -> None:
+    # Adds, replaces or removes 'model' 'pk' given its 'rows' by language
+    for language, index in indexes.items():
+        if language in rows:
+            index.add(*rows[language])
+        else:
+            index.remove(model, pk)
+
+
+def suggest(prefix: str, language: str = None, count: int = None) -> list:
+    """Returns the suggestions for 'prefix' in 'language', as dicts with
+    the 'label', 'model' and 'id' of the item, and the 'url' of entries.
+
+    Keyword arguments:
+    prefix -- beginning of a word, as typed
+    language -- language code (default the active language)
+    count -- maximum number of suggestions (default
+             PHOTOBLOG_AUTOCOMPLETE_LIMIT)
+    """
+    language = language or translation.get_language()
+    index = get_index(language)
+    with _lock:
+        found = index.lookup(prefix, count or limit())
+    result = []
+    for model, pk, label in found:
+        url = None
+        if model == 'entry':
+            url = reverse('gallery:entry-detail', args=[pk])
+        result.append({'label': label, 'model': model, 'id': pk,
+                       'url': url})
+    return result
+
+
+def _changed(rows: dict) -> None:
+    """Applies 'rows', the rows by language of changed (model, pk), to
+    the indexes if this process has built them, then bumps the shared
+    version and logs the changes under it for the other processes."""
+    backend = cache.get_cache()
+    with _lock:
+        built = _state['version'] is not None
+        if built:
+            for (model, pk), found in rows.items():
+                _patch(_state['indexes'], model, pk, found)
+        backend.add(VERSION_KEY, 0, timeout=None)
+        try:
+            version = backend.incr(VERSION_KEY)
+        except ValueError:
+            # Evicted meanwhile: every process rebuilds
+            return
+        backend.set(CHANGE_KEY.format(version=version), list(rows),
+                    timeout=CHANGE_TIMEOUT)
+        if built and version == _state['version'] + 1:
+            _state['version'] = version
+        # Otherwise another process changed them meanwhile, caught up on
+        # from the log on the next check
+
+
+def update(instance) -> None:
+    """Adds, replaces or removes the suggestion of 'instance' after it was
+    saved."""
+    _changed({(instance._meta.model_name, instance.pk): rows_of(instance)})
+
+
+def remove(model, pk: int) -> None:
+    """Removes the suggestion of 'model' 'pk'."""
+    _changed({(model._meta.model_name, pk): {}})
+
+
+def refresh(model, pks) -> None:
+    """Reloads the suggestions of 'model' 'pks' from the database, e.g.
+    after an update() that sent no signals."""
+    pks = list(pks)
+    if not pks or model._meta.model_name not in FIELDS:
+        return
+    _changed(_reload({(model._meta.model_name, pk) for pk in pks}))
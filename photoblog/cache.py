@@ -0,0 +1,352 @@
+"""Read-through cache of published items.
+
+Published Entries, Stories and Collections are serialized, with their
+cover and category, into the cache once per language. The signal
+handlers in photoblog.signals delete them whenever an item, its cover,
+its category or its images change, so entries never have to expire on
+their own.
+
+Listings are cached with get_or_compute(), which keeps a single process
+recomputing a value at a time, across every process sharing the cache:
+the first to notice a value is stale takes a lock in the cache and
+recomputes it, while the others keep serving the stale copy. Changes to items don't delete listings, they
+mark them stale by bumping a generation counter, so publishing doesn't
+send every worker to the database at once. Values are also recomputed a
+little before they expire, at random, the earlier the slower they are to
+compute ("XFetch", Vattani et al., Optimal Probabilistic Cache Stampede
+Prevention).
+
+Invalidations, locks, generations and versions only reach the other
+processes through the cache, so PHOTOBLOG_CACHE must be a backend shared
+by every process, such as memcached or Redis. With a per-process one,
+such as the default LocMemCache, a change is only seen by the process
+that made it, the others serving stale items for up to
+PHOTOBLOG_CACHE_TIMEOUT; check_shared_cache() warns about it.
+
+Settings:
+
+    PHOTOBLOG_CACHE -- cache alias to use (default 'default')
+    PHOTOBLOG_CACHE_TIMEOUT -- seconds entries are kept (default 1 day)
+    PHOTOBLOG_LISTING_TIMEOUT -- seconds listings are fresh (default 300)
+    PHOTOBLOG_CACHE_LOCK_TIMEOUT -- seconds a recomputation may take
+                                    before another process steps in
+                                    (default 10)
+    PHOTOBLOG_CACHE_BETA -- eagerness of early recomputation, 0 disables
+                            it (default 1.0)
+    PHOTOBLOG_CACHE_STATS_INTERVAL -- seconds hits and misses are counted
+                                      in process before being added to
+                                      the shared counters (default 10)
+"""
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone, translation
+
+MISSING = 'missing'
+GENERATION_KEY = 'photoblog:listing:generation'
+CHANGED_AT_KEY = 'photoblog:changed_at'
+LOCK_POLL_INTERVAL = 0.05
+
+# Whether a stale value was served while computing another one
+_local = threading.local()
+STATS_KEYS = {'hits': 'photoblog:stats:hits',
+              'misses': 'photoblog:stats:misses'}
+# Counts not yet added to the shared counters, see count()
+_stats_lock = threading.Lock()
+_pending = {'hits': 0, 'misses': 0, 'flushed_at': time.monotonic()}
+
+
+def get_cache():
+    return caches[getattr(settings, 'PHOTOBLOG_CACHE', 'default')]
+
+
+def check_shared_cache(**kwargs) -> list:
+    """System check warning when the photoblog cache is private to each
+    process, see the module docstring."""
+    backend = get_cache()
+    if isinstance(backend, (LocMemCache, DummyCache)):
+        return [checks.Warning(
+            f'The photoblog cache uses {type(backend).__name__}, which is '
+            f'not shared between processes: changes made by one process '
+            f'are not seen by the others.',
+            hint='Set PHOTOBLOG_CACHE to a cache shared by every process, '
+                 'e.g. memcached or Redis.',
+            obj='PHOTOBLOG_CACHE', id='photoblog.W001')]
+    return []
+
+
+def cache_timeout() -> int:
+    return getattr(settings, 'PHOTOBLOG_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def listing_timeout() -> int:
+    return getattr(settings, 'PHOTOBLOG_LISTING_TIMEOUT', 300)
+
+
+def lock_timeout() -> int:
+    return getattr(settings, 'PHOTOBLOG_CACHE_LOCK_TIMEOUT', 10)
+
+
+def languages() -> list:
+    return [code for code, _ in settings.LANGUAGES]
+
+
+def item_key(model, pk: int, language: str) -> str:
+    return f'photoblog:item:{model._meta.label_lower}:{pk}:{language}'
+
+
+def stats_interval() -> float:
+    return getattr(settings, 'PHOTOBLOG_CACHE_STATS_INTERVAL', 10)
+
+
+def count(stat: str, amount: int = 1) -> None:
+    """Adds 'amount' to hit/miss counter 'stat'. Counts are kept in
+    process and added to the counters shared by every process using the
+    cache at most every PHOTOBLOG_CACHE_STATS_INTERVAL seconds, so that
+    reads don't pay for extra round trips."""
+    with _stats_lock:
+        _pending[stat] += amount
+        due = time.monotonic() - _pending['flushed_at'] >= stats_interval()
+    if due:
+        flush_stats()
+
+
+def flush_stats() -> None:
+    """Adds the counts of this process to the shared counters."""
+    with _stats_lock:
+        counts = {stat: _pending[stat] for stat in STATS_KEYS}
+        for stat in STATS_KEYS:
+            _pending[stat] = 0
+        _pending['flushed_at'] = time.monotonic()
+    cache = get_cache()
+    for stat, amount in counts.items():
+        if not amount:
+            continue
+        cache.add(STATS_KEYS[stat], 0, timeout=None)
+        try:
+            cache.incr(STATS_KEYS[stat], amount)
+        except ValueError:
+            # Evicted between add and incr
+            cache.set(STATS_KEYS[stat], amount, timeout=None)
+
+
+def stats() -> dict:
+    """Returns the hit and miss counts, and the hit ratio. Counts of other
+    processes show up once they flushed them."""
+    flush_stats()
+    values = get_cache().get_many(list(STATS_KEYS.values()))
+    result = {stat: values.get(key, 0) for stat, key in STATS_KEYS.items()}
+    total = result['hits'] + result['misses']
+    result['ratio'] = result['hits'] / total if total else 0.0
+    return result
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        for stat in STATS_KEYS:
+            _pending[stat] = 0
+    get_cache().delete_many(list(STATS_KEYS.values()))
+
+
+def serialize_image(image) -> dict:
+    """Returns the fields of Image 'image' templates need, in the active
+    language."""
+    if image is None:
+        return None
+    renditions = {r.name: r.file.url for r in image.renditions.all()}
+    return {
+        'id': image.pk,
+        'title': image.title,
+        'caption': image.caption,
+        'url': image.image.url if image.image else '',
+        'renditions': renditions,
+        'srcset': image.srcset,
+        'width': image.width,
+        'height': image.height,
+        'aspect_ratio': image.aspect_ratio,
+        'placeholder': image.placeholder,
+        'dzi_url': image.dzi_url,
+    }
+
+
+def serialize_item(item) -> dict:
+    """Returns the fields of Item 'item' templates need, in the active
+    language."""
+    data = {
+        'id': item.pk,
+        'model': item._meta.model_name,
+        'title': item.title,
+        'slug': item.slug,
+        'description': item.description,
+        'created_at': item.created_at,
+        'published_at': item.published_at,
+        'cover': serialize_image(item.cover),
+        'category': None,
+    }
+    if item.category is not None:
+        data['category'] = {
+            'id': item.category.pk,
+            'name': item.category.name,
+            'slug': item.category.slug,
+        }
+    if hasattr(item, 'images'):
+        data['image_ids'] = list(item.images.values_list('pk', flat=True))
+    if hasattr(item, 'text'):
+        data['text'] = item.text
+    if hasattr(item, 'price'):
+        data['price'] = item.price
+    return data
+
+
+def get_item(model, pk: int, language: str = None):
+    """Returns the serialized published 'model' with primary key 'pk' in
+    'language', or None if there is no such published item.
+
+    Keyword arguments:
+    model -- Entry, Story or Collection
+    pk -- primary key of the item
+    language -- language code (default the active language)
+    """
+    language = language or translation.get_language()
+    cache = get_cache()
+    key = item_key(model, pk, language)
+    data = cache.get(key)
+    if data is not None:
+        count('hits')
+        return None if data == MISSING else data
+    count('misses')
+    item = model.objects.select_related('cover', 'category')\
+        .prefetch_related('cover__renditions').filter(pk=pk).first()
+    now = timezone.now()
+    if item is None or item.published_at is None or item.published_at > now:
+        timeout = cache_timeout()
+        if item is not None and item.published_at is not None:
+            # Scheduled: must show up as soon as it is published
+            timeout = min(timeout, (item.published_at - now).total_seconds())
+        cache.set(key, MISSING, timeout=max(1, int(timeout)))
+        return None
+    with translation.override(language):
+        data = serialize_item(item)
+    cache.set(key, data, timeout=cache_timeout())
+    return data
+
+
+def generation() -> int:
+    """Returns the current generation of the listings."""
+    return get_cache().get(GENERATION_KEY, 0)
+
+
+def expire_listings() -> None:
+    """Marks every cached listing as stale, in every process sharing the
+    cache. They are still served until recomputed. Records the time of
+    the change for Last-Modified headers (see photoblog.pagecache)."""
+    cache = get_cache()
+    cache.set(CHANGED_AT_KEY, timezone.now(), timeout=None)
+    cache.add(GENERATION_KEY, 0, timeout=None)
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, timeout=None)
+
+
+def get_or_compute(key: str, compute, timeout: int = None):
+    """Returns the value cached under 'key', calling 'compute' to
+    refresh it when it is missing, stale or about to expire. Only the
+    process holding the lock of 'key' calls 'compute'; the others serve
+    the stale value, or wait for the fresh one if there is none. The
+    lock and the generation are kept in the cache, so this holds across
+    processes only if the cache is shared (see check_shared_cache()).
+
+    Keyword arguments:
+    key -- cache key
+    compute -- callable without arguments returning a picklable value
+    timeout -- seconds the value is fresh (default listing_timeout())
+    """
+    cache = get_cache()
+    timeout = listing_timeout() if timeout is None else timeout
+    lock_key = f'{key}:lock'
+    deadline = time.time() + lock_timeout()
+    while True:
+        entry = cache.get(key)
+        if entry is not None and is_fresh(entry):
+            count('hits')
+            return entry['value']
+        if cache.add(lock_key, 1, timeout=lock_timeout()):
+            break
+        if entry is not None:
+            # Someone is refreshing it
+            count('hits')
+            _local.stale = True
+            return entry['value']
+        if time.time() >= deadline:
+            # The lock holder is stuck or gone: don't wait any longer
+            break
+        time.sleep(LOCK_POLL_INTERVAL)
+    count('misses')
+    outer_stale = getattr(_local, 'stale', False)
+    _local.stale = False
+    try:
+        current = generation()
+        start = time.time()
+        value = compute()
+        now = time.time()
+        if _local.stale:
+            # Built from stale values: stale itself
+            current = None
+        # Stale values outlive their expiry, to be served while refreshed
+        cache.set(key, {
+            'value': value,
+            'generation': current,
+            'delta': now - start,
+            'expires': now + timeout,
+        }, timeout=timeout + cache_timeout())
+    finally:
+        cache.delete(lock_key)
+        _local.stale = outer_stale or _local.stale
+    return value
+
+
+def is_fresh(entry: dict) -> bool:
+    """Whether cached 'entry' of get_or_compute can be served as is.
+    Entries close to expiry are randomly reported stale, the more likely
+    the longer they took to compute."""
+    if entry['generation'] != generation():
+        return False
+    beta = getattr(settings, 'PHOTOBLOG_CACHE_BETA', 1.0)
+    early = -entry['delta'] * beta * math.log(1.0 - random.random())
+    return time.time() + early < entry['expires']
+
+
+def invalidate(model, pks) -> None:
+    """Deletes the cached 'model' items with primary keys 'pks', in
+    every language, and marks the listings stale."""
+    keys = [item_key(model, pk, language)
+            for pk in pks for language in languages()]
+    if keys:
+        get_cache().delete_many(keys)
+        expire_listings()
+
+
+def invalidate_image(image_id: int) -> None:
+    """Deletes the cached items using Image 'image_id' as their cover."""
+    from photoblog.models import Collection, Entry, Story
+
+    for model in (Entry, Story, Collection):
+        invalidate(model, model.objects.filter(cover_id=image_id)
+                   .values_list('pk', flat=True))
+
+
+def invalidate_category(category_id: int) -> None:
+    """Deletes the cached items of Category 'category_id'."""
+    from photoblog.models import Collection, Entry, Story
+
+    for model in (Entry, Story, Collection):
+        invalidate(model, model.objects.filter(category_id=category_id)
+                   .values_list('pk', flat=True))
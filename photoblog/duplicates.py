@@ -0,0 +1,207 @@
+"""Near-duplicate images, found by their perceptual hash.
+
+The 64 bit pHash of every Image (see photoblog.similarity) is stored in
+ImageHash, split in CHUNKS chunks of 16 bits, each in an indexed column.
+This is multi-index hashing: two hashes at most 'distance' bits apart
+have at least one chunk at most distance // CHUNKS bits apart, so the
+images within 'distance' are among those having, in some column, one of
+the few values close to the chunk of the hash. Those candidates are read
+through the indexes and checked exactly, without scanning the library.
+
+Every Image is checked once its hash is known at ingest, and the closest
+other image within PHOTOBLOG_DUPLICATE_DISTANCE bits, if any, recorded
+as its duplicate_of. The find_duplicates command scans the whole
+library on the worker pool and reports clusters of near-duplicates.
+
+Settings:
+
+    PHOTOBLOG_DUPLICATE_DISTANCE -- largest number of differing pHash
+                                    bits of near-duplicates (default 6)
+"""
+import itertools
+import logging
+
+from django.conf import settings
+from django.db.models import Q
+
+from photoblog.workers import get_pool
+
+logger = logging.getLogger(__name__)
+
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def max_distance() -> int:
+    return getattr(settings, 'PHOTOBLOG_DUPLICATE_DISTANCE', 6)
+
+
+def to_signed(value: int) -> int:
+    """Returns unsigned 64 bit 'value' as stored in a BigIntegerField."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def chunks(value: int) -> list:
+    """Returns the CHUNKS chunks of 64 bit 'value', highest first."""
+    return [(value >> (CHUNK_BITS * (CHUNKS - 1 - i))) & CHUNK_MASK
+            for i in range(CHUNKS)]
+
+
+def neighbors(chunk: int, radius: int) -> list:
+    """Returns the chunks at most 'radius' bits away from 'chunk'."""
+    found = [chunk]
+    for flipped in range(1, radius + 1):
+        for bits in itertools.combinations(range(CHUNK_BITS), flipped):
+            value = chunk
+            for bit in bits:
+                value ^= 1 << bit
+            found.append(value)
+    return found
+
+
+def hamming(first: int, second: int) -> int:
+    return bin(first ^ second).count('1')
+
+
+def near(phash: int, distance: int = None, exclude: int = None) -> list:
+    """Returns the (bits, image_id) of the Images whose pHash is at most
+    'distance' bits from 'phash', closest first.
+
+    Keyword arguments:
+    phash -- unsigned 64 bit perceptual hash
+    distance -- largest number of differing bits (default
+                PHOTOBLOG_DUPLICATE_DISTANCE)
+    exclude -- primary key of an image to leave out (default None)
+    """
+    from photoblog.models import ImageHash
+
+    distance = max_distance() if distance is None else distance
+    radius = distance // CHUNKS
+    query = Q()
+    for index, chunk in enumerate(chunks(phash)):
+        query |= Q(**{f'chunk_{index}__in': neighbors(chunk, radius)})
+    candidates = ImageHash.objects.filter(query)
+    if exclude is not None:
+        candidates = candidates.exclude(image_id=exclude)
+    found = []
+    for image_id, other in candidates.values_list('image_id', 'phash'):
+        bits = hamming(phash, to_unsigned(other))
+        if bits <= distance:
+            found.append((bits, image_id))
+    return sorted(found)
+
+
+def record(image, phash: int) -> None:
+    """Stores the pHash of 'image' and flags it as a near-duplicate of
+    the closest other image, if any."""
+    from photoblog.models import ImageHash
+
+    found = near(phash, exclude=image.pk)
+    duplicate_of = found[0][1] if found else None
+    ImageHash.objects.update_or_create(image_id=image.pk, defaults=dict(
+        phash=to_signed(phash), duplicate_of_id=duplicate_of,
+        **{f'chunk_{index}': chunk
+           for index, chunk in enumerate(chunks(phash))}))
+    if duplicate_of is not None:
+        logger.info('Image %s looks like image %s (%d bits apart)',
+                    image.pk, duplicate_of, found[0][0])
+
+
+def index_missing(batch_size: int = 500) -> int:
+    """Stores the pHash of the Images having features but no ImageHash,
+    e.g. ingested before near-duplicates were tracked. Returns their
+    number."""
+    from photoblog import similarity
+    from photoblog.models import Image, ImageHash
+
+    missing = Image.objects.exclude(features=None)\
+        .filter(perceptual_hash=None).values_list('pk', 'features')
+    rows = []
+    count = 0
+    for pk, features in missing.iterator():
+        phash = similarity.hashes(bytes(features))[0]
+        rows.append(ImageHash(
+            image_id=pk, phash=to_signed(phash),
+            **{f'chunk_{index}': chunk
+               for index, chunk in enumerate(chunks(phash))}))
+        if len(rows) == batch_size:
+            ImageHash.objects.bulk_create(rows)
+            count += len(rows)
+            rows = []
+    ImageHash.objects.bulk_create(rows)
+    return count + len(rows)
+
+
+def pairs(hashes: list, start: int, stop: int, distance: int) -> list:
+    """Returns the (i, j, bits) of the 'hashes' at most 'distance' bits
+    apart, for i from 'start' to 'stop' and j > i. Runs in a worker
+    process, with in-memory multi-index tables."""
+    radius = distance // CHUNKS
+    tables = [{} for _ in range(CHUNKS)]
+    for position, value in enumerate(hashes):
+        for index, chunk in enumerate(chunks(value)):
+            tables[index].setdefault(chunk, []).append(position)
+    found = []
+    for i in range(start, stop):
+        seen = set()
+        for index, chunk in enumerate(chunks(hashes[i])):
+            for other in neighbors(chunk, radius):
+                for j in tables[index].get(other, ()):
+                    if j > i and j not in seen:
+                        seen.add(j)
+                        bits = hamming(hashes[i], hashes[j])
+                        if bits <= distance:
+                            found.append((i, j, bits))
+    return found
+
+
+def clusters(distance: int = None, jobs: int = None) -> list:
+    """Returns the groups of near-duplicate Images of the library, as
+    sorted lists of primary keys, largest groups first. Images are
+    grouped when linked by a chain of pairs at most 'distance' bits
+    apart. The pairs are searched on the worker pool.
+
+    Keyword arguments:
+    distance -- largest number of differing bits (default
+                PHOTOBLOG_DUPLICATE_DISTANCE)
+    jobs -- number of slices of the library searched in parallel
+            (default four per worker)
+    """
+    from photoblog.models import ImageHash
+
+    distance = max_distance() if distance is None else distance
+    rows = list(ImageHash.objects.order_by('image_id')
+                .values_list('image_id', 'phash'))
+    pks = [pk for pk, _ in rows]
+    hashes = [to_unsigned(phash) for _, phash in rows]
+    pool = get_pool()
+    jobs = jobs or max(1, pool.workers * 4)
+    size = max(1, -(-len(hashes) // jobs))
+    ids = [pool.submit(pairs, hashes, start, min(start + size, len(hashes)),
+                       distance, name=f'duplicates {start}')
+           for start in range(0, len(hashes), size)]
+    parents = list(range(len(hashes)))
+
+    def root(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for job_id in ids:
+        result = pool.result(job_id)
+        if result is None or not result.ok:
+            raise RuntimeError(f'Duplicate search failed: '
+                               f'{result.error if result else job_id}')
+        for i, j, _bits in result.value:
+            parents[root(j)] = root(i)
+    groups = {}
+    for i, pk in enumerate(pks):
+        groups.setdefault(root(i), []).append(pk)
+    return sorted((group for group in groups.values() if len(group) > 1),
+                  key=lambda group: (-len(group), group))
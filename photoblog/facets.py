@@ -0,0 +1,304 @@
+"""Faceted browsing of the published entries.
+
+Entries can be narrowed by category, price range, size and collection.
+Rather than counting entries per option on every request, the facet
+values of every published entry are kept in EntryFacet, and the number
+of entries per value in FacetCount. Both are updated incrementally by
+refresh(), called by the signal handlers in photoblog.signals, by bulk
+publishing and by the publish_scheduled command.
+
+Options are ORed within a facet and ANDed across facets. The counts
+shown are those of the entries currently listed: with no filter they are
+read from FacetCount, otherwise aggregated from EntryFacet alone, so a
+page of facets always takes the same few queries however many options
+there are.
+
+Settings:
+
+    PHOTOBLOG_PRICE_RANGES -- upper bounds of the price ranges
+                              (default [100, 500, 1000, 5000])
+    PHOTOBLOG_SIZE_BUCKETS -- (name, longest side in cm) of the sizes,
+                              the last one unbounded
+                              (default small: 30, medium: 100, large)
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils.translation import gettext, gettext_lazy as _
+
+FACETS = ('category', 'price', 'size', 'collection')
+LABELS = {
+    'category': _('Category'),
+    'price': _('Price'),
+    'size': _('Size'),
+    'collection': _('Collection'),
+}
+
+
+def price_ranges() -> list:
+    return getattr(settings, 'PHOTOBLOG_PRICE_RANGES', [100, 500, 1000, 5000])
+
+
+def size_buckets() -> list:
+    return getattr(settings, 'PHOTOBLOG_SIZE_BUCKETS',
+                   [('small', 30), ('medium', 100), ('large', None)])
+
+
+def price_values() -> list:
+    """Returns the values of the price facet, e.g. '100-500', cheapest
+    first. The last range, e.g. '5000-', is unbounded."""
+    bounds = [0] + list(price_ranges())
+    return [f'{low:g}-{high:g}' for low, high in zip(bounds, bounds[1:])] \
+        + [f'{bounds[-1]:g}-']
+
+
+def price_value(price) -> str:
+    """Returns the price range 'price' falls into, or None."""
+    if price is None:
+        return None
+    for value, high in zip(price_values(), price_ranges()):
+        if price < high:
+            return value
+    return price_values()[-1]
+
+
+def price_label(value: str) -> str:
+    """Returns price range 'value' for display, e.g. '100 - 500'."""
+    low, high = value.split('-')
+    return f'{low} - {high}' if high else f'{low}+'
+
+
+def size_value(dimension) -> str:
+    """Returns the size bucket of Dimension 'dimension' by its longest
+    side, or None."""
+    if dimension is None:
+        return None
+    sides = [side for side in (dimension.height_mm, dimension.length_mm,
+                               dimension.width_mm) if side is not None]
+    if not sides:
+        return None
+    for name, longest in size_buckets():
+        if longest is None or max(sides) <= longest * 10:
+            return name
+    return None
+
+
+def values_of(entry, collection_ids) -> set:
+    """Returns the (facet, value) pairs of 'entry'.
+
+    Keyword arguments:
+    entry -- photoblog.models.Entry, with its size loaded
+    collection_ids -- primary keys of the collections of 'entry'
+    """
+    values = {('collection', str(pk)) for pk in collection_ids}
+    if entry.category_id is not None:
+        values.add(('category', str(entry.category_id)))
+    for facet, value in (('price', price_value(entry.price)),
+                         ('size', size_value(entry.size))):
+        if value is not None:
+            values.add((facet, value))
+    return values
+
+
+def refresh(pks) -> None:
+    """Brings the facet values and counts of Entries 'pks' up to date,
+    dropping them for entries that are no longer published or exist."""
+    from photoblog.models import Entry
+
+    pks = list(pks)
+    if not pks:
+        return
+    with transaction.atomic():
+        # Locked, so concurrent refreshes don't count an entry twice
+        entries = Entry.objects.published().select_for_update(of=('self',))\
+            .select_related('size').filter(pk__in=pks)
+        memberships = {}
+        for entry_id, collection_id in Entry.collections.through.objects\
+                .filter(entry_id__in=pks)\
+                .values_list('entry_id', 'collection_id'):
+            memberships.setdefault(entry_id, []).append(collection_id)
+        _replace(pks, {(entry.pk, facet, value) for entry in entries
+                       for facet, value in values_of(
+                           entry, memberships.get(entry.pk, []))})
+
+
+def forget(pks) -> None:
+    """Drops the facet values and counts of Entries 'pks', e.g. before
+    they are deleted."""
+    with transaction.atomic():
+        _replace(list(pks), set())
+
+
+def _replace(pks: list, new: set) -> None:
+    """Replaces the facet values of Entries 'pks' with 'new', a set of
+    (entry_id, facet, value), adjusting the counts by the difference."""
+    from photoblog.models import EntryFacet
+
+    old = {(entry_id, facet, value): pk
+           for pk, entry_id, facet, value in EntryFacet.objects
+           .filter(entry_id__in=pks)
+           .values_list('pk', 'entry_id', 'facet', 'value')}
+    removed = [key for key in old if key not in new]
+    added = [key for key in new if key not in old]
+    if removed:
+        EntryFacet.objects.filter(
+            pk__in=[old[key] for key in removed]).delete()
+    if added:
+        EntryFacet.objects.bulk_create(
+            [EntryFacet(entry_id=entry_id, facet=facet, value=value)
+             for entry_id, facet, value in added])
+    deltas = Counter((facet, value) for _entry, facet, value in added)
+    deltas.subtract((facet, value) for _entry, facet, value in removed)
+    _add_counts(deltas)
+
+
+def _add_counts(deltas: Counter) -> None:
+    from photoblog.models import FacetCount
+
+    for (facet, value), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        updated = FacetCount.objects.filter(facet=facet, value=value)\
+            .update(count=F('count') + delta)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    FacetCount.objects.create(facet=facet, value=value,
+                                              count=delta)
+            except IntegrityError:
+                # Created by a concurrent transaction since the update
+                FacetCount.objects.filter(facet=facet, value=value)\
+                    .update(count=F('count') + delta)
+
+
+def drop(facet: str, value) -> None:
+    """Removes facet value 'value' from every entry, e.g. a deleted
+    category or collection."""
+    from photoblog.models import EntryFacet, FacetCount
+
+    EntryFacet.objects.filter(facet=facet, value=str(value)).delete()
+    FacetCount.objects.filter(facet=facet, value=str(value)).delete()
+
+
+def rebuild(batch_size: int = 500) -> int:
+    """Recomputes every facet value and count from scratch, 'batch_size'
+    entries at a time. Returns the number of published entries."""
+    from photoblog.models import Entry, EntryFacet, FacetCount
+
+    with transaction.atomic():
+        EntryFacet.objects.all().delete()
+        FacetCount.objects.all().delete()
+        pks = list(Entry.objects.published().order_by('pk')
+                   .values_list('pk', flat=True))
+        for start in range(0, len(pks), batch_size):
+            refresh(pks[start:start + batch_size])
+    return len(pks)
+
+
+def selection(params) -> dict:
+    """Returns the valid facet options selected in QueryDict 'params',
+    as {facet: sorted values}, leaving out unknown facets and values."""
+    known = {
+        'price': set(price_values()),
+        'size': {name for name, _longest in size_buckets()},
+    }
+    selected = {}
+    for facet in FACETS:
+        values = set(params.getlist(facet))
+        if facet in known:
+            values &= known[facet]
+        else:
+            values = {value for value in values if value.isdigit()}
+        if values:
+            selected[facet] = sorted(values)
+    return selected
+
+
+def filter_entries(queryset, selected: dict):
+    """Narrows Entry 'queryset' down to the options of 'selected', as
+    returned by selection()."""
+    from photoblog.models import EntryFacet
+
+    for facet, values in selected.items():
+        queryset = queryset.filter(pk__in=EntryFacet.objects.filter(
+            facet=facet, value__in=values).values('entry_id'))
+    return queryset
+
+
+def counts(selected: dict = None) -> dict:
+    """Returns the number of listed entries per facet value, as
+    {facet: {value: count}}, in a single query.
+
+    Keyword arguments:
+    selected -- options selected, as returned by selection() (default
+                None, all entries)
+    """
+    from photoblog.models import EntryFacet, FacetCount
+
+    if not selected:
+        rows = FacetCount.objects.filter(count__gt=0)\
+            .values_list('facet', 'value', 'count')
+    else:
+        rows = EntryFacet.objects.all()
+        for facet, values in selected.items():
+            rows = rows.filter(entry_id__in=EntryFacet.objects.filter(
+                facet=facet, value__in=values).values('entry_id'))
+        rows = rows.values('facet', 'value').order_by()\
+            .annotate(count=Count('entry_id'))\
+            .values_list('facet', 'value', 'count')
+    result = {facet: {} for facet in FACETS}
+    for facet, value, count in rows:
+        if facet in result:
+            result[facet][value] = count
+    return result
+
+
+def facets(selected: dict = None) -> list:
+    """Returns the facets to show next to the entries matching
+    'selected', in the active language, as a list of
+    {'name', 'label', 'options'}, each option being a dict with its
+    'value', 'label', 'count' and whether it is 'selected'. Takes at most
+    three queries: the counts, and the names of categories and
+    collections.
+
+    Keyword arguments:
+    selected -- options selected, as returned by selection() (default
+                None, all entries)
+    """
+    from photoblog.models import Category, Collection
+
+    selected = selected or {}
+    found = counts(selected)
+    labels = {
+        'price': {value: price_label(value) for value in price_values()},
+        'size': {name: gettext(name.capitalize())
+                 for name, _longest in size_buckets()},
+    }
+    names = (('category', Category.objects, 'name'),
+             ('collection', Collection.objects.published(), 'title'))
+    for facet, queryset, field in names:
+        pks = set(found[facet]) | set(selected.get(facet, ()))
+        labels[facet] = dict(
+            queryset.filter(pk__in=[int(pk) for pk in pks])
+            .values_list('pk', field)) if pks else {}
+        labels[facet] = {str(pk): name for pk, name in labels[facet].items()}
+    result = []
+    for facet in FACETS:
+        chosen = selected.get(facet, ())
+        values = [value for value in labels[facet]
+                  if found[facet].get(value) or value in chosen]
+        if facet in ('category', 'collection'):
+            values.sort(key=lambda value, facet=facet: (
+                -found[facet].get(value, 0), labels[facet][value]))
+        options = [{
+            'value': value,
+            'label': labels[facet][value],
+            'count': found[facet].get(value, 0),
+            'selected': value in chosen,
+        } for value in values]
+        if options:
+            result.append({'name': facet, 'label': str(LABELS[facet]),
+                           'options': options})
+    return result
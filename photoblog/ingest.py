@@ -0,0 +1,108 @@
+"""Work done once on every upload, in the image worker pool.
+
+Each step says what it still has to do for an Image (pending), does it
+from the uploaded file in a worker process (run), and records the result
+from the parent process (store). All the pending steps of an Image run
+in a single job, so the file is handed to the pool once.
+"""
+from typing import Callable, NamedTuple
+
+from django.db import transaction
+
+from photoblog import (metadata, palettes, placeholders, renditions,
+                       similarity, tiles)
+from photoblog.workers import get_pool
+
+
+class Step(NamedTuple):
+    """An ingest step.
+
+    name -- identifies the step in job results
+    pending -- pending(image, force) returns the keyword arguments of
+               run, or None when the step is up to date
+    run -- run(source, **kwargs) runs in a worker process, 'source' is a
+           path or the file contents as bytes
+    store -- store(image, source_name, value) records the value returned
+             by run, unless the upload changed in the meantime
+    """
+    name: str
+    pending: Callable
+    run: Callable
+    store: Callable
+
+
+STEPS = (
+    Step('renditions', renditions.pending_step, renditions.render_all,
+         renditions.save_renditions),
+    Step('placeholder', placeholders.pending_step, placeholders.describe,
+         placeholders.save_description),
+    Step('tiles', tiles.pending_step, tiles.build_pyramid,
+         tiles.pyramid_built),
+    Step('features', similarity.pending_step, similarity.compute,
+         similarity.save_features),
+    Step('palette', palettes.pending_step, palettes.extract,
+         palettes.save_palette),
+    Step('metadata', metadata.pending_step, metadata.extract,
+         metadata.save_metadata),
+)
+
+
+def run_steps(source, jobs: list) -> dict:
+    """Runs every (name, run, kwargs) job on 'source'. A failing step
+    doesn't prevent the others from running.
+
+    Returns a dict of step name to (ok, value or error message).
+    """
+    results = {}
+    for name, func, kwargs in jobs:
+        try:
+            results[name] = (True, func(source, **kwargs))
+        except Exception as exc:  # pylint: disable=broad-except
+            results[name] = (False, repr(exc))
+    return results
+
+
+def submit(image, force: bool = False) -> bool:
+    """Queues the pending ingest steps of 'image' on the worker pool,
+    once the current transaction commits. Returns False when there is
+    nothing to do.
+
+    Keyword arguments:
+    image -- photoblog.models.Image instance
+    force -- run up to date steps as well (default False)
+    """
+    if not image.image:
+        return False
+    jobs, steps = [], {}
+    for step in STEPS:
+        kwargs = step.pending(image, force)
+        if kwargs is not None:
+            jobs.append((step.name, step.run, kwargs))
+            steps[step.name] = step
+    if not jobs:
+        return False
+    source_name = image.image.name
+    source = renditions.read_source(image)
+
+    def store(result):
+        if not result.ok:
+            return
+        failed = []
+        for name, (ok, value) in result.value.items():
+            if ok:
+                steps[name].store(image, source_name, value)
+            else:
+                failed.append(f'{name}: {value}')
+        if failed:
+            raise RuntimeError(', '.join(failed))
+
+    def queue():
+        get_pool().submit(run_steps, source, jobs, callback=store,
+                          name=f'ingest of image {image.pk}')
+
+    if get_pool().workers:
+        # Workers must not race the transaction that created the image.
+        transaction.on_commit(queue)
+    else:
+        queue()
+    return True
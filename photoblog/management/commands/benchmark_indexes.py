@@ -0,0 +1,125 @@
+# Shows the query plans of the public listings with and without the
+# published content indexes (migration 0004), against a seeded dataset.
+# Nothing is kept: the data and the dropped indexes are rolled back.
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import User
+from photoblog.models import Category, Collection, Entry, Story
+
+INDEX_SUFFIXES = ('pub_idx', 'pub_cat_idx', 'pub_author_idx')
+
+
+class Command(BaseCommand):
+    help = 'Compares query plans of public listings before and after the '\
+           'published content indexes, on a seeded dataset.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=20000,
+                            help='Entries to seed, stories and collections '
+                                 'get a tenth of it each.')
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--authors', type=int, default=50)
+        parser.add_argument('--drafts', type=float, default=0.2,
+                            help='Fraction of seeded items left unpublished.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options)
+            self.analyze()
+            after = self.run_plans()
+            for model in (Entry, Story, Collection):
+                for suffix in INDEX_SUFFIXES:
+                    self.run_sql(
+                        f'DROP INDEX {model._meta.db_table}_{suffix}')
+            self.analyze()
+            before = self.run_plans()
+            transaction.set_rollback(True)
+        for label, (plan, elapsed) in before.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(f'-- before ({elapsed:.2f} ms)')
+            self.stdout.write(plan)
+            plan, elapsed = after[label]
+            self.stdout.write(f'-- after ({elapsed:.2f} ms)')
+            self.stdout.write(plan)
+            self.stdout.write('')
+
+    def seed(self, options):
+        now = timezone.now()
+        authors = [
+            User.objects.create_user(email=f'bench{i}@example.com',
+                                     username=f'bench_user_{i}',
+                                     password=None)
+            for i in range(options['authors'])
+        ]
+        categories = Category.objects.bulk_create(
+            Category(name=f'Bench category {i}',
+                     name_en=f'Bench category {i}',
+                     slug=f'bench-category-{i}', created_by=authors[0])
+            for i in range(options['categories'])
+        )
+        if not categories[0].pk:
+            # Only PostgreSQL returns ids from bulk_create
+            categories = list(Category.objects.filter(
+                name_en__startswith='Bench category'))
+
+        def items(model, count, **extra):
+            for i in range(count):
+                published = random.random() >= options['drafts']
+                yield model(
+                    title=f'Bench {i}', title_en=f'Bench {i}',
+                    slug=f'bench-{i}', slug_en=f'bench-{i}',
+                    created_by=authors[i % len(authors)],
+                    category=random.choice(categories),
+                    published_at=now if published else None,
+                    **extra,
+                )
+
+        count = options['items']
+        Entry.objects.bulk_create(items(Entry, count))
+        Story.objects.bulk_create(items(Story, count // 10, text='Bench'))
+        Collection.objects.bulk_create(items(Collection, count // 10))
+        self.category = categories[0]
+        self.author = authors[0]
+
+    def run_plans(self) -> dict:
+        plans = {}
+        for model in (Entry, Story, Collection):
+            public = model.objects.published().order_by('-created_at', '-id')
+            name = model._meta.verbose_name_plural
+            for label, queryset in (
+                    (f'Public {name}', public),
+                    (f'Public {name} of a category',
+                     public.filter(category=self.category)),
+                    (f'Public {name} of an author',
+                     public.filter(created_by=self.author)),
+            ):
+                plans[label] = self.explain(queryset[:24])
+        return plans
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        if connection.vendor == 'postgresql':
+            prefix = 'EXPLAIN ANALYZE '
+        else:
+            prefix = 'EXPLAIN QUERY PLAN '
+        with connection.cursor() as cursor:
+            start = time.perf_counter()
+            cursor.execute(sql, params)
+            cursor.fetchall()
+            elapsed = (time.perf_counter() - start) * 1000
+            cursor.execute(prefix + sql, params)
+            plan = '\n'.join(' '.join(str(col) for col in row)
+                             for row in cursor.fetchall())
+        return plan, elapsed
+
+    def analyze(self):
+        self.run_sql('ANALYZE')
+
+    def run_sql(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
@@ -0,0 +1,24 @@
+# Writes the visual features of every image to the memory-mapped index
+# scanned by "more like this", see photoblog/similarity.py. Run it
+# periodically: images whose features changed since the last run are
+# scanned from the database, more slowly.
+from django.core.management.base import BaseCommand, CommandError
+
+from photoblog import similarity
+
+
+class Command(BaseCommand):
+    help = 'Builds the index of the visual features of the images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Images read from the database at a time.')
+
+    def handle(self, *args, **options):
+        try:
+            total = similarity.build_index(batch_size=options['batch_size'])
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+        if options['verbosity'] > 0:
+            self.stdout.write(
+                f'{total} images indexed in {similarity.index_path()}')
@@ -0,0 +1,21 @@
+# Discards the chunked uploads left unfinished, with their partial files,
+# once they received no chunk for PHOTOBLOG_UPLOAD_MAX_AGE. Meant to run
+# daily or so, e.g. from cron. See photoblog/uploads.py.
+from django.core.management.base import BaseCommand
+
+from photoblog import uploads
+
+
+class Command(BaseCommand):
+    help = 'Discards the chunked uploads abandoned before completion.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--age', type=int, default=None,
+                            help='Seconds without a chunk after which an '
+                                 'upload is abandoned (default '
+                                 'PHOTOBLOG_UPLOAD_MAX_AGE).')
+
+    def handle(self, *args, **options):
+        total = uploads.expire(options['age'])
+        if options['verbosity'] > 0:
+            self.stdout.write(f'{total} abandoned uploads discarded')
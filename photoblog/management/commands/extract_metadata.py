@@ -0,0 +1,43 @@
+# Reads the EXIF, XMP and IPTC metadata of existing uploads on the image
+# worker pool, streaming over the library: only the headers of each file
+# are read, and images are handed over as fast as the workers take them.
+# See photoblog/metadata.py.
+import time
+
+from django.core.management.base import BaseCommand
+
+from photoblog import metadata
+from photoblog.models import Image
+from photoblog.workers import get_pool
+
+
+class Command(BaseCommand):
+    help = 'Extracts the metadata of the images that have none.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Extract the metadata of every image.')
+
+    def handle(self, *args, **options):
+        pool = get_pool()
+        done = []
+        images = Image.objects.exclude(image='').exclude(image=None)\
+            .only('pk', 'image').order_by('pk')
+        if not options['force']:
+            images = images.filter(metadata=None)
+        for image in images.iterator():
+            source_name = image.image.name
+
+            def store(result, image=image, source_name=source_name):
+                if result.ok:
+                    metadata.save_metadata(image, source_name, result.value)
+                done.append(result.ok)
+
+            # Blocks while the queue of the pool is full
+            pool.submit(metadata.extract, metadata.read_header(image),
+                        callback=store, name=f'metadata of image {image.pk}')
+        while pool.pending:
+            time.sleep(0.1)
+        if options['verbosity'] > 0:
+            self.stdout.write(f'{done.count(True)} images read, '
+                              f'{done.count(False)} failed')
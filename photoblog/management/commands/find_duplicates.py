@@ -0,0 +1,38 @@
+# Reports the clusters of near-duplicate images of the whole library,
+# searched on the image worker pool. See photoblog/duplicates.py.
+from django.core.management.base import BaseCommand, CommandError
+
+from photoblog import duplicates
+from photoblog.models import Image
+
+
+class Command(BaseCommand):
+    help = 'Reports the groups of near-duplicate images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--distance', type=int, default=None,
+                            help='Largest number of differing hash bits '
+                                 '(default PHOTOBLOG_DUPLICATE_DISTANCE).')
+        parser.add_argument('--jobs', type=int, default=None,
+                            help='Slices of the library searched in '
+                                 'parallel.')
+
+    def handle(self, *args, **options):
+        indexed = duplicates.index_missing()
+        try:
+            found = duplicates.clusters(options['distance'], options['jobs'])
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+        titles = dict(Image.objects.filter(
+            pk__in=[pk for group in found for pk in group])
+            .values_list('pk', 'title'))
+        for group in found:
+            self.stdout.write(f'{len(group)} images:')
+            for pk in group:
+                self.stdout.write(f'  {pk} {titles.get(pk, "")}')
+        if options['verbosity'] > 0:
+            pending = Image.objects.filter(features=None)\
+                .exclude(image='').count()
+            self.stdout.write(
+                f'{len(found)} clusters, {indexed} hashes indexed, '
+                f'{pending} images not ingested yet')
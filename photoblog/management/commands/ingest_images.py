@@ -0,0 +1,32 @@
+# Runs the ingest steps images are missing, e.g. the palettes of images
+# uploaded before photoblog/palettes.py existed, on the image worker
+# pool. See photoblog/ingest.py.
+import time
+
+from django.core.management.base import BaseCommand
+
+from photoblog import ingest
+from photoblog.models import Image
+from photoblog.workers import get_pool
+
+
+class Command(BaseCommand):
+    help = 'Runs the pending ingest steps of every image.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Run the steps that are up to date too.')
+
+    def handle(self, *args, **options):
+        pool = get_pool()
+        submitted = 0
+        for image in Image.objects.exclude(image='').exclude(image=None)\
+                .order_by('pk').iterator():
+            # Blocks while the queue of the pool is full
+            if ingest.submit(image, force=options['force']):
+                submitted += 1
+        while pool.pending:
+            time.sleep(0.1)
+        if options['verbosity'] > 0:
+            # Failures are logged by photoblog.workers
+            self.stdout.write(f'{submitted} images ingested')
@@ -0,0 +1,40 @@
+# Makes items scheduled with a future published_at show up once their
+# time has come, by dropping the cached pages and items they affect. Meant
+# to run every minute or so, e.g. from cron. The time of the last run is
+# kept in the database, and the cache must be the one shared with the web
+# processes (see photoblog/cache.py).
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from photoblog import cache, facets
+from photoblog.models import Collection, Entry, SchedulerRun, Story
+
+
+class Command(BaseCommand):
+    help = 'Flushes the caches of items whose scheduled publication time '\
+           'has passed since the last run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=3600,
+                            help='Seconds to look back when there is no '
+                                 'record of the last run.')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        since = SchedulerRun.objects.filter(pk=1)\
+            .values_list('ran_at', flat=True).first() or \
+            now - datetime.timedelta(seconds=options['window'])
+        total = 0
+        for model in (Entry, Story, Collection):
+            pks = list(model.objects.scheduled(since, now)
+                       .values_list('pk', flat=True))
+            # Also marks the listings and pages stale
+            cache.invalidate(model, pks)
+            if model is Entry:
+                facets.refresh(pks)
+            total += len(pks)
+        SchedulerRun.objects.update_or_create(pk=1, defaults={'ran_at': now})
+        if options['verbosity'] > 0:
+            self.stdout.write(f'{total} scheduled items published')
@@ -0,0 +1,20 @@
+# Recomputes the facet values and counts of the entry list from scratch,
+# e.g. after loading fixtures or changing PHOTOBLOG_PRICE_RANGES or
+# PHOTOBLOG_SIZE_BUCKETS. See photoblog/facets.py.
+from django.core.management.base import BaseCommand
+
+from photoblog import cache, facets
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the facet counts of the published entries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Entries refreshed at a time.')
+
+    def handle(self, *args, **options):
+        total = facets.rebuild(options['batch_size'])
+        cache.expire_listings()
+        if options['verbosity'] > 0:
+            self.stdout.write(f'{total} entries counted')
@@ -0,0 +1,20 @@
+# Rebuilds the full-text search index from scratch, e.g. after loading
+# fixtures or restoring a dump, which send no signals. See
+# photoblog/search.py.
+from django.core.management.base import BaseCommand
+
+from photoblog import search
+
+
+class Command(BaseCommand):
+    help = 'Reindexes every entry, story, collection, image and category '\
+           'for full-text search.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Objects loaded and indexed at a time.')
+
+    def handle(self, *args, **options):
+        total = search.rebuild(options['batch_size'])
+        if options['verbosity'] > 0:
+            self.stdout.write(f'{total} objects indexed')
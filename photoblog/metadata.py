@@ -0,0 +1,392 @@
+"""Capture metadata of uploads: EXIF, IPTC and XMP.
+
+The metadata of every Image is read once at ingest (see
+photoblog.ingest) from the headers of the upload, without decoding its
+pixels, and stored in ImageMetadata: the capture date, camera, lens,
+whether it was scanned from film, orientation, dimensions and color
+profile in indexed columns, everything read in a JSON 'data' column.
+The extract_metadata command does the same for existing uploads,
+reading only the first HEADER_BYTES of files on remote storages.
+
+Dates and names are looked for in EXIF first, then XMP, then IPTC.
+EXIF dates carry no time zone and are taken to be in the current one.
+
+The EXIF orientation is also applied by renditions, placeholders and
+visual features, see oriented().
+"""
+import io
+import json
+import xml.etree.ElementTree as ElementTree
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from PIL import Image as PILImage, IptcImagePlugin
+
+HEADER_BYTES = 256 * 1024
+# Raised by Pillow and the parsers below on malformed metadata
+MALFORMED = (SyntaxError, ValueError, IndexError, KeyError, TypeError,
+             AttributeError, ElementTree.ParseError)
+
+# EXIF tags
+ORIENTATION = 274
+TAGS = {
+    271: 'make',
+    272: 'model',
+    305: 'software',
+    306: 'modified_at',
+    315: 'artist',
+    33432: 'copyright',
+    33434: 'exposure_time',
+    33437: 'f_number',
+    34855: 'iso',
+    36867: 'taken_at',
+    36868: 'digitized_at',
+    37386: 'focal_length',
+    40961: 'color_space',
+    41728: 'file_source',
+    42036: 'lens',
+}
+FILE_SOURCES = {1: 'film', 2: 'print', 3: 'camera'}
+SOURCES = (
+    ('camera', 'Digital camera'),
+    ('film', 'Film scanner'),
+    ('print', 'Print scanner'),
+)
+# Transpositions undoing each EXIF orientation
+TRANSPOSITIONS = {
+    2: (PILImage.FLIP_LEFT_RIGHT,),
+    3: (PILImage.ROTATE_180,),
+    4: (PILImage.FLIP_TOP_BOTTOM,),
+    5: (PILImage.TRANSPOSE,),
+    6: (PILImage.ROTATE_270,),
+    7: (PILImage.TRANSVERSE,),
+    8: (PILImage.ROTATE_90,),
+}
+
+XMP_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+RDF = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+XMP_PREFIXES = {
+    'http://ns.adobe.com/xap/1.0/': 'xmp',
+    'http://purl.org/dc/elements/1.1/': 'dc',
+    'http://ns.adobe.com/photoshop/1.0/': 'photoshop',
+    'http://ns.adobe.com/exif/1.0/': 'exif',
+    'http://ns.adobe.com/tiff/1.0/': 'tiff',
+    'http://ns.adobe.com/exif/1.0/aux/': 'aux',
+}
+# IPTC datasets
+IPTC_TAGS = {
+    (2, 5): 'title',
+    (2, 25): 'keywords',
+    (2, 55): 'date_created',
+    (2, 80): 'by_line',
+    (2, 116): 'copyright',
+}
+
+
+def orientation_of(img) -> int:
+    """Returns the EXIF orientation of opened image 'img', 1 if it has
+    none."""
+    getexif = getattr(img, '_getexif', None)
+    try:
+        value = (getexif() or {}).get(ORIENTATION, 1) if getexif else 1
+    except MALFORMED:
+        return 1
+    return value if value in TRANSPOSITIONS else 1
+
+
+def swaps_sides(orientation: int) -> bool:
+    """Whether 'orientation' turns the image a quarter."""
+    return orientation in (5, 6, 7, 8)
+
+
+def oriented(img, orientation: int):
+    """Returns image 'img' turned upright according to EXIF
+    'orientation'."""
+    for method in TRANSPOSITIONS.get(orientation, ()):
+        img = img.transpose(method)
+    return img
+
+
+def oriented_size(size: tuple, orientation: int) -> tuple:
+    """Returns the (width, height) of an image of 'size' once turned
+    upright."""
+    return tuple(reversed(size)) if swaps_sides(orientation) else size
+
+
+def _text(value) -> str:
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    if isinstance(value, (list, tuple)):
+        value = ', '.join(_text(v) for v in value)
+    return str(value).strip('\x00 \t\r\n') if value is not None else ''
+
+
+def _number(value):
+    """Returns EXIF rational or integer 'value' as a float or int."""
+    if isinstance(value, tuple) and len(value) == 2:
+        numerator, denominator = value
+        return round(numerator / denominator, 6) if denominator else None
+    if isinstance(value, (int, float)):
+        return value
+    return None
+
+
+def _iso(value: str) -> str:
+    """Returns ISO 8601 date and time 'value' if it is valid, or None."""
+    try:
+        return value if parse_datetime(value) is not None else None
+    except ValueError:
+        return None
+
+
+def _exif_date(value: str) -> str:
+    """Returns EXIF date 'YYYY:MM:DD HH:MM:SS' in ISO 8601, or None."""
+    value = _text(value)
+    if len(value) < 19:
+        return None
+    return _iso(value[:10].replace(':', '-') + 'T' + value[11:19])
+
+
+def _xmp_date(value: str) -> str:
+    """Returns XMP date 'value', possibly just a year or a month, in
+    ISO 8601, or None."""
+    value = _text(value)
+    if len(value) in (4, 7):
+        value += '-01-01'[len(value) - 4:]
+    if len(value) == 10:
+        value += 'T00:00:00'
+    return _iso(value)
+
+
+def _iptc_date(value: str) -> str:
+    value = _text(value)
+    if len(value) != 8 or not value.isdigit():
+        return None
+    return _xmp_date(f'{value[:4]}-{value[4:6]}-{value[6:]}')
+
+
+def exif_values(img) -> dict:
+    """Returns the EXIF tags of TAGS found in 'img', by name."""
+    getexif = getattr(img, '_getexif', None)
+    try:
+        exif = (getexif() or {}) if getexif else {}
+    except MALFORMED:
+        return {}
+    values = {}
+    for tag, name in TAGS.items():
+        if tag not in exif:
+            continue
+        value = exif[tag]
+        if name in ('exposure_time', 'f_number', 'focal_length'):
+            value = _number(value)
+        elif name in ('iso', 'color_space'):
+            if isinstance(value, tuple):
+                value = value[0] if value else None
+            value = value if isinstance(value, int) else None
+        elif name == 'file_source':
+            if isinstance(value, bytes):
+                value = value[0] if value else None
+            value = FILE_SOURCES.get(value)
+        else:
+            value = _text(value)
+        if value not in (None, ''):
+            values[name] = value
+    return values
+
+
+def xmp_packet(img) -> bytes:
+    """Returns the XMP packet of 'img', or None."""
+    for marker, data in getattr(img, 'applist', ()):
+        if marker == 'APP1' and data.startswith(XMP_HEADER):
+            return data[len(XMP_HEADER):]
+    packet = img.info.get('XML:com.adobe.xmp')
+    if isinstance(packet, str):
+        return packet.encode('utf-8')
+    return packet
+
+
+def xmp_values(packet: bytes) -> dict:
+    """Returns the properties of XMP 'packet' in the namespaces of
+    XMP_PREFIXES, as {'prefix:name': text, or list for arrays}."""
+    if not packet or b'<!DOCTYPE' in packet or b'<!ENTITY' in packet:
+        # Entities could expand without bounds
+        return {}
+    root = ElementTree.fromstring(packet)
+    values = {}
+
+    def store(tag, value):
+        namespace, _, name = tag[1:].partition('}')
+        if namespace in XMP_PREFIXES and value:
+            values[f'{XMP_PREFIXES[namespace]}:{name}'] = value
+
+    for description in root.iter(f'{{{RDF}}}Description'):
+        for tag, value in description.attrib.items():
+            store(tag, value.strip())
+        for child in description:
+            items = [li.text.strip() for li in child.iter(f'{{{RDF}}}li')
+                     if li.text and li.text.strip()]
+            store(child.tag, items or (child.text or '').strip())
+    return values
+
+
+def iptc_values(img) -> dict:
+    """Returns the IPTC datasets of IPTC_TAGS found in 'img', by name."""
+    try:
+        info = IptcImagePlugin.getiptcinfo(img) or {}
+    except MALFORMED:
+        return {}
+    values = {}
+    for dataset, name in IPTC_TAGS.items():
+        if dataset in info:
+            value = info[dataset]
+            items = value if isinstance(value, list) else [value]
+            items = [_text(item) for item in items if _text(item)]
+            if items:
+                values[name] = items if name == 'keywords' else items[0]
+    return values
+
+
+def icc_description(profile: bytes) -> str:
+    """Returns the description of ICC 'profile', e.g. 'sRGB
+    IEC61966-2.1', or an empty string."""
+    if not profile or len(profile) < 132:
+        return ''
+    count = int.from_bytes(profile[128:132], 'big')
+    for entry in range(132, min(132 + 12 * count, len(profile) - 11), 12):
+        if profile[entry:entry + 4] != b'desc':
+            continue
+        offset = int.from_bytes(profile[entry + 4:entry + 8], 'big')
+        data = profile[offset:offset + int.from_bytes(
+            profile[entry + 8:entry + 12], 'big')]
+        if data[:4] == b'desc':
+            length = int.from_bytes(data[8:12], 'big')
+            return _text(data[12:12 + length].decode('latin-1'))
+        if data[:4] == b'mluc' and len(data) >= 28:
+            # First record of a multi-localized Unicode text
+            length = int.from_bytes(data[20:24], 'big')
+            start = int.from_bytes(data[24:28], 'big')
+            return _text(data[start:start + length].decode('utf-16-be',
+                                                            'replace'))
+    return ''
+
+
+def _first(*values):
+    for value in values:
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if value:
+            return value
+    return None
+
+
+def extract(source) -> dict:
+    """Returns the metadata of the image in 'source', read from its
+    headers, as a dict of JSON serializable values. Runs in a worker
+    process.
+
+    Keyword arguments:
+    source -- path to the image, or its contents as bytes, possibly only
+              the first bytes
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with PILImage.open(source) as img:
+        orientation = orientation_of(img)
+        width, height = oriented_size(img.size, orientation)
+        exif = exif_values(img)
+        try:
+            xmp = xmp_values(xmp_packet(img))
+        except MALFORMED:
+            xmp = {}
+        iptc = iptc_values(img)
+        profile = icc_description(img.info.get('icc_profile'))
+        if not profile and exif.get('color_space') == 1:
+            profile = 'sRGB'
+        keywords = xmp.get('dc:subject') or iptc.get('keywords') or []
+        return {
+            'format': img.format,
+            'mode': img.mode,
+            'width': width,
+            'height': height,
+            'orientation': orientation,
+            'taken_at': _first(
+                _exif_date(exif.get('taken_at')),
+                _xmp_date(xmp.get('exif:DateTimeOriginal')),
+                _xmp_date(xmp.get('photoshop:DateCreated')),
+                _xmp_date(xmp.get('xmp:CreateDate')),
+                _iptc_date(iptc.get('date_created')),
+                _exif_date(exif.get('digitized_at'))),
+            'camera_make': _first(exif.get('make'), xmp.get('tiff:Make')),
+            'camera_model': _first(exif.get('model'), xmp.get('tiff:Model')),
+            'lens': _first(exif.get('lens'), xmp.get('aux:Lens'),
+                           xmp.get('exif:LensModel')),
+            'source': exif.get('file_source'),
+            'color_profile': profile,
+            'creator': _first(exif.get('artist'), xmp.get('dc:creator'),
+                              iptc.get('by_line')),
+            'title': _first(xmp.get('dc:title'), iptc.get('title')),
+            'copyright': _first(exif.get('copyright'), xmp.get('dc:rights'),
+                                iptc.get('copyright')),
+            'keywords': keywords if isinstance(keywords, list)
+                        else [keywords],
+            'exif': exif,
+            'xmp': xmp,
+            'iptc': iptc,
+        }
+
+
+def read_header(image):
+    """Returns what extract needs to read the upload of 'image': its path
+    on local storages, its first HEADER_BYTES otherwise."""
+    try:
+        return image.image.path
+    except NotImplementedError:
+        image.image.open('rb')
+        try:
+            return image.image.read(HEADER_BYTES)
+        finally:
+            image.image.close()
+
+
+def pending_step(image, force: bool = False):
+    """Ingest step: the arguments of extract if 'image' has no metadata
+    yet, or None. Copies the metadata of another Image stored in the same
+    blob when there is one."""
+    from photoblog.models import ImageMetadata
+
+    if not force and ImageMetadata.objects.filter(image=image).exists():
+        return None
+    if not force:
+        twin = ImageMetadata.objects.filter(image__image=image.image.name)\
+            .exclude(image=image).values_list('data', flat=True).first()
+        if twin is not None:
+            save_metadata(image, image.image.name, json.loads(twin))
+            return None
+    return {}
+
+
+def save_metadata(image, source_name: str, values: dict) -> None:
+    """Stores the output of extract on 'image', unless its upload was
+    replaced since."""
+    from photoblog.models import Image, ImageMetadata
+
+    taken_at = values.get('taken_at') and parse_datetime(values['taken_at'])
+    if taken_at is not None and timezone.is_naive(taken_at):
+        taken_at = timezone.make_aware(taken_at)
+    with transaction.atomic():
+        if not Image.objects.select_for_update()\
+                .filter(pk=image.pk, image=source_name).exists():
+            return
+        ImageMetadata.objects.update_or_create(image_id=image.pk, defaults={
+            'taken_at': taken_at,
+            'camera_make': (values.get('camera_make') or '')[:100],
+            'camera_model': (values.get('camera_model') or '')[:100],
+            'lens': (values.get('lens') or '')[:100],
+            'source': values.get('source') or '',
+            'orientation': values.get('orientation') or 1,
+            'width': values.get('width'),
+            'height': values.get('height'),
+            'color_profile': (values.get('color_profile') or '')[:100],
+            'data': json.dumps(values, sort_keys=True),
+        })
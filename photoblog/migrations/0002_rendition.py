@@ -0,0 +1,37 @@
+# Generated by Django 2.0.4 on 2026-10-18 04:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+import photoblog.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rendition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=30)),
+                ('file', models.ImageField(height_field='height', upload_to=photoblog.models.rendition_directory_path, width_field='width')),
+                ('width', models.PositiveIntegerField(null=True)),
+                ('height', models.PositiveIntegerField(null=True)),
+                ('format', models.CharField(max_length=10)),
+                ('source', models.CharField(blank=True, help_text='Name of the file it was made from', max_length=255)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='photoblog.Image')),
+            ],
+            options={
+                'verbose_name': 'rendition',
+                'verbose_name_plural': 'renditions',
+                'ordering': ('width',),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='rendition',
+            unique_together={('image', 'name')},
+        ),
+    ]
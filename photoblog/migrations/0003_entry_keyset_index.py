@@ -0,0 +1,17 @@
+# Generated by Django 2.0.4 on 2026-10-18 04:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0002_rendition'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['-created_at', '-id'], name='photoblog_entry_keyset_idx'),
+        ),
+    ]
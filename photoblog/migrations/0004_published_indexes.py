@@ -0,0 +1,37 @@
+# Partial indexes can't be declared in Meta.indexes before Django 2.2, the
+# statements below work on both PostgreSQL and SQLite.
+
+from django.db import migrations
+
+TABLES = ('photoblog_entry', 'photoblog_story', 'photoblog_collection')
+
+
+def create_index(name, table, columns):
+    return migrations.RunSQL(
+        sql=f'CREATE INDEX {name} ON {table} ({columns}) '
+            f'WHERE published_at IS NOT NULL',
+        reverse_sql=f'DROP INDEX {name}',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0003_entry_keyset_index'),
+    ]
+
+    operations = [
+        operation
+        for table in TABLES
+        for operation in (
+            # Public listing, newest first
+            create_index(f'{table}_pub_idx', table,
+                         'created_at DESC, id DESC'),
+            # Public listing of a category
+            create_index(f'{table}_pub_cat_idx', table,
+                         'category_id, created_at DESC, id DESC'),
+            # Public listing of an author
+            create_index(f'{table}_pub_author_idx', table,
+                         'created_by_id, created_at DESC, id DESC'),
+        )
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.0.4 on 2026-10-18 04:57
+
+from django.db import migrations, models
+import photoblog.models
+import photoblog.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0004_published_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='image',
+            name='image',
+            field=models.ImageField(db_index=True, null=True, storage=photoblog.storage.ContentAddressedStorage(), upload_to=photoblog.models.image_directory_path),
+        ),
+        migrations.AlterField(
+            model_name='rendition',
+            name='file',
+            field=models.ImageField(db_index=True, height_field='height', storage=photoblog.storage.ContentAddressedStorage(), upload_to=photoblog.models.rendition_directory_path, width_field='width'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.4 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0007_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='deep_zoom',
+            field=models.BooleanField(default=False, help_text='Build a zoomable tile pyramid'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.0.4 on 2026-10-18 05:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0008_image_deep_zoom'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Bumped on every change'),
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Bumped on every change'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Bumped on every change'),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Bumped on every change'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Lets publish_scheduled find the items whose publication time just
+# passed. Partial, like the indexes of 0004.
+
+from django.db import migrations
+
+TABLES = ('photoblog_entry', 'photoblog_story', 'photoblog_collection')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0009_version'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=f'CREATE INDEX {table}_pub_at_idx ON {table} (published_at) '
+                f'WHERE published_at IS NOT NULL',
+            reverse_sql=f'DROP INDEX {table}_pub_at_idx',
+        )
+        for table in TABLES
+    ]
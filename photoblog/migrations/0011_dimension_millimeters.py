@@ -0,0 +1,43 @@
+# Generated by Django 2.0.4 on 2026-10-18 05:19
+
+from django.db import migrations, models
+from django.db.models import F
+
+MILLIMETERS_PER_UNIT = {'mm': 1.0, 'cm': 10.0, 'm': 1000.0, 'in': 25.4,
+                        'ft': 304.8}
+
+
+def normalize(apps, schema_editor):
+    Dimension = apps.get_model('photoblog', 'Dimension')
+    for unit, factor in MILLIMETERS_PER_UNIT.items():
+        Dimension.objects.filter(unit=unit).update(
+            height_mm=F('height') * factor,
+            length_mm=F('length') * factor,
+            width_mm=F('width') * factor,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0010_scheduled_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dimension',
+            name='height_mm',
+            field=models.FloatField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dimension',
+            name='length_mm',
+            field=models.FloatField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dimension',
+            name='width_mm',
+            field=models.FloatField(db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(normalize, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 2.0.4 on 2026-10-18 05:23
+
+from django.db import migrations, models
+
+# The full-text index is database specific (see photoblog.search):
+# PostgreSQL gets a tsvector column filled by a trigger with the text
+# search configuration of the language, SQLite an FTS5 table kept in sync
+# by triggers.
+
+POSTGRESQL = (
+    """
+    ALTER TABLE photoblog_searchdocument ADD COLUMN vector tsvector;
+
+    CREATE FUNCTION photoblog_search_vector() RETURNS trigger AS $$
+    DECLARE
+        config regconfig := (CASE NEW.language
+                             WHEN 'en' THEN 'english'
+                             WHEN 'es' THEN 'spanish'
+                             ELSE 'simple' END)::regconfig;
+    BEGIN
+        NEW.vector :=
+            setweight(to_tsvector(config, coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector(config, coalesce(NEW.body, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER photoblog_search_vector
+        BEFORE INSERT OR UPDATE OF title, body, language
+        ON photoblog_searchdocument
+        FOR EACH ROW EXECUTE PROCEDURE photoblog_search_vector();
+
+    CREATE INDEX photoblog_search_vector_idx
+        ON photoblog_searchdocument USING gin (vector);
+    """,
+    """
+    DROP TRIGGER photoblog_search_vector ON photoblog_searchdocument;
+    DROP FUNCTION photoblog_search_vector();
+    ALTER TABLE photoblog_searchdocument DROP COLUMN vector;
+    """,
+)
+
+SQLITE = (
+    [
+        "CREATE VIRTUAL TABLE photoblog_search_fts USING fts5("
+        "title, body, content='photoblog_searchdocument', content_rowid='id', "
+        "tokenize='porter unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER photoblog_search_ai AFTER INSERT "
+        "ON photoblog_searchdocument BEGIN "
+        "INSERT INTO photoblog_search_fts(rowid, title, body) "
+        "VALUES (new.id, new.title, new.body); END",
+        "CREATE TRIGGER photoblog_search_ad AFTER DELETE "
+        "ON photoblog_searchdocument BEGIN "
+        "INSERT INTO photoblog_search_fts(photoblog_search_fts, rowid, title, "
+        "body) VALUES ('delete', old.id, old.title, old.body); END",
+        "CREATE TRIGGER photoblog_search_au AFTER UPDATE OF title, body "
+        "ON photoblog_searchdocument BEGIN "
+        "INSERT INTO photoblog_search_fts(photoblog_search_fts, rowid, title, "
+        "body) VALUES ('delete', old.id, old.title, old.body); "
+        "INSERT INTO photoblog_search_fts(rowid, title, body) "
+        "VALUES (new.id, new.title, new.body); END",
+    ],
+    [
+        "DROP TRIGGER photoblog_search_au",
+        "DROP TRIGGER photoblog_search_ad",
+        "DROP TRIGGER photoblog_search_ai",
+        "DROP TABLE photoblog_search_fts",
+    ],
+)
+
+
+def run(schema_editor, statements):
+    if isinstance(statements, str):
+        statements = [statements]
+    for statement in statements:
+        schema_editor.execute(statement, params=None)
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        run(schema_editor, POSTGRESQL[0])
+    elif vendor == 'sqlite':
+        run(schema_editor, SQLITE[0])
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        run(schema_editor, POSTGRESQL[1])
+    elif vendor == 'sqlite':
+        run(schema_editor, SQLITE[1])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0011_dimension_millimeters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('language', models.CharField(max_length=7)),
+                ('title', models.TextField()),
+                ('body', models.TextField(blank=True)),
+                ('published_at', models.DateTimeField(help_text='Searchable from then on, never if empty', null=True)),
+            ],
+            options={
+                'verbose_name': 'search document',
+                'verbose_name_plural': 'search documents',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchdocument',
+            unique_together={('model', 'object_id', 'language')},
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
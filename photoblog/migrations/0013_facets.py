@@ -0,0 +1,52 @@
+# Generated by Django 2.0.4 on 2026-10-18 05:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0012_searchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntryFacet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=40)),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='photoblog.Entry')),
+            ],
+            options={
+                'verbose_name': 'entry facet',
+                'verbose_name_plural': 'entry facets',
+            },
+        ),
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=40)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'facet count',
+                'verbose_name_plural': 'facet counts',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='facetcount',
+            unique_together={('facet', 'value')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='entryfacet',
+            unique_together={('entry', 'facet', 'value')},
+        ),
+        migrations.AlterIndexTogether(
+            name='entryfacet',
+            index_together={('facet', 'value')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.4 on 2026-10-18 05:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0013_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='features',
+            field=models.BinaryField(help_text='Visual features, see photoblog.similarity', null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.0.4 on 2026-10-18 05:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0014_image_features'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageColor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(help_text='0 for the color covering most of the image')),
+                ('red', models.PositiveSmallIntegerField()),
+                ('green', models.PositiveSmallIntegerField()),
+                ('blue', models.PositiveSmallIntegerField()),
+                ('lightness', models.SmallIntegerField(help_text='CIELAB L*')),
+                ('green_red', models.SmallIntegerField(help_text='CIELAB a*')),
+                ('blue_yellow', models.SmallIntegerField(help_text='CIELAB b*')),
+                ('share', models.FloatField(help_text='Share of the image, 0 to 1')),
+                ('bucket', models.PositiveSmallIntegerField(help_text='Cube of the Lab space, see photoblog.palettes.bucket')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='palette', to='photoblog.Image')),
+            ],
+            options={
+                'verbose_name': 'image color',
+                'verbose_name_plural': 'image colors',
+                'ordering': ('image', 'position'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='imagecolor',
+            unique_together={('image', 'position')},
+        ),
+        migrations.AlterIndexTogether(
+            name='imagecolor',
+            index_together={('bucket', 'image')},
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.0.4 on 2026-10-18 05:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0015_imagecolor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageHash',
+            fields=[
+                ('image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='perceptual_hash', serialize=False, to='photoblog.Image')),
+                ('phash', models.BigIntegerField(help_text='64 bit pHash, signed')),
+                ('chunk_0', models.PositiveIntegerField(db_index=True)),
+                ('chunk_1', models.PositiveIntegerField(db_index=True)),
+                ('chunk_2', models.PositiveIntegerField(db_index=True)),
+                ('chunk_3', models.PositiveIntegerField(db_index=True)),
+                ('duplicate_of', models.ForeignKey(blank=True, help_text='Closest image when the upload was ingested', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicated_by', to='photoblog.Image')),
+            ],
+            options={
+                'verbose_name': 'image hash',
+                'verbose_name_plural': 'image hashes',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.0.4 on 2026-10-18 05:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0016_imagehash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageMetadata',
+            fields=[
+                ('image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='metadata', serialize=False, to='photoblog.Image')),
+                ('taken_at', models.DateTimeField(blank=True, db_index=True, help_text='Capture or creation date', null=True)),
+                ('camera_make', models.CharField(blank=True, max_length=100)),
+                ('camera_model', models.CharField(blank=True, max_length=100)),
+                ('lens', models.CharField(blank=True, max_length=100)),
+                ('source', models.CharField(blank=True, choices=[('camera', 'Digital camera'), ('film', 'Film scanner'), ('print', 'Print scanner')], db_index=True, help_text='EXIF FileSource', max_length=10)),
+                ('orientation', models.PositiveSmallIntegerField(default=1, help_text='EXIF orientation, applied to renditions')),
+                ('width', models.PositiveIntegerField(blank=True, help_text='Upright width', null=True)),
+                ('height', models.PositiveIntegerField(blank=True, help_text='Upright height', null=True)),
+                ('color_profile', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('data', models.TextField(default='{}', help_text='Everything read, as JSON')),
+            ],
+            options={
+                'verbose_name': 'image metadata',
+                'verbose_name_plural': 'image metadata',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='imagemetadata',
+            index_together={('camera_make', 'camera_model')},
+        ),
+    ]
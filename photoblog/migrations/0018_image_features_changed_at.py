@@ -0,0 +1,18 @@
+# Generated by Django 2.0.4 on 2026-10-18 06:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0017_imagemetadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='features_changed_at',
+            field=models.DateTimeField(db_index=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.0.4 on 2026-10-18 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photoblog', '0018_image_features_changed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ran_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'scheduler run',
+                'verbose_name_plural': 'scheduler runs',
+            },
+        ),
+    ]
@@ -1,23 +1,86 @@
 # pylint: disable=arguments-differ, no-member, attribute-defined-outside-init, invalid-name
 """Models for photoblog app."""
+import json
+import os
+import uuid
 from typing import List, NewType
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.urls import reverse
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 
+from photoblog.querysets import (DimensionQuerySet, EntryQuerySet,
+                                 ImageQuerySet, ItemQuerySet)
+from photoblog.storage import blob_storage, digest_of, release
+from photoblog import (cache, duplicates, ingest, metadata, search,
+                       similarity, tiles, units)
+
 # types used in models
 DATETIME_VAR = NewType('DateTime', timezone.datetime)
 
 def image_directory_path(instance, filename):
-    """Saves the image in filesystem as described by return statement"""
+    """Saves the image in filesystem as described by return statement.
+    Uploads stored in the blob storage only keep the extension, see
+    photoblog.storage."""
     yyyy_mm = timezone.now().strftime('%Y-%m')
     return f'user_{instance.created_by.id}/{yyyy_mm}/{filename}'
 
 
+def rendition_directory_path(instance, filename):
+    """Saves the rendition next to the original image it was made from.
+    Uploads stored in the blob storage only keep the extension, see
+    photoblog.storage."""
+    return os.path.join(os.path.dirname(instance.image.image.name), filename)
+
+
+def clean_for_save(instance, save_kwargs: dict, derived: dict = None) -> None:
+    """Runs full_clean() on 'instance' before it is saved with
+    'save_kwargs'. When only some fields are saved (update_fields), only
+    those are validated, along with the unique_together groups they
+    belong to, so saving a single column doesn't run the checks of the
+    others. The fields clean() derives from them, and their translations,
+    are added to update_fields.
+
+    Keyword arguments:
+    instance -- model instance about to be saved
+    save_kwargs -- keyword arguments of save(), updated in place
+    derived -- maps a field to the fields clean() computes from it
+    """
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is None:
+        instance.full_clean()
+        return
+    names = set(update_fields)
+    for source, targets in (derived or {}).items():
+        if source in names:
+            names.update(targets)
+    field_names = {f.name for f in instance._meta.concrete_fields}
+    for name in list(names):
+        names.update(f'{name}_{code}' for code, _ in settings.LANGUAGES
+                     if f'{name}_{code}' in field_names)
+    checked = set(names)
+    for group in instance._meta.unique_together:
+        if checked.intersection(group):
+            checked.update(group)
+    instance.full_clean(exclude=list(field_names - checked))
+    save_kwargs['update_fields'] = sorted(names)
+
+
+def bump_version(instance, save_kwargs: dict) -> None:
+    """Increments the version of 'instance' before it is saved with
+    'save_kwargs', see photoblog.templatetags.fragments."""
+    if instance.pk is not None:
+        instance.version += 1
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None and 'version' not in update_fields:
+        save_kwargs['update_fields'] = list(update_fields) + ['version']
+
+
 class Dimension(models.Model):
     """Dimension model to assign sizes to art pieces."""
     MILIMETERS = 'mm'
@@ -27,13 +90,11 @@ class Dimension(models.Model):
     FEET = 'ft'
     TWO_DIMENSIONS = '2d'
     THREE_DIMENSIONS = '3d'
-    CONVERSIONS = {
-        'm':  {'ft': 3.2808, 'in': 39.3701, 'cm': 100.0000, 'mm': 1000.0000},
-        'ft': {'m' : 0.3048, 'in': 12.0000, 'cm':  30.4800, 'mm':  304.8000},
-        'in': {'m' : 0.0254, 'ft':  0.0833, 'cm':   2.5400, 'mm':   25.4000},
-        'cm': {'m' : 0.0100, 'ft':  0.0328, 'in':   0.3937, 'mm':   10.0000},
-        'mm': {'m' : 0.0010, 'ft':  0.0033, 'in':   0.0394, 'cm':    0.1000},
-    }
+    # Factors between every pair of units, see photoblog.units
+    CONVERSIONS = {source: {target: units.factor(source, target)
+                            for target in units.UNITS if target != source}
+                   for source in units.UNITS}
+    MILLIMETERS_PER_UNIT = units.MILLIMETERS_PER_UNIT
     UNIT_CHOICES = (
         (MILIMETERS, _('Milimeters')),
         (CENTIMETERS, _('Centimeters')),
@@ -48,10 +109,16 @@ class Dimension(models.Model):
     width = models.FloatField(null=True, blank=True, verbose_name=_('width'),
                               help_text='If your art piece were 3 dimensional'
                                         ', how wide (thick) would it be')
+    # The sizes in millimeters whatever the unit, for size queries
+    height_mm = models.FloatField(null=True, editable=False, db_index=True)
+    length_mm = models.FloatField(null=True, editable=False, db_index=True)
+    width_mm = models.FloatField(null=True, editable=False, db_index=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL,
                                    blank=False, null=True,
                                    on_delete=models.SET_NULL)
 
+    objects = DimensionQuerySet.as_manager()
+
     def __str__(self):
         if self.width is not None:
             return f'h: {self.height} {self.unit}, l: {self.length}  '\
@@ -59,6 +126,18 @@ class Dimension(models.Model):
         return f'h: {self.height} {self.unit}, l: {self.length} '\
                 f'{self.unit}'
 
+    def save(self, *args, **kwargs):
+        factor = self.MILLIMETERS_PER_UNIT[self.unit]
+        for field in ('height', 'length', 'width'):
+            value = getattr(self, field)
+            setattr(self, f'{field}_mm',
+                    value * factor if value is not None else None)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {
+                'height_mm', 'length_mm', 'width_mm'}
+        super(Dimension, self).save(*args, **kwargs)
+
     def to_object(self):
         if self.width is not None:
             return {
@@ -75,6 +154,8 @@ class Dimension(models.Model):
 
     def convert_unit(self, unit: str = None):
         """Changes the dimension's unit to the one specified by 'unit'.
+        To convert many dimensions at once, see
+        DimensionQuerySet.convert_unit.
 
         Keyword arguments:
         unit -- unit to convert to. Must be one of: 'mm', 'cm', 'm',
@@ -82,21 +163,16 @@ class Dimension(models.Model):
         """
         if unit not in [u[0] for u in self.UNIT_CHOICES]:
             raise ValidationError("Unit provided must be one of: 'mm', 'cm', 'm', 'in', 'ft'.")
-        current_unit = self.unit
+        (self.height, self.length, self.width), = units.convert_dimensions(
+            [self], unit)
         self.unit = unit
-        factor = self.CONVERSIONS[current_unit][unit]
-        if self.height:
-            self.height = self.height * factor
-        if self.length:
-            self.length = self.length * factor
-        if self.width:
-            self.width = self.width * factor
         self.save()
         return f'Units updated: {self.__str__()}'
 
     def display_as_unit(self, unit=None):
         """Returns the dimension's units as the one specified by
-        'unit'. Does not write changes to the database.
+        'unit'. Does not write changes to the database. To display many
+        dimensions at once, see photoblog.units.convert_dimensions.
 
         Keyword arguments:
         unit -- unit to convert to. Must be one of: 'mm', 'cm', 'm',
@@ -104,17 +180,8 @@ class Dimension(models.Model):
         """
         if unit not in [u[0] for u in self.UNIT_CHOICES]:
             raise ValidationError("Unit provided must be one of: 'mm', 'cm', 'm', 'in', 'ft'.")
-        current_unit = self.unit
-        factor = self.CONVERSIONS[current_unit][unit]
-        if self.height:
-            height = self.height * factor
-        if self.length:
-            length = self.length * factor
-        if self.width:
-            width = self.width * factor
-        if width is not None:
-            return f'h: {height} {unit}, l: {length}  {unit}, w: {width}  {unit}'
-        return f'h: {height} {unit}, l: {length} {unit}'
+        size, = units.convert_dimensions([self], unit)
+        return units.format_size(*size, unit)
 
 
 class Category(models.Model):
@@ -137,7 +204,7 @@ class Category(models.Model):
         super(Category, self).clean(*args, **kwargs)
 
     def save(self, *args, **kwargs):
-        self.full_clean()
+        clean_for_save(self, kwargs, derived={'name': ('slug',)})
         super(Category, self).save(*args, **kwargs)
 
 
@@ -148,7 +215,21 @@ class Image(models.Model):
     caption = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     image = models.ImageField(upload_to=image_directory_path, blank=False,
-                              null=True)
+                              null=True, storage=blob_storage, db_index=True)
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True,
+                                         editable=False)
+    placeholder = models.TextField(blank=True, default='', editable=False,
+                                   help_text='Tiny preview as a data URI')
+    deep_zoom = models.BooleanField(default=False,
+                                    help_text='Build a zoomable tile pyramid')
+    features = models.BinaryField(null=True, editable=False,
+                                  help_text='Visual features, see '
+                                            'photoblog.similarity')
+    features_changed_at = models.DateTimeField(null=True, editable=False,
+                                               db_index=True)
+    version = models.PositiveIntegerField(default=1, editable=False,
+                                          help_text='Bumped on every change')
     entries = models.ManyToManyField('photoblog.Entry', related_name='images',
                                      blank=True)
     stories = models.ManyToManyField('photoblog.Story', related_name='images',
@@ -157,6 +238,8 @@ class Image(models.Model):
                              on_delete=models.SET_NULL, null=True, blank=False
                             )
 
+    objects = ImageQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'image'
         verbose_name_plural = 'images'
@@ -164,6 +247,13 @@ class Image(models.Model):
     def __str__(self):
         return f'id: {self.id}, {self.title}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Image, cls).from_db(db, field_names, values)
+        # Lets save() tell whether the upload was replaced
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def clean(self, *args, **kwargs):
         self.slug = slugify(self.title_en)
         self.slug_en = self.slug
@@ -172,12 +262,136 @@ class Image(models.Model):
         super(Image, self).clean(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
-        self.image.delete(save=False)
+        for rendition in self.renditions.all():
+            release(rendition.file)
+        digest = self.digest
+        if release(self.image):
+            tiles.delete_pyramid(digest)
         super(Image, self).delete(*args, **kwargs)
 
+    @classmethod
+    def bulk_create(cls, images: List['Image']) -> List['Image']:
+        """Validates and creates unsaved 'images' at once, setting their
+        slugs and pks, then submits them for ingest. Titles are checked
+        for uniqueness with a single query.
+
+        Raises ValidationError if an image is invalid.
+
+        Keyword arguments:
+        images -- list of unsaved photoblog.models.Image objects
+        """
+        if not images:
+            return []
+        titles = [image.title for image in images]
+        for image in images:
+            # The author is checked by the database, titles below
+            image.full_clean(exclude=['created_by'], validate_unique=False)
+        taken = set(cls.objects.filter(title__in=titles)
+                    .values_list('title', flat=True))
+        taken.update(t for t in titles if titles.count(t) > 1)
+        if taken:
+            raise ValidationError({'title': [
+                _('Image with this title already exists: %(titles)s') % {
+                    'titles': ', '.join(sorted(taken))}]})
+        created = cls.objects.bulk_create(images)
+        if created[0].pk is None:
+            # Only PostgreSQL returns ids from bulk_create
+            pks = dict(cls.objects.filter(title__in=titles)
+                       .values_list('title', 'pk'))
+            for image in created:
+                image.pk = pks[image.title]
+        # bulk_create() sends no signals
+        search.index_many(created)
+        for image in created:
+            image._loaded_values = {'image': image.image.name}
+            ingest.submit(image)
+        return created
+
+    def touch(self) -> None:
+        """Bumps the version after a change made without save(), e.g. to
+        its renditions."""
+        Image.objects.filter(pk=self.pk).update(version=F('version') + 1)
+        self.version += 1
+
+    @property
+    def digest(self) -> str:
+        """SHA-256 digest of the upload, see photoblog.storage."""
+        return digest_of(self.image.name)
+
     def save(self, *args, **kwargs):
-        self.full_clean()
+        clean_for_save(self, kwargs, derived={'title': ('slug',)})
+        loaded = getattr(self, '_loaded_values', {})
+        replaced = 'image' in loaded and loaded['image'] != self.image.name
+        if replaced:
+            # Describes the previous upload, see photoblog.placeholders
+            self.width = self.height = None
+            self.placeholder = ''
+            self.features = None
+            self.features_changed_at = timezone.now()
+        bump_version(self, kwargs)
         super(Image, self).save(*args, **kwargs)
+        if replaced:
+            self.palette.all().delete()
+            ImageHash.objects.filter(image=self).delete()
+            ImageMetadata.objects.filter(image=self).delete()
+        loaded['image'] = self.image.name
+        self._loaded_values = loaded
+        # Saves of other fields, the ingest's own included, have nothing new
+        update_fields = kwargs.get('update_fields')
+        if self.image and (update_fields is None or 'image' in update_fields):
+            ingest.submit(self)
+
+    def similar(self, k: int = 10) -> List['Image']:
+        """Returns the 'k' images looking the most like this one, most
+        similar first, see photoblog.similarity."""
+        return similarity.similar_images(self, k)
+
+    def near_duplicates(self) -> List['Image']:
+        """Returns the images whose perceptual hash is at most
+        PHOTOBLOG_DUPLICATE_DISTANCE bits from this one's, closest first,
+        see photoblog.duplicates. Empty until the image is ingested."""
+        found = ImageHash.objects.filter(image=self)\
+            .values_list('phash', flat=True).first()
+        if found is None:
+            return []
+        pks = [pk for _, pk in duplicates.near(duplicates.to_unsigned(found),
+                                                exclude=self.pk)]
+        images = Image.objects.in_bulk(pks)
+        return [images[pk] for pk in pks if pk in images]
+
+    @property
+    def dzi_url(self):
+        """Url of the Deep Zoom descriptor, None until it is built."""
+        if not self.deep_zoom or not self.digest or \
+                not os.path.exists(tiles.descriptor_path(self.digest)):
+            return None
+        return reverse('photoblog-dzi', args=(self.digest,))
+
+    @property
+    def aspect_ratio(self):
+        """Height as a percentage of the width, to reserve the space of
+        the image with a padding-bottom box. None if unknown."""
+        if not self.width or not self.height:
+            return None
+        return round(self.height / self.width * 100, 4)
+
+    def get_rendition(self, name: str):
+        """Returns the rendition called 'name', or None if it has not
+        been generated.
+
+        Keyword arguments:
+        name -- rendition name, as configured in PHOTOBLOG_RENDITIONS
+        """
+        for rendition in self.renditions.all():
+            if rendition.name == name:
+                return rendition
+        return None
+
+    @property
+    def srcset(self) -> str:
+        """Renditions formatted for an <img srcset> attribute."""
+        return ', '.join(f'{r.file.url} {r.width}w'
+                         for r in self.renditions.all())
 
     def add_to_entry(self, entry_id):
         """Adds image to an entry object, specified by the 'pk'
@@ -188,7 +402,6 @@ class Image(models.Model):
         """
         entry = Entry.objects.get(pk=entry_id)
         self.entries.add(entry)
-        self.save()
         return entry
 
     def add_to_story(self, story_id: int) -> None:
@@ -200,10 +413,60 @@ class Image(models.Model):
         """
         story = Story.objects.get(pk=story_id)
         self.stories.add(story)
-        self.save()
         return story
 
 
+class Rendition(models.Model):
+    """Resized variant of an Image, see photoblog.renditions."""
+    image = models.ForeignKey(Image, related_name='renditions',
+                              on_delete=models.CASCADE)
+    name = models.CharField(max_length=30)
+    file = models.ImageField(upload_to=rendition_directory_path,
+                             width_field='width', height_field='height',
+                             storage=blob_storage, db_index=True)
+    width = models.PositiveIntegerField(null=True)
+    height = models.PositiveIntegerField(null=True)
+    format = models.CharField(max_length=10)
+    source = models.CharField(max_length=255, blank=True,
+                              help_text='Name of the file it was made from')
+
+    class Meta:
+        verbose_name = 'rendition'
+        verbose_name_plural = 'renditions'
+        ordering = ('width',)
+        unique_together = (('image', 'name'),)
+
+    def __str__(self):
+        return f'{self.image_id}: {self.name} ({self.width}x{self.height})'
+
+
+class ChunkedUpload(models.Model):
+    """Upload of a large original sent in chunks, see photoblog.uploads."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                          editable=False)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField(help_text='Expected size in bytes')
+    offset = models.BigIntegerField(default=0,
+                                    help_text='Bytes received so far')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL,
+                                   related_name='chunked_uploads',
+                                   on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    image = models.ForeignKey(Image, related_name='+', null=True,
+                              blank=True, on_delete=models.SET_NULL)
+
+    class Meta:
+        verbose_name = 'chunked upload'
+        verbose_name_plural = 'chunked uploads'
+
+    def __str__(self):
+        return f'{self.filename} ({self.offset}/{self.size})'
+
+    @property
+    def is_complete(self) -> bool:
+        return self.offset == self.size
+
+
 class Item(models.Model):
     """Base model for Entry, Story and Collection."""
     title = models.CharField(max_length=100, blank=False)
@@ -224,6 +487,10 @@ class Item(models.Model):
                              related_query_name='%(app_label)s_%(class)s',
                              on_delete=models.SET_NULL, null=True,
                              blank=False)
+    version = models.PositiveIntegerField(default=1, editable=False,
+                                          help_text='Bumped on every change')
+
+    objects = ItemQuerySet.as_manager()
 
     class Meta:
         abstract = True
@@ -239,22 +506,23 @@ class Item(models.Model):
         super(Item, self).clean(*args, **kwargs)
 
     def save(self, *args, **kwargs):
-        self.full_clean()
+        clean_for_save(self, kwargs, derived={'title': ('slug',)})
+        bump_version(self, kwargs)
         super(Item, self).save(*args, **kwargs)
 
-    def publish(self, time: DATETIME_VAR = timezone.now()):
+    def publish(self, time: DATETIME_VAR = None):
         """Changes draft to be publicly viewable.
 
         Keyword arguments:
         time -- Set a time for publishing (default timezone.now())
         """
-        self.published_at = time
-        self.save()
+        self.published_at = time or timezone.now()
+        self.save(update_fields=['published_at'] if self.pk else None)
 
     def un_publish(self) -> None:
         """Removes the object from public view, keeps it as draft."""
         self.published_at = None
-        self.save()
+        self.save(update_fields=['published_at'] if self.pk else None)
 
     def get_cover(self):
         """Returns the cover image of the model."""
@@ -270,12 +538,8 @@ class Item(models.Model):
         if image is not None:
             if isinstance(image, int):
                 img = Image.objects.get(pk=image)
-                self.cover = img
-                self.save()
             elif image.id:
-                img = Image.objects.get(pk=image.id)
-                self.cover = img
-                self.save()
+                img = image
             else:
                 img = Image.objects.create(
                     title=image.title,
@@ -285,68 +549,79 @@ class Item(models.Model):
                     created_by=image.created_by,
                     image=image.image,
                 )
-                self.cover = img
-                self.save()
+            self.update_cover(img)
             return True
         return False
 
+    def update_cover(self, image: Image) -> None:
+        """Sets saved Image 'image' as the cover with a single UPDATE,
+        without validating the rest of the model again. Unsaved models
+        are saved as usual."""
+        previous = self.cover_id
+        self.cover = image
+        if self.pk is None:
+            self.save()
+            return
+        type(self).objects.filter(pk=self.pk).update(
+            cover=image, version=F('version') + 1)
+        self.version += 1
+        # update() sends no signals
+        cache.invalidate(type(self), [self.pk])
+        if self.published_at is not None:
+            search.refresh_images({previous, self.cover_id} - {None})
+
     def add_images(self, images: List[int or Image] = None,
                    cover: int or Image = None) -> None:
         """Gets, or creates images and assigns it to its image set.
-        Accepts a mixed iterable of ints or Image objects. Note that
-        the Image objects in the 'images' iterable are disposed of, and
-        the DB objects will be different from these. Will fail silently
-        if one of the image pks passed does not exist.
+        Accepts a mixed iterable of ints or Image objects. Image objects
+        without a pk are created together, and get their pk. Will fail
+        silently if one of the image pks passed does not exist.
+
+        Runs a constant number of queries, whatever the number of images:
+        one to look the pks up, one or two to create the new images, two
+        to add them to the image set and one to set the cover. The
+        ingest of the new images (see photoblog.ingest) comes on top.
 
         Keyword arguments:
         images -- photoblog.models.Image or int iterable object. (default None)
         cover -- photoblog.models.Image or int that will be set as cover
         """
-        ids, non_id_images, existing_ids = [], [], []
+        ids, new_images = [], []
         if images is not None:
             try:
                 iter(images)
             except TypeError:
                 raise TypeError(f'{type(images)} is not iterable')
             for i in images:
-                try:
-                    ids.append(i.id)
-                    if not i.id:
-                        non_id_images.append(i)
-                except AttributeError:
+                if not isinstance(i, Image):
                     ids.append(i)
-            existing_ids = list(
-                Image.objects.filter(id__in=ids).values_list('id', flat=True))
-            created_images = Image.objects.bulk_create(non_id_images)
-            existing_ids.extend([j.id for j in created_images])
-        if cover is not None:
-            if images is None or cover in images:
-                if isinstance(cover, int):
-                    self.set_cover_image(cover)
-                elif cover.id:
-                    self.set_cover_image(cover.id)
-            else:
-                if isinstance(cover, int):
-                    self.set_cover_image(cover)
-                    if cover not in existing_ids:
-                        existing_ids.append(cover)
-                elif cover.id:
-                    self.set_cover_image(cover.id)
-                    if cover.id not in existing_ids:
-                        existing_ids.append(cover)
+                elif i.pk:
+                    ids.append(i.pk)
                 else:
-                    cov = Image.objects.create(
-                        title=cover.title,
-                        title_es=cover.title_es,
-                        caption=cover.caption,
-                        caption_es=cover.caption_es,
-                        created_by=cover.created_by,
-                        image=cover.image,
-                    )
-                    self.set_cover_image(cov.id)
-                    if cov.id not in existing_ids:
-                        existing_ids.append(cov.id)
-        self.images.add(*existing_ids)
+                    new_images.append(i)
+        cover_id = None
+        if cover is not None:
+            if not isinstance(cover, Image):
+                cover_id = cover
+                ids.append(cover)
+            elif cover.pk:
+                cover_id = cover.pk
+                ids.append(cover.pk)
+            elif not any(cover is i for i in new_images):
+                new_images.append(cover)
+        found = {}
+        if ids:
+            # Deferred: the other fields load if ever used
+            found = {i.pk: i for i in Image.objects.filter(id__in=ids)
+                     .only('id')}
+        if cover_id is not None and cover_id not in found:
+            raise Image.DoesNotExist(f'No image with pk {cover_id}')
+        found.update((i.pk, i) for i in Image.bulk_create(new_images))
+        if found:
+            self.images.add(*found)
+        if cover is not None:
+            self.update_cover(cover if isinstance(cover, Image)
+                              else found[cover_id])
 
     def remove_images(self, pks: List[int] = None) -> None:
         """Removes images from image set, as specified by the 'pks'
@@ -372,10 +647,17 @@ class Entry(Item):
     collections = models.ManyToManyField('photoblog.Collection',
                                          related_name='entries', blank=True)
 
+    objects = EntryQuerySet.as_manager()
+
     class Meta(Item.Meta):
         verbose_name = 'entry'
         verbose_name_plural = 'entries'
         ordering = ('-created_at',)
+        indexes = (
+            # Keyset pagination, see photoblog.pagination
+            models.Index(fields=['-created_at', '-id'],
+                         name='photoblog_entry_keyset_idx'),
+        )
         unique_together = (('title', 'created_by'), ('slug', 'created_by'),)
         permissions = (
             ('publish_entry', _('can publish entry')),
@@ -392,7 +674,6 @@ class Entry(Item):
         """
         collection = Collection.objects.get(pk=collection_id)
         self.collections.add(collection)
-        self.save()
         return collection
 
 
@@ -425,6 +706,20 @@ class Collection(Item):
             ('view_unpublished', 'can view collection drafts'),
         )
 
+    def publish_with_entries(self, time: DATETIME_VAR = None) -> int:
+        """Publishes the collection and all its entries at 'time', in a
+        single transaction of two UPDATEs. Returns the number of entries.
+
+        Keyword arguments:
+        time -- Set a time for publishing (default timezone.now())
+        """
+        time = time or timezone.now()
+        with transaction.atomic():
+            count = self.entries.all().publish_bulk(time)
+            Collection.objects.filter(pk=self.pk).publish_bulk(time)
+        self.published_at = time
+        return count
+
     def add_entries(self, entries: List[int or Entry] = None) -> None:
         """Gets entries and assigns it to its entry set. Accepts a
         mixed iterable of ints or Entry objects. The ints should point
@@ -462,3 +757,168 @@ class Collection(Item):
             except TypeError:
                 raise TypeError(f'{type(pks)} is not iterable')
             self.entries.remove(*pks)
+
+
+class SearchDocument(models.Model):
+    """Searchable text of an Entry, Story, Collection, Image or Category
+    in one language, kept up to date by photoblog.signals. The full-text
+    index over it is database specific, see photoblog.search."""
+    model = models.CharField(max_length=20)
+    object_id = models.PositiveIntegerField()
+    language = models.CharField(max_length=7)
+    title = models.TextField()
+    body = models.TextField(blank=True)
+    published_at = models.DateTimeField(
+        null=True, help_text='Searchable from then on, never if empty')
+
+    class Meta:
+        verbose_name = 'search document'
+        verbose_name_plural = 'search documents'
+        unique_together = (('model', 'object_id', 'language'),)
+
+    def __str__(self):
+        return f'{self.model} {self.object_id} ({self.language})'
+
+
+class ImageColor(models.Model):
+    """A dominant color of an Image, extracted at ingest by
+    photoblog.palettes. Lab coordinates are rounded to integers."""
+    image = models.ForeignKey(Image, related_name='palette',
+                              on_delete=models.CASCADE)
+    position = models.PositiveSmallIntegerField(
+        help_text='0 for the color covering most of the image')
+    red = models.PositiveSmallIntegerField()
+    green = models.PositiveSmallIntegerField()
+    blue = models.PositiveSmallIntegerField()
+    lightness = models.SmallIntegerField(help_text='CIELAB L*')
+    green_red = models.SmallIntegerField(help_text='CIELAB a*')
+    blue_yellow = models.SmallIntegerField(help_text='CIELAB b*')
+    share = models.FloatField(help_text='Share of the image, 0 to 1')
+    bucket = models.PositiveSmallIntegerField(
+        help_text='Cube of the Lab space, see photoblog.palettes.bucket')
+
+    class Meta:
+        verbose_name = 'image color'
+        verbose_name_plural = 'image colors'
+        ordering = ('image', 'position')
+        unique_together = (('image', 'position'),)
+        index_together = (('bucket', 'image'),)
+
+    def __str__(self):
+        return f'{self.image_id} {self.hex} {self.share:.0%}'
+
+    @property
+    def hex(self) -> str:
+        """CSS hex code of the color."""
+        return f'#{self.red:02x}{self.green:02x}{self.blue:02x}'
+
+
+class ImageMetadata(models.Model):
+    """Capture metadata of the upload of an Image, read from its EXIF,
+    XMP and IPTC headers at ingest by photoblog.metadata."""
+    image = models.OneToOneField(Image, primary_key=True,
+                                 related_name='metadata',
+                                 on_delete=models.CASCADE)
+    taken_at = models.DateTimeField(null=True, blank=True, db_index=True,
+                                    help_text='Capture or creation date')
+    camera_make = models.CharField(max_length=100, blank=True)
+    camera_model = models.CharField(max_length=100, blank=True)
+    lens = models.CharField(max_length=100, blank=True)
+    source = models.CharField(max_length=10, blank=True, db_index=True,
+                              choices=metadata.SOURCES,
+                              help_text='EXIF FileSource')
+    orientation = models.PositiveSmallIntegerField(
+        default=1, help_text='EXIF orientation, applied to renditions')
+    width = models.PositiveIntegerField(null=True, blank=True,
+                                        help_text='Upright width')
+    height = models.PositiveIntegerField(null=True, blank=True,
+                                         help_text='Upright height')
+    color_profile = models.CharField(max_length=100, blank=True,
+                                     db_index=True)
+    data = models.TextField(default='{}',
+                            help_text='Everything read, as JSON')
+
+    class Meta:
+        verbose_name = 'image metadata'
+        verbose_name_plural = 'image metadata'
+        index_together = (('camera_make', 'camera_model'),)
+
+    def __str__(self):
+        return f'{self.image_id} {self.camera_make} {self.camera_model}'
+
+    @property
+    def values(self) -> dict:
+        """Everything read from the headers, see
+        photoblog.metadata.extract."""
+        return json.loads(self.data)
+
+
+class ImageHash(models.Model):
+    """The perceptual hash of an Image, split in indexed chunks to find
+    near-duplicates, see photoblog.duplicates."""
+    image = models.OneToOneField(Image, primary_key=True,
+                                 related_name='perceptual_hash',
+                                 on_delete=models.CASCADE)
+    phash = models.BigIntegerField(help_text='64 bit pHash, signed')
+    chunk_0 = models.PositiveIntegerField(db_index=True)
+    chunk_1 = models.PositiveIntegerField(db_index=True)
+    chunk_2 = models.PositiveIntegerField(db_index=True)
+    chunk_3 = models.PositiveIntegerField(db_index=True)
+    duplicate_of = models.ForeignKey(
+        Image, related_name='duplicated_by', null=True, blank=True,
+        on_delete=models.SET_NULL,
+        help_text='Closest image when the upload was ingested')
+
+    class Meta:
+        verbose_name = 'image hash'
+        verbose_name_plural = 'image hashes'
+
+    def __str__(self):
+        return f'{self.image_id} {duplicates.to_unsigned(self.phash):016x}'
+
+
+class EntryFacet(models.Model):
+    """A facet value of a published Entry, e.g. its category or price
+    range, maintained by photoblog.facets."""
+    entry = models.ForeignKey(Entry, related_name='facets',
+                              on_delete=models.CASCADE)
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=40)
+
+    class Meta:
+        verbose_name = 'entry facet'
+        verbose_name_plural = 'entry facets'
+        unique_together = (('entry', 'facet', 'value'),)
+        index_together = (('facet', 'value'),)
+
+    def __str__(self):
+        return f'{self.entry_id} {self.facet}={self.value}'
+
+
+class FacetCount(models.Model):
+    """Number of published entries with a facet value, maintained by
+    photoblog.facets."""
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=40)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'facet count'
+        verbose_name_plural = 'facet counts'
+        unique_together = (('facet', 'value'),)
+
+    def __str__(self):
+        return f'{self.facet}={self.value}: {self.count}'
+
+
+class SchedulerRun(models.Model):
+    """Time of the last run of the publish_scheduled command, as a single
+    row."""
+    ran_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'scheduler run'
+        verbose_name_plural = 'scheduler runs'
+
+    def __str__(self):
+        return f'{self.ran_at}'
@@ -0,0 +1,159 @@
+"""Full-page cache with conditional GET support.
+
+Pages wrapped with page_cache() are cached per language, path and
+PHOTOBLOG_PAGE_PARAMS query parameters, in sorted order, so that other
+parameters (tracking, reordered ones) do not split the cache. Pages are
+rebuilt through photoblog.cache.get_or_compute(), and thus go stale,
+rather than missing, when the photoblog changes.
+
+They carry an ETag, derived from the page key, the listing generation
+and the time of the latest change (photoblog.cache.CHANGED_AT_KEY), and
+a Last-Modified header with that time. Both only change when the cached
+page goes stale, and are known without the page: clients revalidating a
+page they have get a 304 without it being rendered or even read from
+the cache.
+
+Only anonymous GET and HEAD requests answered with a 200 that sets no
+cookie are cached.
+
+Settings:
+
+    PHOTOBLOG_PAGE_TIMEOUT -- seconds pages are fresh (default
+                              PHOTOBLOG_LISTING_TIMEOUT)
+    PHOTOBLOG_PAGE_PARAMS -- query parameters pages depend on (default
+                             the cursor and the facets)
+"""
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db.models import Max
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
+
+from photoblog import cache, facets
+
+
+class Uncacheable(Exception):
+    """Carries a response that must not be cached out of
+    get_or_compute()."""
+    def __init__(self, response):
+        super(Uncacheable, self).__init__('Response is not cacheable')
+        self.response = response
+
+
+def page_timeout() -> int:
+    return getattr(settings, 'PHOTOBLOG_PAGE_TIMEOUT', cache.listing_timeout())
+
+
+def page_params() -> list:
+    return getattr(settings, 'PHOTOBLOG_PAGE_PARAMS',
+                   ['cursor'] + list(facets.FACETS))
+
+
+def page_key(request) -> str:
+    """Returns the cache key of the page of 'request', from its path and
+    the sorted values of the PHOTOBLOG_PAGE_PARAMS it carries."""
+    params = sorted((name, sorted(request.GET.getlist(name)))
+                    for name in page_params() if name in request.GET)
+    url = request.path
+    if params:
+        url += '?' + urlencode(params, doseq=True)
+    return 'photoblog:page:{}:{}'.format(
+        get_language(), hashlib.md5(url.encode()).hexdigest())
+
+
+def page_etag(key: str, changed_at) -> str:
+    """Returns the ETag of the page cached under 'key', as of the current
+    listing generation and time of the latest change 'changed_at'."""
+    version = f'{key}:{cache.generation()}:{changed_at}'
+    return quote_etag(hashlib.md5(version.encode()).hexdigest())
+
+
+def newest_change():
+    """Returns the latest created_at or published_at of the photoblog,
+    or None if it is empty."""
+    from photoblog.models import Collection, Entry, Image, Story
+
+    dates = [Image.objects.aggregate(at=Max('created_at'))['at']]
+    for model in (Entry, Story, Collection):
+        dates.append(model.objects.aggregate(at=Max('created_at'))['at'])
+        dates.append(model.objects.published().aggregate(
+            at=Max('published_at'))['at'])
+    dates = [d for d in dates if d is not None]
+    return max(dates) if dates else None
+
+
+def last_modified():
+    """Returns the time of the latest change to the photoblog, as
+    recorded by photoblog.cache.expire_listings(), looking it up in the
+    database when the cache has no record of it."""
+    backend = cache.get_cache()
+    changed_at = backend.get(cache.CHANGED_AT_KEY)
+    if changed_at is None:
+        changed_at = newest_change()
+        if changed_at is not None:
+            backend.add(cache.CHANGED_AT_KEY, changed_at, timeout=None)
+    return changed_at
+
+
+def cacheable(request) -> bool:
+    return request.method in ('GET', 'HEAD') and \
+        not request.user.is_authenticated
+
+
+def page_cache(view):
+    """Decorator caching the pages rendered by 'view' per language and
+    URL, answering conditional requests with 304s."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if not cacheable(request):
+            return view(request, *args, **kwargs)
+        key = page_key(request)
+        # Read before rendering, so a change during it makes the page stale
+        modified = last_modified()
+        etag = page_etag(key, modified)
+        timestamp = int(modified.timestamp()) if modified else None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp)
+        if response is not None:
+            return set_headers(response, etag, timestamp)
+
+        def render():
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            if response.status_code != 200 or response.cookies or \
+                    request.META.get('CSRF_COOKIE_USED'):
+                raise Uncacheable(response)
+            return {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'etag': etag,
+                'last_modified': timestamp,
+            }
+
+        try:
+            page = cache.get_or_compute(key, render, timeout=page_timeout())
+        except Uncacheable as error:
+            return error.response
+        # A stale page keeps the validators it was rendered with
+        response = HttpResponse(page['content'],
+                                content_type=page['content_type'])
+        return set_headers(response, page['etag'], page['last_modified'])
+    return wrapped
+
+
+def set_headers(response, etag: str, timestamp: int):
+    """Sets the validators and caching headers of page 'response'."""
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    # Browsers must revalidate, which is cheap with a 304
+    patch_cache_control(response, max_age=0, must_revalidate=True)
+    patch_vary_headers(response, ('Accept-Language', 'Cookie'))
+    return response
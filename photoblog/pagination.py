@@ -0,0 +1,160 @@
+"""Keyset (cursor) pagination.
+
+Instead of OFFSET, pages are fetched by filtering on the ordering columns
+of the last row of the previous page, so any page costs the same as the
+first one as long as an index covers the ordering.
+"""
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import gettext_lazy as _
+
+
+class InvalidCursor(Exception):
+    """Raised when a cursor token can't be decoded."""
+
+
+def encode_token(values: list) -> str:
+    """Returns 'values', a list of JSON serializable values, as an opaque
+    url safe token."""
+    payload = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_token(token: str) -> list:
+    """Returns the values encoded in 'token' by encode_token.
+
+    Raises InvalidCursor if the token is malformed.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeError, ValueError) as exc:
+        raise InvalidCursor(token) from exc
+
+
+def encode_cursor(direction: str, created_at, pk: int) -> str:
+    """Returns an opaque token pointing after (or before) a row.
+
+    Keyword arguments:
+    direction -- 'n' to fetch the rows after it, 'p' for the ones before
+    created_at -- datetime of the row
+    pk -- primary key of the row
+    """
+    return encode_token([direction, created_at.isoformat(), pk])
+
+
+def decode_cursor(token: str) -> tuple:
+    """Returns the (direction, created_at, pk) tuple encoded in 'token'.
+
+    Raises InvalidCursor if the token is malformed.
+    """
+    try:
+        direction, created_at, pk = decode_token(token)
+        created_at = parse_datetime(created_at)
+    except (TypeError, ValueError) as exc:
+        raise InvalidCursor(token) from exc
+    if direction not in ('n', 'p') or created_at is None \
+            or not isinstance(pk, int):
+        raise InvalidCursor(token)
+    return direction, created_at, pk
+
+
+class CursorPage:
+    """A page of results, with the cursors to the neighbouring pages."""
+    def __init__(self, object_list: list, next_cursor: str = None,
+                 previous_cursor: str = None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Paginates 'queryset' newest first, keyed on (created_at, id).
+
+    Keyword arguments:
+    queryset -- queryset of a model with a created_at field
+    per_page -- number of objects per page
+    """
+    def __init__(self, queryset, per_page: int):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def page(self, cursor: str = None) -> CursorPage:
+        """Returns the page pointed to by 'cursor', or the first page.
+
+        Raises InvalidCursor if the token is malformed.
+        """
+        if not cursor:
+            return self._forward(self.queryset, first=True)
+        direction, created_at, pk = decode_cursor(cursor)
+        if direction == 'n':
+            return self._forward(self.queryset.filter(
+                Q(created_at__lt=created_at) |
+                Q(created_at=created_at, id__lt=pk)))
+        return self._backward(self.queryset.filter(
+            Q(created_at__gt=created_at) |
+            Q(created_at=created_at, id__gt=pk)))
+
+    def _forward(self, queryset, first: bool = False) -> CursorPage:
+        rows = list(queryset.order_by('-created_at', '-id')
+                    [:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return CursorPage(
+            rows,
+            next_cursor=self._cursor('n', rows[-1]) if has_next else None,
+            previous_cursor=(self._cursor('p', rows[0])
+                             if rows and not first else None),
+        )
+
+    def _backward(self, queryset) -> CursorPage:
+        rows = list(queryset.order_by('created_at', 'id')
+                    [:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return CursorPage(
+            rows,
+            next_cursor=self._cursor('n', rows[-1]) if rows else None,
+            previous_cursor=(self._cursor('p', rows[0])
+                             if has_previous else None),
+        )
+
+    @staticmethod
+    def _cursor(direction, obj) -> str:
+        return encode_cursor(direction, obj.created_at, obj.pk)
+
+
+class CursorPaginationMixin:
+    """Replaces the offset pagination of a ListView with a
+    CursorPaginator. The page is read from the 'cursor' query string
+    parameter, and page_obj exposes next_cursor and previous_cursor.
+    """
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = CursorPaginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404(_('Invalid page.'))
+        return paginator, page, page.object_list, page.has_other_pages()
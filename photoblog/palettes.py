@@ -0,0 +1,261 @@
+"""Dominant color palettes, to shop the gallery by color.
+
+The palette of every Image is extracted once at ingest (see
+photoblog.ingest), by median cut of a small thumbnail, and stored in
+ImageColor, one row per color with its share of the image. Colors are
+compared in CIELAB, where the Euclidean distance (delta E) follows the
+perceived difference, and each one is filed in a bucket of the Lab space
+so that a query only reads the colors of the few buckets around the
+colors asked for, through the index on bucket.
+
+Entries are found by the palette of their cover: those having a color
+close to every color asked for, closest first.
+
+Settings:
+
+    PHOTOBLOG_PALETTE_SIZE -- colors extracted per image (default 5)
+    PHOTOBLOG_COLOR_RADIUS -- largest delta E between a color asked for
+                              and a color of a palette (default 20)
+"""
+import functools
+import io
+import math
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (ExpressionWrapper, F, IntegerField, OuterRef,
+                              Subquery)
+from PIL import Image as PILImage
+
+from photoblog import cache
+
+THUMBNAIL_SIZE = 100
+# Colors covering less of the image are left out
+MIN_SHARE = 0.02
+# Side of the Lab cubes of the buckets
+CELL = 20
+LIGHTNESS_CELLS = 100 // CELL + 1
+CHROMA_CELLS = 256 // CELL + 1
+HEX_COLOR = re.compile(r'^#?([0-9a-f]{6})$', re.IGNORECASE)
+
+# Color names understood by queries
+NAMES = {
+    'black': '000000',
+    'white': 'ffffff',
+    'gray': '808080',
+    'silver': 'c0c0c0',
+    'red': 'cc2222',
+    'crimson': 'dc143c',
+    'maroon': '800000',
+    'pink': 'ffc0cb',
+    'orange': 'ff8c00',
+    'coral': 'ff7f50',
+    'ochre': 'cc7722',
+    'gold': 'd4a017',
+    'yellow': 'f5d400',
+    'beige': 'f5f5dc',
+    'brown': '8b4513',
+    'olive': '808000',
+    'green': '2e8b2e',
+    'lime': '9acd32',
+    'teal': '008080',
+    'turquoise': '40e0d0',
+    'cyan': '00bcd4',
+    'blue': '1e50c8',
+    'navy': '000080',
+    'indigo': '4b0082',
+    'purple': '800080',
+    'violet': 'ee82ee',
+    'lavender': 'b4a7d6',
+}
+
+
+def palette_size() -> int:
+    return getattr(settings, 'PHOTOBLOG_PALETTE_SIZE', 5)
+
+
+def color_radius() -> int:
+    return getattr(settings, 'PHOTOBLOG_COLOR_RADIUS', 20)
+
+
+def parse_color(value: str) -> tuple:
+    """Returns the (red, green, blue) of color name or hex code 'value',
+    or None if it is neither."""
+    value = value.strip().lower()
+    match = HEX_COLOR.match(NAMES.get(value, value))
+    if match is None:
+        return None
+    code = match.group(1)
+    return tuple(int(code[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def to_lab(rgb: tuple) -> tuple:
+    """Returns the CIELAB (L, a, b) of sRGB color 'rgb', under D65."""
+    linear = []
+    for channel in rgb:
+        channel /= 255
+        linear.append(channel / 12.92 if channel <= 0.04045
+                      else ((channel + 0.055) / 1.055) ** 2.4)
+    r, g, b = linear
+    xyz = ((0.4124 * r + 0.3576 * g + 0.1805 * b) / 0.95047,
+           0.2126 * r + 0.7152 * g + 0.0722 * b,
+           (0.0193 * r + 0.1192 * g + 0.9505 * b) / 1.08883)
+    fx, fy, fz = (t ** (1 / 3) if t > 216 / 24389
+                  else (24389 / 27 * t + 16) / 116 for t in xyz)
+    return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+
+def _cell(lab: tuple) -> tuple:
+    lightness, a, b = lab
+    return (min(max(int(lightness // CELL), 0), LIGHTNESS_CELLS - 1),
+            min(max(int((a + 128) // CELL), 0), CHROMA_CELLS - 1),
+            min(max(int((b + 128) // CELL), 0), CHROMA_CELLS - 1))
+
+
+def bucket(lab: tuple) -> int:
+    """Returns the bucket of Lab color 'lab'."""
+    lightness, a, b = _cell(lab)
+    return (lightness * CHROMA_CELLS + a) * CHROMA_CELLS + b
+
+
+@functools.lru_cache(maxsize=256)
+def buckets_near(lab: tuple, radius: int) -> list:
+    """Returns the buckets holding colors within 'radius' of Lab color
+    'lab'."""
+    found = []
+    origins = (0, -128, -128)
+    low = _cell(tuple(value - radius for value in lab))
+    high = _cell(tuple(value + radius for value in lab))
+    for lightness in range(low[0], high[0] + 1):
+        for a in range(low[1], high[1] + 1):
+            for b in range(low[2], high[2] + 1):
+                # Distance from 'lab' to the closest point of the cube
+                gap = 0
+                for value, index, origin in zip(lab, (lightness, a, b),
+                                                origins):
+                    start = origin + index * CELL
+                    gap += max(start - value, 0, value - start - CELL) ** 2
+                if gap <= radius ** 2:
+                    found.append((lightness * CHROMA_CELLS + a)
+                                 * CHROMA_CELLS + b)
+    return found
+
+
+def extract(source, size: int = 5) -> list:
+    """Returns the dominant colors of the image in 'source', as
+    (red, green, blue, share) from the largest share down.
+
+    Keyword arguments:
+    source -- path to the image, or its contents as bytes
+    size -- largest number of colors (default 5)
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with PILImage.open(source) as img:
+        img.draft('RGB', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        img = img.convert('RGB')
+        img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        # Median cut
+        quantized = img.quantize(colors=size, method=0)
+    palette = quantized.getpalette()
+    total = quantized.width * quantized.height
+    colors = []
+    for count, index in sorted(quantized.getcolors(size), reverse=True):
+        share = count / total
+        if share >= MIN_SHARE:
+            colors.append((*palette[index * 3:index * 3 + 3],
+                           round(share, 4)))
+    return colors
+
+
+def pending_step(image, force: bool = False):
+    """Ingest step: the arguments of extract if 'image' has no palette
+    yet, or None. Copies the palette of another Image stored in the same
+    blob when there is one."""
+    from photoblog.models import ImageColor
+
+    if not force and image.palette.exists():
+        return None
+    if not force:
+        twin = ImageColor.objects.filter(image__image=image.image.name)\
+            .exclude(image_id=image.pk).values_list('image_id', flat=True)\
+            .first()
+        if twin is not None:
+            save_palette(image, image.image.name, list(
+                ImageColor.objects.filter(image_id=twin).order_by('position')
+                .values_list('red', 'green', 'blue', 'share')))
+            return None
+    return {'size': palette_size()}
+
+
+def save_palette(image, source_name: str, colors: list) -> None:
+    """Replaces the palette of 'image' with the output of extract, unless
+    its upload was replaced since."""
+    from photoblog.models import Entry, Image, ImageColor
+
+    with transaction.atomic():
+        if not Image.objects.select_for_update()\
+                .filter(pk=image.pk, image=source_name).exists():
+            return
+        ImageColor.objects.filter(image_id=image.pk).delete()
+        rows = []
+        for position, (red, green, blue, share) in enumerate(colors):
+            lab = tuple(round(value) for value in to_lab((red, green, blue)))
+            rows.append(ImageColor(
+                image_id=image.pk, position=position, red=red, green=green,
+                blue=blue, lightness=lab[0], green_red=lab[1],
+                blue_yellow=lab[2], share=share, bucket=bucket(lab)))
+        ImageColor.objects.bulk_create(rows)
+    # Results of color queries only change with the covers of published
+    # entries, not with every upload
+    if Entry.objects.published().filter(cover_id=image.pk).exists():
+        cache.expire_listings()
+
+
+def near(rgb: tuple, radius: int):
+    """Returns the ImageColors within 'radius' of color 'rgb', annotated
+    with the squared 'distance' to it."""
+    from photoblog.models import ImageColor
+
+    lab = tuple(round(value) for value in to_lab(rgb))
+    distance = ExpressionWrapper(
+        (F('lightness') - lab[0]) * (F('lightness') - lab[0])
+        + (F('green_red') - lab[1]) * (F('green_red') - lab[1])
+        + (F('blue_yellow') - lab[2]) * (F('blue_yellow') - lab[2]),
+        output_field=IntegerField())
+    return ImageColor.objects.filter(bucket__in=buckets_near(lab, radius))\
+        .annotate(distance=distance).filter(distance__lte=radius ** 2)
+
+
+def filter_entries(queryset, colors: list, radius: int = None):
+    """Narrows Entry 'queryset' down to the entries whose cover has a
+    color close to every color of 'colors', annotated with the sum of the
+    squared distances as 'color_distance' and ordered by it, closest
+    first.
+
+    Keyword arguments:
+    queryset -- Entry queryset
+    colors -- (red, green, blue) colors
+    radius -- largest delta E of a match (default PHOTOBLOG_COLOR_RADIUS)
+    """
+    radius = radius or color_radius()
+    total = None
+    for rgb in colors:
+        matches = near(rgb, radius)
+        closest = Subquery(matches.filter(image_id=OuterRef('cover_id'))
+                           .order_by('distance').values('distance')[:1],
+                           output_field=IntegerField())
+        queryset = queryset.filter(cover_id__in=matches.values('image_id'))
+        total = closest if total is None else total + closest
+    if total is None:
+        return queryset.none()
+    return queryset.annotate(color_distance=ExpressionWrapper(
+        total, output_field=IntegerField()))\
+        .order_by('color_distance', '-published_at', 'pk')
+
+
+def distance(first: tuple, second: tuple) -> float:
+    """Returns the delta E between (red, green, blue) colors."""
+    return math.sqrt(sum((x - y) ** 2
+                         for x, y in zip(to_lab(first), to_lab(second))))
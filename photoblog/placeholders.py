@@ -0,0 +1,84 @@
+"""Low quality image placeholders (LQIP).
+
+Each Image keeps its intrinsic width and height and a tiny, blurry JPEG
+of itself as a data URI, computed once at ingest (see photoblog.ingest).
+Templates use them to reserve the space of the image and show a preview
+while the full image loads, without any extra request.
+
+Settings:
+
+    PHOTOBLOG_PLACEHOLDER_WIDTH -- width of the preview in pixels
+                                   (default 16)
+"""
+import base64
+import io
+
+from django.conf import settings
+from PIL import Image as PILImage, ImageFilter
+
+from photoblog import cache, metadata
+
+
+def placeholder_width() -> int:
+    return getattr(settings, 'PHOTOBLOG_PLACEHOLDER_WIDTH', 16)
+
+
+def describe(source, width: int = 16, quality: int = 40) -> tuple:
+    """Returns the (width, height, placeholder) of the image in 'source',
+    turned upright according to its EXIF orientation. The placeholder is
+    a 'width' pixels wide JPEG data URI.
+
+    Keyword arguments:
+    source -- path to the image, or its contents as bytes
+    width -- width of the placeholder (default 16)
+    quality -- JPEG quality of the placeholder (default 40)
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with PILImage.open(source) as img:
+        orientation = metadata.orientation_of(img)
+        size = metadata.oriented_size(img.size, orientation)
+        height = max(1, round(size[1] * width / size[0]))
+        preview = metadata.oriented_size((width, height), orientation)
+        img.draft('RGB', preview)
+        img = img.convert('RGB').resize(preview, PILImage.BILINEAR)
+        img = metadata.oriented(img, orientation)
+        img = img.filter(ImageFilter.GaussianBlur(1))
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality, optimize=True)
+    data = base64.b64encode(buffer.getvalue()).decode('ascii')
+    return size[0], size[1], f'data:image/jpeg;base64,{data}'
+
+
+def pending_step(image, force: bool = False):
+    """Ingest step: the arguments of describe if 'image' has no
+    placeholder yet, or None. Copies the placeholder of another Image
+    stored in the same blob when there is one."""
+    from photoblog.models import Image
+
+    if image.placeholder and not force:
+        return None
+    if not force:
+        twin = Image.objects.filter(image=image.image.name)\
+            .exclude(pk=image.pk).exclude(placeholder='')\
+            .values_list('width', 'height', 'placeholder').first()
+        if twin is not None:
+            save_description(image, image.image.name, twin)
+            return None
+    return {'width': placeholder_width()}
+
+
+def save_description(image, source_name: str, description: tuple) -> None:
+    """Stores the output of describe on 'image', unless its upload was
+    replaced since."""
+    from photoblog.models import Image
+
+    width, height, placeholder = description
+    updated = Image.objects.filter(pk=image.pk, image=source_name).update(
+        width=width, height=height, placeholder=placeholder)
+    if updated:
+        image.width, image.height = width, height
+        image.placeholder = placeholder
+        image.touch()
+        # update() sends no signals
+        cache.invalidate_image(image.pk)
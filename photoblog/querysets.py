@@ -0,0 +1,226 @@
+"""Custom querysets for photoblog models."""
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from photoblog import autocomplete, cache, facets, palettes, search, units
+
+
+class ItemQuerySet(models.QuerySet):
+    """QuerySet for Item subclasses (Entry, Story and Collection)."""
+
+    def published(self, at=None):
+        """Items publicly viewable at time 'at'.
+
+        Keyword arguments:
+        at -- datetime to check against (default timezone.now())
+        """
+        return self.filter(published_at__isnull=False,
+                           published_at__lte=at or timezone.now())
+
+    def scheduled(self, since, until=None):
+        """Items whose publication time fell between 'since' (excluded)
+        and 'until'.
+
+        Keyword arguments:
+        since -- datetime of the previous check
+        until -- datetime of this check (default timezone.now())
+        """
+        return self.filter(published_at__gt=since,
+                           published_at__lte=until or timezone.now())
+
+    def publish_bulk(self, when=None) -> int:
+        """Publishes every item at time 'when', in a single UPDATE, and
+        drops them from the cache. Items published in the future show up
+        once photoblog's publish_scheduled command has seen them.
+
+        Returns the number of items published.
+
+        Keyword arguments:
+        when -- publication datetime (default timezone.now())
+        """
+        return self._set_published_at(when or timezone.now())
+
+    def unpublish_bulk(self) -> int:
+        """Turns every item back into a draft, in a single UPDATE, and
+        drops them from the cache. Returns the number of items."""
+        return self._set_published_at(None)
+
+    def _set_published_at(self, when) -> int:
+        with transaction.atomic():
+            pks = list(self.order_by().values_list('pk', flat=True))
+            count = self.model.objects.filter(pk__in=pks).update(
+                published_at=when, version=F('version') + 1)
+            # update() sends no signals
+            search.update_published(self.model, pks, when)
+            autocomplete.refresh(self.model, pks)
+            self._published_changed(pks)
+        cache.invalidate(self.model, pks)
+        return count
+
+    def _published_changed(self, pks: list) -> None:
+        """Called once items 'pks' have been (un)published in bulk."""
+
+
+def to_millimeters(value, unit: str):
+    """Returns 'value' in 'unit' in millimeters, None stays None."""
+    from photoblog.models import Dimension
+
+    if value is None:
+        return None
+    return value * Dimension.MILLIMETERS_PER_UNIT[unit]
+
+
+class DimensionQuerySet(models.QuerySet):
+    """QuerySet for Dimension. Sizes are compared on the normalized
+    millimeter columns, so the filters run in the database whatever unit
+    each Dimension is displayed in."""
+
+    def size_between(self, unit: str = 'cm', **bounds):
+        """Dimensions within the bounds given as min_<field> and
+        max_<field> keyword arguments, <field> being height, length or
+        width, e.g. size_between('cm', max_height=60).
+
+        Keyword arguments:
+        unit -- unit of the bounds (default 'cm')
+        bounds -- min_height, max_height, min_length, max_length,
+                  min_width, max_width (default None, unbounded)
+        """
+        lookups = {'min': 'gte', 'max': 'lte'}
+        filters = {}
+        for name, value in bounds.items():
+            bound, _, field = name.partition('_')
+            if bound not in lookups or \
+                    field not in ('height', 'length', 'width'):
+                raise TypeError(f'Unexpected bound {name!r}')
+            if value is not None:
+                filters[f'{field}_mm__{lookups[bound]}'] = \
+                    to_millimeters(value, unit)
+        return self.filter(**filters)
+
+    def fits_within(self, height, length, width=None, unit: str = 'cm',
+                    rotate: bool = False):
+        """Dimensions fitting a height x length (x width) space. Pieces
+        without a width fit any depth.
+
+        Keyword arguments:
+        height -- height of the space
+        length -- length of the space
+        width -- depth of the space (default None, any depth)
+        unit -- unit of the space (default 'cm')
+        rotate -- also accept pieces fitting when turned by 90 degrees
+                  (default False)
+        """
+        height = to_millimeters(height, unit)
+        length = to_millimeters(length, unit)
+        fits = models.Q(height_mm__lte=height, length_mm__lte=length)
+        if rotate:
+            fits |= models.Q(height_mm__lte=length, length_mm__lte=height)
+        queryset = self.filter(fits)
+        if width is not None:
+            queryset = queryset.filter(
+                models.Q(width_mm__isnull=True) |
+                models.Q(width_mm__lte=to_millimeters(width, unit)))
+        return queryset
+
+    def convert_unit(self, unit: str, batch_size: int = 500) -> int:
+        """Converts every dimension to 'unit', the sizes being converted
+        at once (see photoblog.units) and written back with one UPDATE
+        per 'batch_size' dimensions. The millimeter columns don't change.
+
+        Returns the number of dimensions converted.
+
+        Keyword arguments:
+        unit -- unit to convert to
+        batch_size -- dimensions per UPDATE (default 500)
+        """
+        rows = list(self.order_by().values_list(
+            'pk', 'height', 'length', 'width', 'unit'))
+        sizes = units.convert((row[1:4] for row in rows),
+                              [row[4] for row in rows], unit)
+        fields = ('height', 'length', 'width')
+        pairs = list(zip(rows, sizes))
+        with transaction.atomic():
+            for start in range(0, len(pairs), batch_size):
+                batch = pairs[start:start + batch_size]
+                self.model.objects.filter(
+                    pk__in=[row[0] for row, _ in batch]
+                ).update(unit=unit, **{
+                    field: models.Case(*(
+                        models.When(pk=row[0], then=models.Value(size[i]))
+                        for row, size in batch
+                    ), output_field=models.FloatField())
+                    for i, field in enumerate(fields)
+                })
+        return len(rows)
+
+
+class ImageQuerySet(models.QuerySet):
+    """QuerySet for Image, with lookups on the metadata read at ingest
+    (see photoblog.metadata)."""
+
+    def shot_on_film(self):
+        """Images scanned from film, according to their EXIF."""
+        return self.filter(metadata__source='film')
+
+    def taken_in(self, year: int):
+        """Images captured or created in 'year', according to their
+        metadata."""
+        return self.filter(metadata__taken_at__year=year)
+
+    def taken_with(self, make: str, model: str = None):
+        """Images captured with a camera of 'make', and 'model' if
+        given."""
+        images = self.filter(metadata__camera_make=make)
+        if model is not None:
+            images = images.filter(metadata__camera_model=model)
+        return images
+
+
+class EntryQuerySet(ItemQuerySet):
+    """QuerySet for Entry."""
+
+    def _published_changed(self, pks: list) -> None:
+        facets.refresh(pks)
+
+    def with_facets(self, selected: dict):
+        """Entries having the facet options 'selected', see
+        photoblog.facets.selection."""
+        return facets.filter_entries(self, selected)
+
+    def with_colors(self, colors: list, radius: int = None):
+        """Entries whose cover has a color close to each of 'colors',
+        closest first, see photoblog.palettes.filter_entries."""
+        return palettes.filter_entries(self, colors, radius)
+
+    def for_listing(self):
+        """Published entries with everything a gallery card needs loaded
+        in a constant number of queries, and the columns it doesn't need
+        left out."""
+        return self.published().select_related(
+            'cover', 'category', 'created_by', 'size',
+        ).prefetch_related(
+            'cover__renditions',
+        ).defer(
+            'description',
+            'category__description',
+            'created_by__password',
+            'created_by__bio',
+        )
+
+    def size_between(self, unit: str = 'cm', **bounds):
+        """Entries whose size is within 'bounds', see
+        DimensionQuerySet.size_between."""
+        from photoblog.models import Dimension
+
+        return self.filter(size__in=Dimension.objects.size_between(
+            unit, **bounds))
+
+    def fits_within(self, height, length, width=None, unit: str = 'cm',
+                    rotate: bool = False):
+        """Entries whose size fits the given space, see
+        DimensionQuerySet.fits_within."""
+        from photoblog.models import Dimension
+
+        return self.filter(size__in=Dimension.objects.fits_within(
+            height, length, width, unit, rotate))
@@ -0,0 +1,249 @@
+"""Resized variants (renditions) of photoblog images.
+
+Renditions are generated once, when an Image is saved (see
+photoblog.ingest), and stored in the same blob storage as the original
+upload. The set of renditions is configured through the
+PHOTOBLOG_RENDITIONS setting, a mapping of rendition name to spec:
+
+    PHOTOBLOG_RENDITIONS = {
+        'thumbnail': {'width': 320, 'quality': 70, 'format': 'JPEG'},
+        ...
+    }
+"""
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image as PILImage
+
+from photoblog import metadata
+from photoblog.storage import release
+
+DEFAULT_RENDITIONS = {
+    'thumbnail': {'width': 320, 'quality': 70, 'format': 'JPEG'},
+    'medium': {'width': 800, 'quality': 80, 'format': 'JPEG'},
+    'large': {'width': 1600, 'quality': 85, 'format': 'JPEG'},
+}
+
+EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'WEBP': 'webp',
+}
+
+
+def get_rendition_specs() -> dict:
+    """Returns the configured rendition specs, smallest width first."""
+    specs = getattr(settings, 'PHOTOBLOG_RENDITIONS', DEFAULT_RENDITIONS)
+    return dict(sorted(specs.items(), key=lambda spec: spec[1]['width']))
+
+
+def rendition_filename(source_name: str, name: str, fmt: str) -> str:
+    """Returns the file name of rendition 'name' of 'source_name'.
+
+    Keyword arguments:
+    source_name -- name of the original file, as stored
+    name -- rendition name, i.e. 'thumbnail'
+    fmt -- Pillow format the rendition is encoded in
+    """
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    return f'{stem}_{name}.{EXTENSIONS.get(fmt.upper(), fmt.lower())}'
+
+
+def render(source, width: int, quality: int = 80, fmt: str = 'JPEG'):
+    """Resizes the image in 'source' to 'width' pixels wide, keeping
+    the aspect ratio, and turns it upright according to its EXIF
+    orientation. Images narrower than 'width' are re-encoded at their
+    own size, never upscaled.
+
+    Returns a tuple of (bytes, width, height).
+
+    Keyword arguments:
+    source -- path or file object of the original image
+    width -- target width in pixels
+    quality -- encoder quality (default 80)
+    fmt -- Pillow format to encode with (default 'JPEG')
+    """
+    fmt = fmt.upper()
+    with PILImage.open(source) as img:
+        orientation = metadata.orientation_of(img)
+        upright = metadata.oriented_size(img.size, orientation)
+        if upright[0] > width:
+            upright = (width, max(1, round(upright[1] * width / upright[0])))
+        size = metadata.oriented_size(upright, orientation)
+        # Lets the JPEG decoder downscale by powers of two while decoding,
+        # which is considerably cheaper than decoding at full size.
+        img.draft('RGB', size)
+        if fmt == 'JPEG' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        if img.size != size:
+            img = img.resize(size, PILImage.LANCZOS)
+        img = metadata.oriented(img, orientation)
+        buffer = io.BytesIO()
+        options = {'quality': quality, 'optimize': True}
+        if fmt == 'JPEG':
+            options['progressive'] = True
+        img.save(buffer, format=fmt, **options)
+        return buffer.getvalue(), img.width, img.height
+
+
+def render_all(source, specs: dict) -> list:
+    """Renders every rendition in 'specs' from the same source image.
+    Only touches the file system, so it can run in a worker process
+    (see photoblog.workers).
+
+    Returns a list of (name, bytes, width, height, format) tuples.
+
+    Keyword arguments:
+    source -- path to the original image, or its contents as bytes
+    specs -- mapping of rendition name to spec
+    """
+    results = []
+    for name, spec in specs.items():
+        fmt = spec.get('format', 'JPEG').upper()
+        data, width, height = render(
+            io.BytesIO(source) if isinstance(source, bytes) else source,
+            spec['width'], spec.get('quality', 80), fmt)
+        results.append((name, data, width, height, fmt))
+    return results
+
+
+def pending_specs(image, force: bool = False) -> dict:
+    """Returns the specs of the renditions 'image' is missing, or whose
+    source file has changed since they were made. Renditions no longer
+    present in the settings are deleted, and those another Image made
+    from the same upload already has are shared instead of rendered
+    again.
+
+    Keyword arguments:
+    image -- photoblog.models.Image instance
+    force -- include up to date renditions as well (default False)
+    """
+    if not image.image:
+        return {}
+    specs = get_rendition_specs()
+    pending = {}
+    existing = {r.name: r for r in image.renditions.all()}
+    for name, spec in specs.items():
+        rendition = existing.pop(name, None)
+        if (rendition is None or force
+                or rendition.source != image.image.name):
+            pending[name] = spec
+    for rendition in existing.values():
+        release(rendition.file)
+        rendition.delete()
+    if pending and not force:
+        for name in share_renditions(image, pending):
+            pending.pop(name)
+    return pending
+
+
+def pending_step(image, force: bool = False):
+    """Ingest step (see photoblog.ingest): the arguments of render_all
+    for the renditions 'image' is missing, or None."""
+    specs = pending_specs(image, force)
+    return {'specs': specs} if specs else None
+
+
+def share_renditions(image, specs: dict) -> list:
+    """Points the renditions of 'image' named in 'specs' at the files of
+    another Image stored in the same blob, when it has them up to date.
+
+    Returns the names of the renditions that were shared.
+
+    Keyword arguments:
+    image -- photoblog.models.Image instance
+    specs -- mapping of rendition name to spec
+    """
+    from photoblog.models import Rendition
+
+    donors = Rendition.objects.filter(
+        image__image=image.image.name, source=image.image.name,
+        name__in=list(specs),
+    ).exclude(image=image)
+    existing = {r.name: r for r in image.renditions.all()}
+    shared = []
+    for donor in donors:
+        if donor.name in shared:
+            continue
+        rendition = existing.get(donor.name)
+        if rendition is None:
+            rendition = Rendition(image=image, name=donor.name)
+        else:
+            release(rendition.file)
+        rendition.file = donor.file.name
+        rendition.source = donor.source
+        rendition.width = donor.width
+        rendition.height = donor.height
+        rendition.format = donor.format
+        rendition.save()
+        shared.append(donor.name)
+    if shared:
+        image.touch()
+    return shared
+
+
+def save_renditions(image, source_name: str, results: list) -> list:
+    """Stores the output of render_all as Rendition objects of 'image',
+    replacing older files. Results made from a file other than the
+    current upload are discarded.
+
+    Returns the list of Rendition objects that were saved.
+
+    Keyword arguments:
+    image -- photoblog.models.Image instance
+    source_name -- name of the file the results were rendered from
+    results -- output of render_all
+    """
+    from photoblog.models import Rendition
+
+    if image.image.name != source_name:
+        return []
+    existing = {r.name: r for r in image.renditions.all()}
+    saved = []
+    for name, data, width, height, fmt in results:
+        rendition = existing.get(name) or Rendition(image=image, name=name)
+        release(rendition.file)
+        rendition.source = source_name
+        rendition.width = width
+        rendition.height = height
+        rendition.format = fmt
+        rendition.file.save(rendition_filename(source_name, name, fmt),
+                            ContentFile(data), save=False)
+        rendition.save()
+        saved.append(rendition)
+    if saved:
+        image.touch()
+    return saved
+
+
+def read_source(image):
+    """Returns what render_all needs to read the upload of 'image': its
+    path on local storages, its contents otherwise."""
+    try:
+        return image.image.path
+    except NotImplementedError:
+        image.image.open('rb')
+        try:
+            return image.image.read()
+        finally:
+            image.image.close()
+
+
+def generate_renditions(image, force: bool = False) -> list:
+    """Creates the configured renditions for 'image' in the current
+    process, replacing any made from a previous upload. Renditions that
+    are already up to date are left alone unless 'force' is set.
+
+    Returns the list of Rendition objects that were (re)created.
+
+    Keyword arguments:
+    image -- photoblog.models.Image instance
+    force -- regenerate up to date renditions as well (default False)
+    """
+    specs = pending_specs(image, force)
+    if not specs:
+        return []
+    results = render_all(read_source(image), specs)
+    return save_renditions(image, image.image.name, results)
@@ -0,0 +1,331 @@
+"""Full-text search over the translated text of the photoblog.
+
+Entries, Stories, Collections, Images and Categories are copied into
+photoblog.models.SearchDocument, one row per object and language, by the
+signal handlers in photoblog.signals. Titles (or names) and the rest of
+the text (descriptions, captions, story text) are indexed separately so
+matches in titles rank higher.
+
+The index itself is database specific and created by migration 0012:
+
+    PostgreSQL -- a tsvector column filled by a trigger, using the text
+                  search configuration of the language of the row
+                  (SEARCH_CONFIGS), with a GIN index on it
+    SQLite -- an FTS5 table, stemming with the porter tokenizer and
+              ignoring accents, kept in sync by triggers
+
+Results are ranked (ts_rank or bm25) and paginated with keyset cursors
+on (rank, id), so later pages cost the same as the first one.
+
+Categories are searchable as soon as they exist. Images only once an
+item they belong to, or are the cover of, is published: their documents
+carry the earliest publication time of those items (IMAGE_RELATIONS),
+refreshed by refresh_images() whenever the items are published,
+unpublished or deleted, or the images are added to or removed from them.
+"""
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone, translation
+
+from photoblog.pagination import InvalidCursor, decode_token, encode_token
+
+# Text search configuration of each language, PostgreSQL only
+SEARCH_CONFIGS = {'en': 'english', 'es': 'spanish'}
+DEFAULT_CONFIG = 'simple'
+DEFAULT_LIMIT = 20
+# Weight of title matches over body matches, SQLite only
+TITLE_WEIGHT = 10.0
+
+# model name -> (title field, body fields)
+FIELDS = {
+    'entry': ('title', ('description',)),
+    'story': ('title', ('description', 'text')),
+    'collection': ('title', ('description',)),
+    'image': ('title', ('caption',)),
+    'category': ('name', ('description',)),
+}
+WORD = re.compile(r'\w+')
+
+# Relations of Image to the items whose publication makes it public: the
+# query name on Image, the item model and the field back on the item
+IMAGE_RELATIONS = (
+    ('entries', 'entry', 'images'),
+    ('stories', 'story', 'images'),
+    ('photoblog_entry', 'entry', 'cover'),
+    ('photoblog_story', 'story', 'cover'),
+    ('photoblog_collection', 'collection', 'cover'),
+)
+
+COLUMNS = 'd.id, d.model, d.object_id, d.language, d.title, d.body, '\
+    'd.published_at'
+POSTGRESQL_QUERY = """
+    SELECT {columns}, ts_rank(d.vector, q.query)::float8 AS rank
+    FROM photoblog_searchdocument d, plainto_tsquery(%s::regconfig, %s) q
+    WHERE d.vector @@ q.query AND {filters}
+"""
+SQLITE_QUERY = """
+    SELECT {columns}, -bm25(photoblog_search_fts, {title_weight}, 1.0) AS rank
+    FROM photoblog_search_fts
+    JOIN photoblog_searchdocument d ON d.id = photoblog_search_fts.rowid
+    WHERE photoblog_search_fts MATCH %s AND {filters}
+"""
+
+
+def searchable_models() -> dict:
+    """Returns the searchable models by model name."""
+    from photoblog.models import Category, Collection, Entry, Image, Story
+
+    return {model._meta.model_name: model
+            for model in (Entry, Story, Collection, Image, Category)}
+
+
+def languages() -> list:
+    return [code for code, _ in settings.LANGUAGES]
+
+
+def translations(instance, field: str) -> dict:
+    """Returns the values of translated 'field' of 'instance' by language.
+    Empty translations fall back to the default language, then to any
+    other translation."""
+    values = {code: getattr(instance, f'{field}_{code}', '') or ''
+              for code in languages()}
+    default = values.get(getattr(settings, 'MODELTRANSLATION_DEFAULT_LANGUAGE',
+                                 settings.LANGUAGE_CODE))
+    fallback = default or next((v for v in values.values() if v), '')
+    return {code: value or fallback for code, value in values.items()}
+
+
+def images_published_at(pks) -> dict:
+    """Returns the time each Image of 'pks' became public, the earliest
+    publication of the items it belongs to or is the cover of, by
+    primary key, in a single query. Images of no published or scheduled
+    item are left out.
+    """
+    from photoblog.models import Image
+
+    if not pks:
+        return {}
+    dates = {}
+    for relation, model_name, field in IMAGE_RELATIONS:
+        model = apps.get_model('photoblog', model_name)
+        dates[f'{relation}_at'] = Subquery(
+            model.objects.filter(**{field: OuterRef('pk'),
+                                    'published_at__isnull': False})
+            .order_by('published_at').values('published_at')[:1])
+    found = {}
+    rows = Image.objects.filter(pk__in=pks).annotate(**dates)\
+        .values('pk', *dates)
+    for row in rows:
+        times = [row[f'{relation}_at'] for relation, _, _ in IMAGE_RELATIONS
+                 if row[f'{relation}_at'] is not None]
+        if times:
+            found[row['pk']] = min(times)
+    return found
+
+
+def images_of(model, pks) -> list:
+    """Returns the primary keys of the Images whose visibility depends on
+    the items 'pks' of 'model'."""
+    from photoblog.models import Image
+
+    model_name = model._meta.model_name
+    query = Q()
+    for relation, related, _ in IMAGE_RELATIONS:
+        if related == model_name:
+            query |= Q(**{f'{relation}__in': list(pks)})
+    if not query:
+        return []
+    return list(Image.objects.filter(query).order_by()
+                .values_list('pk', flat=True).distinct())
+
+
+def refresh_images(pks) -> None:
+    """Copies the time the Images 'pks' became public to their
+    SearchDocuments, with an UPDATE per distinct time."""
+    from photoblog.models import SearchDocument
+
+    pks = list(pks)
+    if not pks:
+        return
+    dates = images_published_at(pks)
+    by_date = {}
+    for pk in pks:
+        by_date.setdefault(dates.get(pk), []).append(pk)
+    for published_at, object_ids in by_date.items():
+        SearchDocument.objects.filter(model='image',
+                                      object_id__in=object_ids)\
+            .update(published_at=published_at)
+
+
+def documents(instance, images: dict = None) -> list:
+    """Returns the unsaved SearchDocuments of 'instance', one per
+    language.
+
+    Keyword arguments:
+    instance -- searchable model instance
+    images -- times Images became public by primary key (default read
+              from the database, see images_published_at())
+    """
+    from photoblog.models import SearchDocument
+
+    model_name = instance._meta.model_name
+    title_field, body_fields = FIELDS[model_name]
+    titles = translations(instance, title_field)
+    bodies = [translations(instance, field) for field in body_fields]
+    if model_name == 'image':
+        if images is None:
+            images = images_published_at([instance.pk])
+        published_at = images.get(instance.pk)
+    else:
+        # Categories are public as soon as they exist
+        published_at = getattr(instance, 'published_at', instance.created_at)
+    return [
+        SearchDocument(
+            model=model_name, object_id=instance.pk, language=language,
+            title=titles[language],
+            body='\n'.join(body[language] for body in bodies).strip(),
+            published_at=published_at)
+        for language in languages()
+    ]
+
+
+def index(instance) -> None:
+    """Adds or refreshes the SearchDocuments of 'instance'."""
+    index_many([instance])
+
+
+def index_many(instances) -> None:
+    """Adds or refreshes the SearchDocuments of 'instances', with a
+    DELETE per model and a single INSERT."""
+    from photoblog.models import SearchDocument
+
+    pks = {}
+    models = {}
+    for instance in instances:
+        pks.setdefault(instance._meta.model_name, []).append(instance.pk)
+        models[instance._meta.model_name] = type(instance)
+    images = images_published_at(pks.get('image', []))
+    with transaction.atomic():
+        for model_name, object_ids in pks.items():
+            SearchDocument.objects.filter(
+                model=model_name, object_id__in=object_ids).delete()
+        SearchDocument.objects.bulk_create(
+            [document for instance in instances
+             for document in documents(instance, images)])
+        # The publication of items decides that of their images
+        for model_name, object_ids in pks.items():
+            refresh_images(images_of(models[model_name], object_ids))
+
+
+def unindex(model, pk: int) -> None:
+    """Removes the SearchDocuments of 'model' 'pk'."""
+    from photoblog.models import SearchDocument
+
+    SearchDocument.objects.filter(model=model._meta.model_name,
+                                  object_id=pk).delete()
+
+
+def update_published(model, pks, when) -> None:
+    """Copies a published_at set with update(), which sends no signals,
+    to the SearchDocuments of 'model' 'pks'."""
+    from photoblog.models import SearchDocument
+
+    SearchDocument.objects.filter(model=model._meta.model_name,
+                                  object_id__in=pks)\
+        .update(published_at=when)
+    refresh_images(images_of(model, pks))
+
+
+def rebuild(batch_size: int = 500) -> int:
+    """Reindexes every searchable object, 'batch_size' objects at a
+    time. Returns the number of objects indexed."""
+    from photoblog.models import SearchDocument
+
+    SearchDocument.objects.all().delete()
+    total = 0
+    for model in searchable_models().values():
+        queryset = model.objects.order_by('pk')
+        last = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last)[:batch_size])
+            if not batch:
+                break
+            index_many(batch)
+            total += len(batch)
+            last = batch[-1].pk
+    return total
+
+
+def match_expression(query: str) -> str:
+    """Returns 'query' as an FTS5 expression matching every word of it.
+    Words are quoted so FTS5 operators in 'query' are taken literally."""
+    return ' '.join(f'"{word}"' for word in WORD.findall(query))
+
+
+def search(query: str, language: str = None, models=None,
+           cursor: str = None, limit: int = DEFAULT_LIMIT) -> tuple:
+    """Returns the published SearchDocuments in 'language' matching every
+    word of 'query', best first, and the cursor to the next page or None.
+    Each document has its 'rank' set.
+
+    Raises InvalidCursor if 'cursor' is malformed.
+
+    Keyword arguments:
+    query -- words to look for, as typed by the user
+    language -- language code (default the active language)
+    models -- model names to search, e.g. ['entry'] (default all)
+    cursor -- cursor returned with the previous page (default None)
+    limit -- maximum number of documents (default 20)
+    """
+    from photoblog.models import SearchDocument
+
+    language = language or translation.get_language()
+    filters = ['d.language = %s', 'd.published_at <= %s']
+    params = [language,
+              connection.ops.adapt_datetimefield_value(timezone.now())]
+    if models:
+        filters.append('d.model IN ({})'.format(
+            ', '.join(['%s'] * len(models))))
+        params.extend(models)
+    if connection.vendor == 'postgresql':
+        if not query.strip():
+            return [], None
+        inner = POSTGRESQL_QUERY
+        params = [SEARCH_CONFIGS.get(language, DEFAULT_CONFIG), query] \
+            + params
+    else:
+        expression = match_expression(query)
+        if not expression:
+            return [], None
+        inner = SQLITE_QUERY
+        params = [expression] + params
+    inner = inner.format(columns=COLUMNS, title_weight=TITLE_WEIGHT,
+                         filters=' AND '.join(filters))
+    keyset = ''
+    if cursor:
+        rank, pk = _decode(cursor)
+        keyset = 'WHERE rank < %s OR (rank = %s AND id > %s)'
+        params.extend([rank, rank, pk])
+    sql = f'SELECT * FROM ({inner}) AS results {keyset} ' \
+          f'ORDER BY rank DESC, id LIMIT %s'
+    params.append(limit + 1)
+    results = list(SearchDocument.objects.raw(sql, params))
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = encode_token([results[-1].rank, results[-1].pk])
+    return results, next_cursor
+
+
+def _decode(cursor: str) -> tuple:
+    values = decode_token(cursor)
+    if not isinstance(values, list) or len(values) != 2 \
+            or not isinstance(values[0], (int, float)) \
+            or not isinstance(values[1], int) \
+            or isinstance(values[1], bool):
+        raise InvalidCursor(cursor)
+    return float(values[0]), values[1]
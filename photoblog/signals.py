@@ -0,0 +1,174 @@
+"""Signal handlers keeping photoblog.cache, photoblog.autocomplete,
+photoblog.facets and photoblog.search up to date."""
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from photoblog import autocomplete, cache, facets, search
+from photoblog.models import (Category, Collection, Dimension, Entry, Image,
+                              Item, Rendition)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def item_changed(sender, instance, **kwargs):
+    if issubclass(sender, Item):
+        cache.invalidate(sender, [instance.pk])
+
+
+# Before deletion, while the covers still point at the image
+@receiver(post_save, sender=Image)
+@receiver(pre_delete, sender=Image)
+def image_changed(sender, instance, **kwargs):
+    cache.invalidate_image(instance.pk)
+
+
+@receiver(post_save, sender=Rendition)
+@receiver(post_delete, sender=Rendition)
+def rendition_changed(sender, instance, **kwargs):
+    cache.invalidate_image(instance.image_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    cache.invalidate_category(instance.pk)
+
+
+@receiver(m2m_changed, sender=Image.entries.through)
+@receiver(m2m_changed, sender=Image.stories.through)
+@receiver(m2m_changed, sender=Entry.collections.through)
+def relation_changed(sender, instance, action, model, pk_set,
+                     **kwargs):
+    """Invalidates the items on both sides of a changed relation. Clears
+    are handled before the fact, while the related rows can be found."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if isinstance(instance, Item):
+        cache.invalidate(type(instance), [instance.pk])
+    if not issubclass(model, Item):
+        return
+    if action == 'pre_clear':
+        pk_set = sender.objects.filter(
+            **{instance._meta.model_name: instance.pk}
+        ).values_list(model._meta.model_name, flat=True)
+    cache.invalidate(model, pk_set)
+
+
+@receiver(post_save)
+def searchable_saved(sender, instance, **kwargs):
+    if not issubclass(sender, (Item, Image, Category)) or kwargs['raw']:
+        return
+    if kwargs['update_fields'] and \
+            kwargs['update_fields'] <= {'published_at', 'version'}:
+        # publish() and un_publish(): the text is unchanged
+        search.update_published(sender, [instance.pk], instance.published_at)
+    else:
+        search.index(instance)
+
+
+@receiver(post_delete)
+def searchable_deleted(sender, instance, **kwargs):
+    if issubclass(sender, (Item, Image, Category)):
+        search.unindex(sender, instance.pk)
+
+
+@receiver(m2m_changed, sender=Image.entries.through)
+@receiver(m2m_changed, sender=Image.stories.through)
+def image_relation_changed(sender, instance, action, pk_set, **kwargs):
+    """Refreshes when the images of a changed relation became public.
+    Cleared images are looked up before the fact, refreshed after it.
+    Drafts make no image public, so their changes are skipped."""
+    if isinstance(instance, Image):
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            search.refresh_images([instance.pk])
+    elif instance.published_at is None:
+        return
+    elif action in ('post_add', 'post_remove'):
+        search.refresh_images(pk_set)
+    elif action == 'pre_clear':
+        instance._cleared_images = list(sender.objects.filter(
+            **{instance._meta.model_name: instance.pk}
+        ).values_list('image', flat=True))
+    elif action == 'post_clear':
+        search.refresh_images(instance.__dict__.pop('_cleared_images', []))
+
+
+# The images of a deleted item are found before, refreshed after the fact
+@receiver(pre_delete)
+def item_deleting(sender, instance, **kwargs):
+    if issubclass(sender, Item):
+        instance._shown_images = search.images_of(sender, [instance.pk])
+
+
+@receiver(post_delete)
+def item_deleted(sender, instance, **kwargs):
+    if issubclass(sender, Item):
+        search.refresh_images(instance.__dict__.pop('_shown_images', []))
+
+
+@receiver(post_save, sender=Entry)
+def entry_saved(sender, instance, **kwargs):
+    if not kwargs['raw']:
+        facets.refresh([instance.pk])
+
+
+@receiver(pre_delete, sender=Entry)
+def entry_deleted(sender, instance, **kwargs):
+    facets.forget([instance.pk])
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    facets.drop('category', instance.pk)
+
+
+@receiver(pre_delete, sender=Collection)
+def collection_deleted(sender, instance, **kwargs):
+    facets.drop('collection', instance.pk)
+
+
+@receiver(m2m_changed, sender=Entry.collections.through)
+def collections_changed(sender, instance, action, pk_set, **kwargs):
+    if isinstance(instance, Entry):
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            facets.refresh([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        facets.refresh(pk_set)
+    elif action == 'pre_clear':
+        facets.drop('collection', instance.pk)
+
+
+def resized(pks: list, **changes) -> None:
+    """Applies 'changes' to Entries 'pks' whose size changed, bumping
+    their versions, and refreshes what depends on them: update() sends
+    no signals."""
+    Entry.objects.filter(pk__in=pks).update(version=F('version') + 1,
+                                            **changes)
+    cache.invalidate(Entry, pks)
+    facets.refresh(pks)
+
+
+@receiver(post_save, sender=Dimension)
+def dimension_saved(sender, instance, **kwargs):
+    if not kwargs['raw']:
+        resized(list(instance.entries.values_list('pk', flat=True)))
+
+
+@receiver(pre_delete, sender=Dimension)
+def dimension_deleted(sender, instance, **kwargs):
+    # What SET_NULL would do, but only after the signal
+    resized(list(instance.entries.values_list('pk', flat=True)), size=None)
+
+
+@receiver(post_save)
+def suggestion_saved(sender, instance, **kwargs):
+    if issubclass(sender, (Item, Category)) and not kwargs['raw']:
+        autocomplete.update(instance)
+
+
+@receiver(post_delete)
+def suggestion_deleted(sender, instance, **kwargs):
+    if issubclass(sender, (Item, Category)):
+        autocomplete.remove(sender, instance.pk)
@@ -0,0 +1,357 @@
+"""Visual similarity of images, for "more like this".
+
+Every Image gets a compact feature vector at ingest (see
+photoblog.ingest), stored as FEATURE_SIZE packed bytes in Image.features:
+
+    64 bytes -- color histogram, 4 levels per RGB channel, as the square
+                root of the share of each bin scaled to 0-255, so the
+                Euclidean distance between two of them is the Hellinger
+                distance of the histograms
+    8 bytes -- perceptual hash (pHash): signs of the low frequencies of
+               the DCT of a 32x32 grayscale thumbnail
+    8 bytes -- difference hash (dHash): gradients of a 9x8 grayscale
+               thumbnail
+
+The distance between two images mixes the color distance and the share
+of differing hash bits, both between 0 and 1.
+
+Queries scan every vector at once with NumPy, from an index file
+memory-mapped from disk, so the OS page cache keeps it in memory across
+processes. The index is written by the build_similarity_index command,
+its modification time set to when it started reading the database. The
+images whose features changed since, per Image.features_changed_at, are
+read from the database and scanned alongside, in place of their rows of
+the index: new ingests in any order, re-ingests and replaced uploads.
+Without NumPy, or before the index is first built, every vector is read
+from the database and scanned in plain Python.
+
+Settings:
+
+    PHOTOBLOG_SIMILARITY_INDEX -- path to the index file (default
+                                  MEDIA_ROOT/similarity/index.npy)
+    PHOTOBLOG_SIMILARITY_COLOR_WEIGHT -- weight of colors against shapes
+                                         in distances (default 0.5)
+"""
+import datetime
+import io
+import math
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from photoblog import duplicates, metadata
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+LEVELS = 4
+BINS = LEVELS ** 3
+HASH_BITS = 128
+FEATURE_SIZE = BINS + HASH_BITS // 8
+THUMBNAIL_SIZE = 64
+PHASH_SIZE = 32
+PHASH_FREQUENCIES = 8
+# Largest Hellinger distance, scaled like the histograms
+COLOR_SCALE = 255 * math.sqrt(2)
+
+# cos((2x + 1) u pi / 2N) for the DCT of the pHash thumbnail
+_COSINES = [[math.cos((2 * x + 1) * u * math.pi / (2 * PHASH_SIZE))
+             for u in range(PHASH_FREQUENCIES)] for x in range(PHASH_SIZE)]
+_POPCOUNT = [bin(i).count('1') for i in range(256)]
+if numpy is not None:
+    # Colors as floats with their squared norms, so that distances come
+    # from a single matrix product; hashes as two 64 bit words
+    DTYPE = numpy.dtype([('id', '<i8'), ('colors', '<f4', (BINS,)),
+                         ('norms', '<f4'), ('hashes', '<u8', (2,))])
+
+_lock = threading.Lock()
+_loaded = {'path': None, 'mtime': None, 'index': None}
+
+
+def index_path() -> str:
+    return getattr(settings, 'PHOTOBLOG_SIMILARITY_INDEX',
+                   os.path.join(settings.MEDIA_ROOT, 'similarity',
+                                'index.npy'))
+
+
+def color_weight() -> float:
+    return getattr(settings, 'PHOTOBLOG_SIMILARITY_COLOR_WEIGHT', 0.5)
+
+
+def color_histogram(img) -> bytes:
+    """Returns the packed color histogram of RGB image 'img'."""
+    shift = 8 - int(math.log2(LEVELS))
+    counts = [0] * BINS
+    for r, g, b in img.getdata():
+        counts[((r >> shift) * LEVELS + (g >> shift)) * LEVELS
+               + (b >> shift)] += 1
+    total = sum(counts)
+    return bytes(round(math.sqrt(count / total) * 255) for count in counts)
+
+
+def phash(img) -> int:
+    """Returns the 64 bit perceptual hash of grayscale image 'img'."""
+    pixels = list(img.resize((PHASH_SIZE, PHASH_SIZE),
+                             PILImage.LANCZOS).getdata())
+    rows = [pixels[y * PHASH_SIZE:(y + 1) * PHASH_SIZE]
+            for y in range(PHASH_SIZE)]
+    # The DCT is separable: along the rows, then along the columns
+    partial = [[sum(row[x] * _COSINES[x][u] for x in range(PHASH_SIZE))
+                for u in range(PHASH_FREQUENCIES)] for row in rows]
+    coefficients = [sum(partial[y][u] * _COSINES[y][v]
+                        for y in range(PHASH_SIZE))
+                    for v in range(PHASH_FREQUENCIES)
+                    for u in range(PHASH_FREQUENCIES)]
+    # The DC coefficient only says how bright the image is
+    median = sorted(coefficients[1:])[len(coefficients) // 2 - 1]
+    return _bits(c > median for c in coefficients)
+
+
+def dhash(img) -> int:
+    """Returns the 64 bit difference hash of grayscale image 'img'."""
+    pixels = list(img.resize((9, 8), PILImage.LANCZOS).getdata())
+    return _bits(pixels[y * 9 + x] > pixels[y * 9 + x + 1]
+                 for y in range(8) for x in range(8))
+
+
+def _bits(flags) -> int:
+    value = 0
+    for flag in flags:
+        value = (value << 1) | bool(flag)
+    return value
+
+
+def compute(source) -> bytes:
+    """Returns the packed feature vector of the image in 'source', turned
+    upright according to its EXIF orientation.
+
+    Keyword arguments:
+    source -- path to the image, or its contents as bytes
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with PILImage.open(source) as img:
+        orientation = metadata.orientation_of(img)
+        img.draft('RGB', (THUMBNAIL_SIZE * 4, THUMBNAIL_SIZE * 4))
+        img = metadata.oriented(img.convert('RGB'), orientation)
+        thumbnail = img.resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE),
+                               PILImage.BILINEAR)
+        gray = img.convert('L')
+    return color_histogram(thumbnail) \
+        + phash(gray).to_bytes(8, 'big') + dhash(gray).to_bytes(8, 'big')
+
+
+def hashes(features: bytes) -> tuple:
+    """Returns the (pHash, dHash) of packed 'features'."""
+    return (int.from_bytes(features[BINS:BINS + 8], 'big'),
+            int.from_bytes(features[BINS + 8:], 'big'))
+
+
+def distance(a: bytes, b: bytes) -> float:
+    """Returns the distance between packed features 'a' and 'b', from 0
+    for identical images to 1."""
+    color = math.sqrt(sum((x - y) ** 2 for x, y in zip(a[:BINS], b[:BINS])))
+    bits = sum(_POPCOUNT[x ^ y] for x, y in zip(a[BINS:], b[BINS:]))
+    weight = color_weight()
+    return weight * color / COLOR_SCALE + (1 - weight) * bits / HASH_BITS
+
+
+def to_record(pk: int, features: bytes) -> tuple:
+    """Returns the row of the index of Image 'pk' with packed
+    'features'."""
+    colors = numpy.frombuffer(features[:BINS], dtype=numpy.uint8)\
+        .astype(numpy.float32)
+    return pk, colors, colors @ colors, hashes(features)
+
+
+def popcount(words):
+    """Returns the number of bits set in each of the 64 bit 'words'."""
+    words = words - ((words >> 1) & 0x5555555555555555)
+    words = (words & 0x3333333333333333) \
+        + ((words >> 2) & 0x3333333333333333)
+    words = (words + (words >> 4)) & 0x0f0f0f0f0f0f0f0f
+    return (words * 0x0101010101010101) >> 56
+
+
+def distances(index, features: bytes):
+    """Returns the distances between packed 'features' and every row of
+    'index', an array of DTYPE, as an array."""
+    _, colors, norm, target = to_record(0, features)
+    squares = index['norms'] + norm - 2 * (index['colors'] @ colors)
+    color = numpy.sqrt(numpy.maximum(squares, 0, out=squares))
+    bits = popcount(index['hashes'] ^ numpy.array(target, dtype=numpy.uint64))\
+        .sum(axis=1)
+    weight = color_weight()
+    return weight / COLOR_SCALE * color + (1 - weight) / HASH_BITS * bits
+
+
+def build_index(path: str = None, batch_size: int = 2000) -> int:
+    """Writes the features of every ingested Image to the index file at
+    'path' (default index_path()), replacing it at once. The file is
+    dated from when the build started, so that the features changed
+    while reading are scanned from the database too. Returns the number
+    of images indexed.
+
+    Raises RuntimeError if NumPy isn't installed.
+    """
+    from photoblog.models import Image
+
+    if numpy is None:
+        raise RuntimeError('NumPy is required to build the similarity '
+                           'index, install it with "pip install numpy"')
+    path = path or index_path()
+    started = time.time()
+    rows = Image.objects.exclude(features=None).order_by('pk')\
+        .values_list('pk', 'features')
+    index = numpy.zeros(rows.count(), dtype=DTYPE)
+    count = 0
+    for pk, features in rows.iterator(chunk_size=batch_size):
+        if count == len(index):
+            # Ingested while reading
+            break
+        index[count] = to_record(pk, bytes(features))
+        count += 1
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(prefix='.tmp-', suffix='.npy',
+                                     dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            numpy.save(output, index[:count])
+        os.utime(temporary, (started, started))
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return count
+
+
+def load_index():
+    """Returns the index file memory-mapped, or None if there is none.
+    The mapping is shared by the threads of the process and replaced
+    when the file is."""
+    return _load_index()[0]
+
+
+def _load_index():
+    # The index with the time its build started, or (None, None)
+    if numpy is None:
+        return None, None
+    path = index_path()
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None, None
+    with _lock:
+        if _loaded['path'] != path or _loaded['mtime'] != mtime:
+            _loaded['index'] = numpy.load(path, mmap_mode='r')
+            _loaded['path'], _loaded['mtime'] = path, mtime
+        return _loaded['index'], mtime
+
+
+def nearest(features: bytes, count: int, exclude: int = None) -> list:
+    """Returns the (distance, pk) of the 'count' Images closest to
+    packed 'features', closest first.
+
+    Keyword arguments:
+    features -- packed features to compare to
+    count -- number of images
+    exclude -- primary key of an image to leave out (default None)
+    """
+    from photoblog.models import Image
+
+    features = bytes(features)
+    index, built_at = _load_index()
+    if index is None:
+        changed = Image.objects.exclude(features=None)
+    else:
+        since = datetime.datetime.fromtimestamp(built_at, timezone.utc)
+        newest = int(index['id'].max()) if len(index) else 0
+        # Changed since the index was built, or ingested before changes
+        # were dated
+        changed = Image.objects.filter(
+            Q(features_changed_at__gte=since) | Q(pk__gt=newest))
+    found = []
+    stale = set()
+    for pk, other in changed.values_list('pk', 'features').iterator():
+        stale.add(pk)
+        if other is not None:
+            found.append((distance(features, bytes(other)), pk))
+    if index is not None and len(index):
+        found_distances = distances(index, features)
+        # Room for the rows replaced from the database
+        wanted = min(count + 1 + len(stale), len(index))
+        top = numpy.argpartition(found_distances, wanted - 1)[:wanted]
+        found += [(float(found_distances[i]), int(index['id'][i]))
+                  for i in top if int(index['id'][i]) not in stale]
+    return sorted(item for item in found if item[1] != exclude)[:count]
+
+
+def similar_images(image, count: int) -> list:
+    """Returns the 'count' Images looking the most like 'image', most
+    similar first. Images deleted since the index was built are left
+    out."""
+    from photoblog.models import Image
+
+    if image.features is None:
+        return []
+    # Room for images deleted since the index was built
+    found = nearest(image.features, count * 2, exclude=image.pk)
+    images = Image.objects.in_bulk([pk for _, pk in found])
+    return [images[pk] for _, pk in found if pk in images][:count]
+
+
+def similar_entries(entry_id: int, cover_id: int, count: int) -> list:
+    """Returns up to 'count' published Entries whose covers look the most
+    like Image 'cover_id', most similar first, leaving out Entry
+    'entry_id'."""
+    from photoblog.models import Entry, Image
+
+    features = Image.objects.filter(pk=cover_id)\
+        .values_list('features', flat=True).first()
+    if features is None:
+        return []
+    order = {pk: rank for rank, (_, pk) in enumerate(
+        nearest(features, count * 4, exclude=cover_id))}
+    entries = Entry.objects.for_listing().filter(cover_id__in=list(order))\
+        .exclude(pk=entry_id)
+    return sorted(entries, key=lambda entry: order[entry.cover_id])[:count]
+
+
+def pending_step(image, force: bool = False):
+    """Ingest step: the arguments of compute if 'image' has no features
+    yet, or None. Copies the features of another Image stored in the
+    same blob when there is one."""
+    from photoblog.models import Image
+
+    if image.features is not None and not force:
+        return None
+    if not force:
+        twin = Image.objects.filter(image=image.image.name)\
+            .exclude(pk=image.pk).exclude(features=None)\
+            .values_list('features', flat=True).first()
+        if twin is not None:
+            save_features(image, image.image.name, bytes(twin))
+            return None
+    return {}
+
+
+def save_features(image, source_name: str, features: bytes) -> None:
+    """Stores the output of compute on 'image', unless its upload was
+    replaced since, and checks it for near-duplicates."""
+    from photoblog.models import Image
+
+    changed_at = timezone.now()
+    if Image.objects.filter(pk=image.pk, image=source_name)\
+            .update(features=features, features_changed_at=changed_at):
+        image.features = features
+        image.features_changed_at = changed_at
+        duplicates.record(image, hashes(features)[0])
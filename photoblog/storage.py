@@ -0,0 +1,92 @@
+"""Content addressed storage for photoblog images.
+
+Uploads are stored under the SHA-256 digest of their contents, so a photo
+uploaded twice is only written once. The digest is computed while the
+upload is streamed to disk, without reading it into memory. Rows pointing
+at the same blob share it; the blob is deleted along with the last of
+them (see release()).
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIRECTORY = 'blobs'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage saving files as blobs/ab/cd/abcd...<ext>, where
+    abcd... is the SHA-256 digest of the file. Only the extension of the
+    name asked for is kept."""
+
+    def get_available_name(self, name, max_length=None):
+        # Names are digests: an existing file has the same contents.
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()
+        tmp_dir = self.path(os.path.join(BLOB_DIRECTORY, 'tmp'))
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            name = blob_name(digest.hexdigest(), ext)
+            path = self.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                # Atomic, so concurrent uploads of the same blob are safe.
+                os.replace(tmp_path, path)
+                # mkstemp creates the file readable by its owner only.
+                os.chmod(path, self.file_permissions_mode or 0o644)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name.replace('\\', '/')
+
+
+def blob_name(digest: str, ext: str = '') -> str:
+    """Returns the storage name of the blob with SHA-256 'digest'."""
+    return os.path.join(BLOB_DIRECTORY, digest[:2], digest[2:4],
+                        f'{digest}{ext}')
+
+
+def digest_of(name: str) -> str:
+    """Returns the digest of blob 'name', or '' if it isn't a blob."""
+    if not name or not name.startswith(BLOB_DIRECTORY + '/'):
+        return ''
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def release(fieldfile) -> bool:
+    """Deletes the file of 'fieldfile', an Image.image or Rendition.file,
+    unless other Image or Rendition rows still reference it. Returns True
+    if the file was deleted.
+    """
+    from photoblog.models import Image, Rendition
+
+    if not fieldfile:
+        return False
+    instance = fieldfile.instance
+    images = Image.objects.filter(image=fieldfile.name)
+    renditions = Rendition.objects.filter(file=fieldfile.name)
+    if isinstance(instance, Image):
+        images = images.exclude(pk=instance.pk)
+    else:
+        renditions = renditions.exclude(pk=instance.pk)
+    if images.exists() or renditions.exists():
+        return False
+    fieldfile.delete(save=False)
+    return True
+
+
+blob_storage = ContentAddressedStorage()
@@ -0,0 +1,26 @@
+"""Template filter to display Dimension sizes in a given unit. Single
+sizes can use Dimension.display_as_unit() instead."""
+from django import template
+
+from photoblog import units
+
+register = template.Library()
+
+
+@register.filter
+def with_sizes(items, unit):
+    """Pairs every Entry (or Dimension) of 'items' with its size
+    formatted in 'unit', converting all the sizes at once. Items without
+    a size get ''. Select the sizes of entries along with them,
+    e.g. with select_related('size').
+
+    Usage: {% for entry, size in entry_list|with_sizes:'cm' %}
+    """
+    items = list(items)
+    dimensions = [getattr(item, 'size', item) for item in items]
+    known = [d for d in dimensions if d]
+    sizes = iter(units.convert_dimensions(known, unit))
+    return [
+        (item, units.format_size(*next(sizes), unit) if dimension else '')
+        for item, dimension in zip(items, dimensions)
+    ]
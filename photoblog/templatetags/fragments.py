@@ -0,0 +1,59 @@
+"""Template tags caching fragments of templates by object version."""
+from django import template
+from django.utils.translation import get_language
+
+from photoblog import cache
+
+register = template.Library()
+
+
+def fragment_key(name: str, objects, language: str) -> str:
+    """Returns the cache key of fragment 'name' rendering 'objects', a
+    list of Item or Image instances (or None) with a version field."""
+    parts = [
+        f'{obj._meta.label_lower}.{obj.pk}.{obj.version}'
+        if obj else 'none'
+        for obj in objects
+    ]
+    return 'photoblog:fragment:{}:{}:{}'.format(name, ':'.join(parts),
+                                                 language)
+
+
+class VersionedCacheNode(template.Node):
+    def __init__(self, nodelist, name, objects):
+        self.nodelist = nodelist
+        self.name = name
+        self.objects = objects
+
+    def render(self, context):
+        key = fragment_key(self.name.resolve(context),
+                           [obj.resolve(context) for obj in self.objects],
+                           get_language())
+        backend = cache.get_cache()
+        content = backend.get(key)
+        if content is None:
+            content = self.nodelist.render(context)
+            backend.set(key, content, timeout=cache.cache_timeout())
+        return content
+
+
+@register.tag
+def versioned_cache(parser, token):
+    """Caches the enclosed fragment until one of the objects it shows
+    changes, in every language. Objects are keyed on their model,
+    primary key and version, so there is nothing to invalidate.
+
+    Usage:
+
+        {% versioned_cache 'card' entry entry.cover %}
+            ...
+        {% endversioned_cache %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' takes a fragment name and at least one object")
+    nodelist = parser.parse(('endversioned_cache',))
+    parser.delete_first_token()
+    return VersionedCacheNode(nodelist, parser.compile_filter(bits[1]),
+                              [parser.compile_filter(b) for b in bits[2:]])
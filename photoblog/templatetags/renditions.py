@@ -0,0 +1,24 @@
+"""Template tags to render photoblog image renditions."""
+from django import template
+
+register = template.Library()
+
+
+@register.simple_tag
+def rendition_url(image, name):
+    """Returns the url of rendition 'name' of 'image', falling back to
+    the original upload when the rendition does not exist. 'image' is
+    either an Image or an image serialized by photoblog.cache.
+
+    Usage: {% rendition_url entry.cover 'medium' %}
+    """
+    if not image:
+        return ''
+    if isinstance(image, dict):
+        return image['renditions'].get(name) or image['url']
+    rendition = image.get_rendition(name)
+    if rendition is not None:
+        return rendition.file.url
+    if image.image:
+        return image.image.url
+    return ''
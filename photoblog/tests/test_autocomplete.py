@@ -0,0 +1,158 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for search-as-you-type suggestions."""
+import datetime
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from photoblog import autocomplete, cache
+from photoblog.models import Category, Collection, Entry
+from accounts.models import User
+
+
+class PrefixIndexTests(TestCase):
+    """Unit tests for PrefixIndex."""
+
+    def test_any_word_prefix_matches(self):
+        index = autocomplete.PrefixIndex([
+            ('entry', 1, 'Over the Sea', None),
+            ('entry', 2, 'Seagulls', None),
+            ('entry', 3, 'Mountains', None),
+        ])
+        self.assertEqual([pk for _, pk, _ in index.lookup('sea', 10)],
+                         [1, 2])
+        self.assertEqual([pk for _, pk, _ in index.lookup('the s', 10)], [1])
+        self.assertEqual(index.lookup('', 10), [])
+        self.assertEqual(len(index.lookup('s', 1)), 1)
+
+    def test_accents_and_case_are_ignored(self):
+        index = autocomplete.PrefixIndex([('entry', 1, 'Árbol Rojo', None)])
+        self.assertEqual(index.lookup('ARB', 10), [('entry', 1, 'Árbol Rojo')])
+        self.assertEqual(index.lookup('rojo', 10), [('entry', 1, 'Árbol Rojo')])
+
+    def test_add_and_remove(self):
+        index = autocomplete.PrefixIndex()
+        index.add('entry', 1, 'Sunset', None)
+        index.add('entry', 1, 'Sunrise', None)
+        self.assertEqual(index.lookup('sun', 10), [('entry', 1, 'Sunrise')])
+        index.remove('entry', 1)
+        self.assertEqual(index.lookup('sun', 10), [])
+        self.assertEqual(index.keys, [])
+
+    def test_scheduled_items_are_hidden_until_published(self):
+        later = timezone.now() + datetime.timedelta(hours=1)
+        index = autocomplete.PrefixIndex([('entry', 1, 'Sunset', later)])
+        self.assertEqual(index.lookup('sun', 10), [])
+        self.assertEqual(
+            len(index.lookup('sun', 10, later + datetime.timedelta(1))), 1)
+
+
+class AutocompleteTests(TestCase):
+    """Unit tests for the suggestions of photoblog.autocomplete."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+
+    def setUp(self):
+        cache.get_cache().clear()
+        autocomplete.reset()
+
+    def create_entry(self, title, published=True, **kwargs):
+        entry = Entry.objects.create(title_en=title, created_by=self.user,
+                                     **kwargs)
+        if published:
+            entry.publish(timezone.now() - datetime.timedelta(minutes=1))
+        return entry
+
+    def labels(self, prefix, language='en'):
+        return [s['label'] for s in autocomplete.suggest(prefix, language)]
+
+    def test_suggests_published_titles_and_categories(self):
+        self.create_entry('Sunset')
+        self.create_entry('Sunday draft', published=False)
+        Category.objects.create(name_en='Sunny paintings',
+                                created_by=self.user)
+        self.assertEqual(self.labels('sun'), ['Sunny paintings', 'Sunset'])
+
+    def test_suggests_in_each_language(self):
+        self.create_entry('Sunset', title_es='Atardecer')
+        self.assertEqual(self.labels('ata', 'es'), ['Atardecer'])
+        self.assertEqual(self.labels('ata', 'en'), [])
+        # Untranslated titles fall back to the default language
+        self.create_entry('Seascape')
+        self.assertEqual(self.labels('sea', 'es'), ['Seascape'])
+
+    def test_served_from_memory(self):
+        self.create_entry('Sunset')
+        self.labels('sun')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels('sun'), ['Sunset'])
+
+    def test_changes_are_applied_in_place(self):
+        entry = self.create_entry('Sunset')
+        self.labels('sun')
+        with self.assertNumQueries(0):
+            entry.title_en = 'Moonrise'
+            autocomplete.update(entry)
+            self.assertEqual(self.labels('moon'), ['Moonrise'])
+        entry.save()
+        entry.un_publish()
+        self.assertEqual(self.labels('moon'), [])
+        Entry.objects.filter(pk=entry.pk).publish_bulk()
+        self.assertEqual(self.labels('moon'), ['Moonrise'])
+        entry.delete()
+        self.assertEqual(self.labels('moon'), [])
+
+    @override_settings(PHOTOBLOG_AUTOCOMPLETE_INTERVAL=0)
+    def test_changes_by_other_processes_trigger_a_rebuild(self):
+        collection = Collection.objects.create(title_en='Summer',
+                                               created_by=self.user)
+        self.labels('sum')
+        Collection.objects.filter(pk=collection.pk).update(
+            published_at=timezone.now())
+        self.assertEqual(self.labels('sum'), [])
+        # A change missing from the log
+        cache.get_cache().incr(autocomplete.VERSION_KEY)
+        self.assertEqual(self.labels('sum'), ['Summer'])
+
+    @override_settings(PHOTOBLOG_AUTOCOMPLETE_INTERVAL=0)
+    def test_changes_by_other_processes_are_patched_in(self):
+        collection = Collection.objects.create(title_en='Summer',
+                                               created_by=self.user)
+        self.create_entry('Sunset')
+        self.labels('sum')
+        Collection.objects.filter(pk=collection.pk).update(
+            published_at=timezone.now())
+        # What the signal handlers of another process would do
+        backend = cache.get_cache()
+        version = backend.incr(autocomplete.VERSION_KEY)
+        backend.set(autocomplete.CHANGE_KEY.format(version=version),
+                    [('collection', collection.pk)])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.labels('su'), ['Summer', 'Sunset'])
+
+    def test_other_processes_are_checked_at_intervals(self):
+        collection = Collection.objects.create(title_en='Summer',
+                                               created_by=self.user)
+        self.labels('sum')
+        Collection.objects.filter(pk=collection.pk).update(
+            published_at=timezone.now())
+        cache.get_cache().incr(autocomplete.VERSION_KEY)
+        self.assertEqual(self.labels('sum'), [])
+        with override_settings(PHOTOBLOG_AUTOCOMPLETE_INTERVAL=0):
+            self.assertEqual(self.labels('sum'), ['Summer'])
+
+    def test_suggestions_view(self):
+        entry = self.create_entry('Sunset')
+        with translation.override('en'):
+            url = reverse('gallery:autocomplete')
+        self.client.get(url, {'q': 'sun'})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'q': 'sun'})
+        self.assertEqual(response.json(), {'results': [{
+            'label': 'Sunset', 'model': 'entry', 'id': entry.pk,
+            'url': reverse('gallery:entry-detail', args=[entry.pk]),
+        }]})
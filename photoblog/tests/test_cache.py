@@ -0,0 +1,221 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for the read-through cache of published items."""
+import datetime
+import os
+import time
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from photoblog import cache
+from photoblog.models import Category, Collection, Entry, Image
+from accounts.models import User
+
+IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/diy.jpg')
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0)
+class ItemCacheTests(TestCase):
+    """Unit tests for photoblog.cache."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+        cls.category = Category.objects.create(name='Oil paintings',
+                                               created_by=cls.user)
+
+    def setUp(self):
+        cache.get_cache().clear()
+        cache.reset_stats()
+        self.entry = Entry.objects.create(title='Entry', category=self.category,
+                                          created_by=self.user)
+        self.entry.set_cover_image(Image(
+            title='Cover', caption='Caption', created_by=self.user,
+            image=SimpleUploadedFile(name='cover.jpg',
+                                     content=open(IMAGE_PATH, 'rb').read(),
+                                     content_type='image/jpeg')))
+        self.entry.publish(timezone.now())
+
+    def test_item_is_read_through(self):
+        with self.assertNumQueries(3):
+            data = cache.get_item(Entry, self.entry.pk, 'en')
+        self.assertEqual(data['title'], 'Entry')
+        self.assertEqual(data['category']['name'], 'Oil paintings')
+        self.assertEqual(data['cover']['caption'], 'Caption')
+        self.assertIn('medium', data['cover']['renditions'])
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get_item(Entry, self.entry.pk, 'en'), data)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1,
+                                         'ratio': 0.5})
+
+    def test_check_shared_cache(self):
+        self.assertEqual([w.id for w in cache.check_shared_cache()],
+                         ['photoblog.W001'])
+        with override_settings(CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.'
+                                       'LocMemCache'},
+                'shared': {'BACKEND': 'django.core.cache.backends.db.'
+                                      'DatabaseCache',
+                           'LOCATION': 'cache_table'}},
+                               PHOTOBLOG_CACHE='shared'):
+            self.assertEqual(cache.check_shared_cache(), [])
+
+    def test_stats_are_counted_in_process(self):
+        cache.get_item(Entry, self.entry.pk, 'en')
+        cache.get_item(Entry, self.entry.pk, 'en')
+        self.assertIsNone(cache.get_cache().get(cache.STATS_KEYS['hits']))
+        self.assertEqual(cache.stats()['hits'], 1)
+        with override_settings(PHOTOBLOG_CACHE_STATS_INTERVAL=0):
+            cache.get_item(Entry, self.entry.pk, 'en')
+        self.assertEqual(
+            cache.get_cache().get(cache.STATS_KEYS['hits']), 2)
+
+    def test_items_are_cached_per_language(self):
+        Entry.objects.filter(pk=self.entry.pk).update(title_es='Entrada')
+        self.assertEqual(cache.get_item(Entry, self.entry.pk, 'en')['title'],
+                         'Entry')
+        self.assertEqual(cache.get_item(Entry, self.entry.pk, 'es')['title'],
+                         'Entrada')
+
+    def test_unpublished_items_are_not_returned(self):
+        self.entry.un_publish()
+        self.assertIsNone(cache.get_item(Entry, self.entry.pk, 'en'))
+        self.assertIsNone(cache.get_item(Entry, 0, 'en'))
+        self.entry.publish(timezone.now())
+        self.assertIsNotNone(cache.get_item(Entry, self.entry.pk, 'en'))
+
+    def test_scheduled_items_are_not_returned(self):
+        self.entry.publish(timezone.now() + datetime.timedelta(days=1))
+        self.assertIsNone(cache.get_item(Entry, self.entry.pk, 'en'))
+
+    def test_saving_item_invalidates(self):
+        cache.get_item(Entry, self.entry.pk, 'en')
+        self.entry.title = 'Renamed'
+        self.entry.save()
+        self.assertEqual(cache.get_item(Entry, self.entry.pk, 'en')['title'],
+                         'Renamed')
+
+    def test_deleting_item_invalidates(self):
+        cache.get_item(Entry, self.entry.pk, 'en')
+        pk = self.entry.pk
+        self.entry.delete()
+        self.assertIsNone(cache.get_item(Entry, pk, 'en'))
+
+    def test_saving_cover_invalidates(self):
+        cache.get_item(Entry, self.entry.pk, 'en')
+        cover = self.entry.cover
+        cover.caption = 'New caption'
+        cover.save()
+        data = cache.get_item(Entry, self.entry.pk, 'en')
+        self.assertEqual(data['cover']['caption'], 'New caption')
+
+    def test_deleting_cover_invalidates(self):
+        cache.get_item(Entry, self.entry.pk, 'en')
+        self.entry.cover.delete()
+        self.assertIsNone(cache.get_item(Entry, self.entry.pk, 'en')['cover'])
+
+    def test_saving_category_invalidates(self):
+        cache.get_item(Entry, self.entry.pk, 'en')
+        self.category.name = 'Watercolors'
+        self.category.save()
+        data = cache.get_item(Entry, self.entry.pk, 'en')
+        self.assertEqual(data['category']['name'], 'Watercolors')
+
+    def test_deleting_category_invalidates(self):
+        category = Category.objects.create(name='Sketches',
+                                           created_by=self.user)
+        Entry.objects.filter(pk=self.entry.pk).update(category=category)
+        cache.get_item(Entry, self.entry.pk, 'en')
+        category.delete()
+        self.assertIsNone(cache.get_item(Entry, self.entry.pk, 'en')['category'])
+
+    def test_relations_invalidate(self):
+        key = cache.item_key(Entry, self.entry.pk, 'en')
+        image = self.entry.cover
+        cache.get_item(Entry, self.entry.pk, 'en')
+        image.entries.add(self.entry)
+        self.assertEqual(cache.get_item(Entry, self.entry.pk, 'en')['image_ids'],
+                         [image.pk])
+        image.entries.clear()
+        self.assertIsNone(cache.get_cache().get(key))
+        cache.get_item(Entry, self.entry.pk, 'en')
+        collection = Collection.objects.create(title='Collection',
+                                               created_by=self.user)
+        self.entry.collections.add(collection)
+        self.assertIsNone(cache.get_cache().get(key))
+
+    def test_detail_view_uses_cache(self):
+        url = reverse('gallery:entry-detail', args=(self.entry.pk,))
+        response = self.client.get(url)
+        self.assertContains(response, 'Caption')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, 'Entry')
+        self.entry.un_publish()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class GetOrComputeTests(TestCase):
+    """Unit tests for the stampede protection of get_or_compute."""
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_value_is_computed_once(self):
+        self.assertEqual(cache.get_or_compute('key', self.compute), 1)
+        self.assertEqual(cache.get_or_compute('key', self.compute), 1)
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_listings_are_recomputed(self):
+        cache.get_or_compute('key', self.compute)
+        cache.expire_listings()
+        self.assertEqual(cache.get_or_compute('key', self.compute), 2)
+
+    def test_stale_value_is_served_while_locked(self):
+        cache.get_or_compute('key', self.compute)
+        cache.expire_listings()
+        cache.get_cache().add('key:lock', 1)
+        self.assertEqual(cache.get_or_compute('key', self.compute), 1)
+        self.assertEqual(self.calls, 1)
+
+    @override_settings(PHOTOBLOG_CACHE_LOCK_TIMEOUT=0)
+    def test_missing_value_is_computed_when_lock_is_stuck(self):
+        cache.get_cache().add('key:lock', 1)
+        self.assertEqual(cache.get_or_compute('key', self.compute), 1)
+
+    def test_lock_is_released_on_error(self):
+        def fail():
+            raise ValueError('Nope')
+        with self.assertRaises(ValueError):
+            cache.get_or_compute('key', fail)
+        self.assertIsNone(cache.get_cache().get('key:lock'))
+
+    def test_slow_values_are_recomputed_early(self):
+        entry = {'value': 1, 'generation': cache.generation(),
+                 'delta': 0.0, 'expires': time.time() + 60}
+        self.assertTrue(cache.is_fresh(entry))
+        entry['delta'] = 1e6
+        self.assertFalse(cache.is_fresh(entry))
+        with override_settings(PHOTOBLOG_CACHE_BETA=0):
+            self.assertTrue(cache.is_fresh(entry))
+
+    def test_publishing_expires_listings(self):
+        user = User.objects.create_user(email='test.user@example.com',
+                                        username='test_user223',
+                                        password='testpassword')
+        entry = Entry.objects.create(title='Entry', created_by=user)
+        before = cache.generation()
+        entry.publish(timezone.now())
+        self.assertGreater(cache.generation(), before)
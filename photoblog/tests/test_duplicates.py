@@ -0,0 +1,142 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for near-duplicate detection."""
+import io
+import os
+import random
+from io import StringIO
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image as PILImage
+
+from photoblog import duplicates
+from photoblog.models import Image, ImageHash
+from accounts.models import User
+
+IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/diy.jpg')
+OTHER_IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/temple.jpg')
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+
+
+def cropped(path, box):
+    with PILImage.open(path) as img:
+        output = io.BytesIO()
+        img.crop(box).save(output, 'JPEG', quality=70)
+    return output.getvalue()
+
+
+def blank():
+    output = io.BytesIO()
+    PILImage.new('RGB', (8, 8)).save(output, 'PNG')
+    return output.getvalue()
+
+
+def flip(value, *bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+class HashTests(TestCase):
+    """Unit tests for the multi-index hashing helpers."""
+
+    def test_chunks_and_signs(self):
+        value = 0xfedcba9876543210
+        self.assertEqual(duplicates.chunks(value),
+                         [0xfedc, 0xba98, 0x7654, 0x3210])
+        self.assertLess(duplicates.to_signed(value), 0)
+        self.assertEqual(duplicates.to_unsigned(duplicates.to_signed(value)),
+                         value)
+        self.assertEqual(duplicates.to_signed(5), 5)
+
+    def test_neighbors(self):
+        self.assertEqual(duplicates.neighbors(7, 0), [7])
+        found = duplicates.neighbors(7, 2)
+        self.assertEqual(len(found), 1 + 16 + 120)
+        self.assertTrue(all(bin(v ^ 7).count('1') <= 2 for v in found))
+
+    def test_pairs_match_brute_force(self):
+        rng = random.Random(4)
+        hashes = [rng.getrandbits(64) for _ in range(150)]
+        # Near copies, their flipped bits spread over every chunk
+        hashes += [flip(value, *rng.sample(range(64), rng.randint(0, 8)))
+                   for value in hashes[:50]]
+        expected = sorted(
+            (i, j, duplicates.hamming(hashes[i], hashes[j]))
+            for i in range(len(hashes)) for j in range(i + 1, len(hashes))
+            if duplicates.hamming(hashes[i], hashes[j]) <= 6)
+        found = duplicates.pairs(hashes, 0, 100, 6) \
+            + duplicates.pairs(hashes, 100, len(hashes), 6)
+        self.assertEqual(sorted(found), expected)
+        self.assertGreater(len(expected), 20)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0,
+                   PHOTOBLOG_DUPLICATE_DISTANCE=6)
+class NearDuplicateTests(TestCase):
+    """Unit tests for near-duplicates of Images."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+
+    def create_image(self, title, content=None, phash=None):
+        image = Image.objects.create(
+            title=title, created_by=self.user,
+            image=SimpleUploadedFile(f'{title}.jpg', content or blank(),
+                                     content_type='image/jpeg'))
+        if phash is not None:
+            # Replaces the hash of the blank image
+            duplicates.record(image, phash)
+        return image
+
+    def test_near_finds_hashes_within_the_distance(self):
+        value = 0x0123456789abcdef
+        close = self.create_image('Close', phash=flip(value, 0, 17, 33, 50,
+                                                      51, 63))
+        far = self.create_image('Far', phash=flip(value, *range(0, 64, 9)))
+        self.create_image('Other', phash=~value & (2 ** 64 - 1))
+        self.assertEqual(duplicates.near(value), [(6, close.pk)])
+        self.assertEqual(duplicates.near(value, distance=8),
+                         [(6, close.pk), (8, far.pk)])
+
+    def test_uploads_are_flagged_at_ingest(self):
+        original = self.create_image('DIY', open(IMAGE_PATH, 'rb').read())
+        other = self.create_image('Temple',
+                                  open(OTHER_IMAGE_PATH, 'rb').read())
+        copy = self.create_image('DIY again',
+                                 cropped(IMAGE_PATH, (10, 10, 950, 630)))
+        self.assertEqual(copy.perceptual_hash.duplicate_of, original)
+        self.assertIsNone(ImageHash.objects.get(image=other).duplicate_of)
+        self.assertEqual(copy.near_duplicates(), [original])
+        self.assertEqual(original.near_duplicates(), [copy])
+        # A new upload is checked again
+        copy.image = SimpleUploadedFile('temple.jpg',
+                                        open(OTHER_IMAGE_PATH, 'rb').read())
+        copy.save()
+        self.assertEqual(ImageHash.objects.get(image=copy).duplicate_of,
+                         other)
+
+    def test_find_duplicates_command(self):
+        value = 0x0123456789abcdef
+        a = self.create_image('A', phash=value)
+        b = self.create_image('B', phash=flip(value, 3))
+        c = self.create_image('C', phash=flip(value, 3, 20, 40))
+        self.create_image('D', phash=~value & (2 ** 64 - 1))
+        e = self.create_image('E', open(IMAGE_PATH, 'rb').read())
+        f = self.create_image('F', cropped(IMAGE_PATH, (20, 0, 960, 640)))
+        ImageHash.objects.filter(image__in=[e, f]).delete()
+        out = StringIO()
+        call_command('find_duplicates', jobs=3, stdout=out)
+        self.assertEqual(duplicates.clusters(jobs=2),
+                         [[a.pk, b.pk, c.pk], [e.pk, f.pk]])
+        output = out.getvalue()
+        self.assertIn('3 images:', output)
+        self.assertIn(f'  {f.pk} F', output)
+        self.assertIn('2 clusters, 2 hashes indexed', output)
@@ -0,0 +1,225 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for faceted browsing."""
+import datetime
+from collections import Counter
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.db.models import QuerySet
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from photoblog import cache, facets
+from photoblog.models import (Category, Collection, Dimension, Entry,
+                              EntryFacet, FacetCount)
+from accounts.models import User
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0,
+                   PHOTOBLOG_PRICE_RANGES=[100, 500],
+                   PHOTOBLOG_SIZE_BUCKETS=[('small', 30), ('large', None)])
+class FacetTests(TestCase):
+    """Unit tests for photoblog.facets."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+        cls.oils = Category.objects.create(name='Oils', created_by=cls.user)
+        cls.inks = Category.objects.create(name='Inks', created_by=cls.user)
+
+    def setUp(self):
+        cache.get_cache().clear()
+
+    def create_entry(self, title, published=True, **kwargs):
+        entry = Entry.objects.create(title=title, created_by=self.user,
+                                     **kwargs)
+        if published:
+            entry.publish(timezone.now() - datetime.timedelta(minutes=1))
+        return entry
+
+    def dimension(self, height, length):
+        return Dimension.objects.create(unit='cm', height=height,
+                                        length=length, created_by=self.user)
+
+    def stored(self):
+        return {(c.facet, c.value): c.count
+                for c in FacetCount.objects.exclude(count=0)}
+
+    def test_values(self):
+        self.assertEqual(facets.price_values(), ['0-100', '100-500', '500-'])
+        self.assertEqual(facets.price_value(99.5), '0-100')
+        self.assertEqual(facets.price_value(100), '100-500')
+        self.assertEqual(facets.price_value(10000), '500-')
+        self.assertIsNone(facets.price_value(None))
+        self.assertEqual(facets.price_label('500-'), '500+')
+        self.assertEqual(facets.size_value(self.dimension(30, 20)), 'small')
+        self.assertEqual(facets.size_value(self.dimension(20, 31)), 'large')
+
+    def test_published_entries_are_counted(self):
+        self.create_entry('A', category=self.oils, price=50,
+                          size=self.dimension(20, 20))
+        self.create_entry('B', category=self.oils, price=200)
+        self.create_entry('Draft', category=self.inks, published=False)
+        self.assertEqual(self.stored(), {
+            ('category', str(self.oils.pk)): 2,
+            ('price', '0-100'): 1,
+            ('price', '100-500'): 1,
+            ('size', 'small'): 1,
+        })
+
+    def test_counts_follow_changes(self):
+        entry = self.create_entry('A', category=self.oils, price=50)
+        entry.category = self.inks
+        entry.price = 600
+        entry.save()
+        self.assertEqual(self.stored(), {
+            ('category', str(self.inks.pk)): 1,
+            ('price', '500-'): 1,
+        })
+        entry.un_publish()
+        self.assertEqual(self.stored(), {})
+        self.assertFalse(EntryFacet.objects.exists())
+
+    def test_counts_follow_bulk_publishing_and_deletion(self):
+        pastels = Category.objects.create(name='Pastels',
+                                          created_by=self.user)
+        for i in range(3):
+            self.create_entry(f'E{i}', published=False, category=pastels)
+        Entry.objects.all().publish_bulk()
+        self.assertEqual(self.stored(), {('category', str(pastels.pk)): 3})
+        Entry.objects.first().delete()
+        self.assertEqual(self.stored(), {('category', str(pastels.pk)): 2})
+        pastels.delete()
+        self.assertEqual(self.stored(), {})
+
+    def test_counts_follow_collections_and_sizes(self):
+        entry = self.create_entry('A')
+        size = self.dimension(20, 20)
+        collection = Collection.objects.create(title='Summer',
+                                               created_by=self.user)
+        collection.entries.add(entry)
+        self.assertEqual(self.stored(),
+                         {('collection', str(collection.pk)): 1})
+        entry.collections.remove(collection)
+        self.assertEqual(self.stored(), {})
+        entry.collections.add(collection)
+        collection.entries.clear()
+        self.assertEqual(self.stored(), {})
+        entry.size = size
+        entry.save()
+        size.height = 200
+        size.save()
+        self.assertEqual(self.stored(), {('size', 'large'): 1})
+        size.delete()
+        self.assertEqual(self.stored(), {})
+
+    def test_scheduled_entries_are_counted_once_published(self):
+        entry = self.create_entry('A', published=False, category=self.oils)
+        entry.publish(timezone.now() + datetime.timedelta(hours=1))
+        self.assertEqual(self.stored(), {})
+        Entry.objects.filter(pk=entry.pk).update(
+            published_at=timezone.now() - datetime.timedelta(minutes=1))
+        call_command('publish_scheduled', stdout=StringIO())
+        self.assertEqual(self.stored(), {('category', str(self.oils.pk)): 1})
+
+    def test_counts_created_concurrently_are_added_to(self):
+        FacetCount.objects.create(facet='category', value='1', count=2)
+        update = QuerySet.update
+        calls = []
+
+        def racing_update(queryset, **kwargs):
+            calls.append(kwargs)
+            # Before the other transaction inserted the row
+            return 0 if len(calls) == 1 else update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', racing_update):
+            facets._add_counts(Counter({('category', '1'): 3}))
+        self.assertEqual(self.stored(), {('category', '1'): 5})
+
+    def test_selection_drops_unknown_values(self):
+        params = QueryDict('category=1&category=x&price=0-100&price=1-2'
+                           '&size=huge&color=red')
+        self.assertEqual(facets.selection(params),
+                         {'category': ['1'], 'price': ['0-100']})
+
+    def test_filtering_and_counts_of_the_selection(self):
+        a = self.create_entry('A', category=self.oils, price=50)
+        b = self.create_entry('B', category=self.oils, price=200)
+        self.create_entry('C', category=self.inks, price=50)
+        selected = {'category': [str(self.oils.pk)]}
+        self.assertEqual(
+            set(Entry.objects.with_facets(selected)), {a, b})
+        self.assertEqual(
+            set(Entry.objects.with_facets(
+                {'category': [str(self.oils.pk)], 'price': ['0-100']})),
+            {a})
+        self.assertEqual(
+            set(Entry.objects.with_facets(
+                {'category': [str(self.oils.pk), str(self.inks.pk)]})),
+            set(Entry.objects.all()))
+        self.assertEqual(facets.counts(selected)['price'],
+                         {'0-100': 1, '100-500': 1})
+
+    def test_facets_take_a_fixed_number_of_queries(self):
+        collection = Collection.objects.create(title='Summer',
+                                               created_by=self.user)
+        collection.publish()
+        for i in range(6):
+            entry = self.create_entry(
+                f'E{i}', category=(self.oils, self.inks)[i % 2],
+                price=i * 100)
+            entry.collections.add(collection)
+        with self.assertNumQueries(3):
+            found = facets.facets()
+        with self.assertNumQueries(3):
+            facets.facets({'category': [str(self.oils.pk)],
+                           'price': ['100-500']})
+        category = found[0]
+        self.assertEqual(category['name'], 'category')
+        self.assertEqual([(o['label'], o['count'])
+                          for o in category['options']],
+                         [('Inks', 3), ('Oils', 3)])
+        self.assertEqual(found[-1]['options'][0]['label'], 'Summer')
+
+    def test_rebuild_facets_command(self):
+        self.create_entry('A', category=self.oils)
+        FacetCount.objects.all().delete()
+        EntryFacet.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_facets', stdout=out)
+        self.assertIn('1 entries counted', out.getvalue())
+        self.assertEqual(self.stored(), {('category', str(self.oils.pk)): 1})
+
+    def test_sizes_are_listed_and_follow_changes(self):
+        size = self.dimension(20, 30)
+        entry = self.create_entry('Sized', size=size)
+        url = reverse('gallery:entry-list')
+        self.assertContains(self.client.get(url), 'h: 20.0 cm, l: 30.0 cm')
+        size.height = 25
+        size.save()
+        self.assertContains(self.client.get(url), 'h: 25.0 cm, l: 30.0 cm')
+        version = Entry.objects.get(pk=entry.pk).version
+        size.delete()
+        entry.refresh_from_db()
+        self.assertIsNone(entry.size)
+        self.assertEqual(entry.version, version + 1)
+        self.assertNotContains(self.client.get(url), 'cm')
+
+    def test_entry_list_view(self):
+        self.create_entry('Oil entry', category=self.oils)
+        self.create_entry('Ink entry', category=self.inks)
+        response = self.client.get(reverse('gallery:entry-list'),
+                                   {'category': self.oils.pk})
+        self.assertContains(response, 'Oil entry')
+        self.assertNotContains(response, 'Ink entry')
+        options = {o['label']: o for o in response.context['facets'][0]
+                   ['options']}
+        self.assertTrue(options['Oils']['selected'])
+        self.assertEqual(options['Oils']['url'], '?')
+        self.assertEqual(options['Oils']['count'], 1)
@@ -0,0 +1,121 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for versions and versioned fragment caching."""
+import os
+from unittest import mock
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template, TemplateSyntaxError
+from django.test import TestCase, override_settings
+from django.utils import translation
+
+from photoblog import cache, ingest
+from photoblog.models import Entry, Image
+from accounts.models import User
+
+IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/diy.jpg')
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+
+TEMPLATE = "{% load fragments %}{% versioned_cache 'card' e e.cover %}"\
+           "{{ e.title }}|{{ e.cover.caption }}{% endversioned_cache %}"
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0)
+class VersionTests(TestCase):
+    """Unit tests for the version of Item and Image."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+
+    def test_save_bumps_version(self):
+        entry = Entry.objects.create(title='Entry', created_by=self.user)
+        self.assertEqual(entry.version, 1)
+        entry.save()
+        entry.refresh_from_db()
+        self.assertEqual(entry.version, 2)
+
+    def test_update_fields_bump_version(self):
+        entry = Entry.objects.create(title='Entry', created_by=self.user)
+        entry.title = 'Renamed'
+        entry.save(update_fields=['title'])
+        entry.refresh_from_db()
+        self.assertEqual(entry.version, 2)
+
+    def test_ingest_bumps_image_version(self):
+        image = Image.objects.create(
+            title='Image', created_by=self.user,
+            image=SimpleUploadedFile(name='image.jpg',
+                                     content=open(IMAGE_PATH, 'rb').read(),
+                                     content_type='image/jpeg'))
+        # Renditions, then placeholder
+        self.assertEqual(image.version, 3)
+        image.refresh_from_db()
+        self.assertEqual(image.version, 3)
+
+    def test_only_saving_the_image_submits_it(self):
+        image = Image.objects.create(
+            title='Image', created_by=self.user,
+            image=SimpleUploadedFile(name='image.jpg',
+                                     content=open(IMAGE_PATH, 'rb').read(),
+                                     content_type='image/jpeg'))
+        with mock.patch.object(ingest, 'submit') as submit:
+            image.caption = 'Renamed'
+            image.save(update_fields=['caption'])
+            submit.assert_not_called()
+            image.save(update_fields=['image'])
+            image.save()
+        self.assertEqual(submit.call_count, 2)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0)
+class VersionedCacheTests(TestCase):
+    """Unit tests for the versioned_cache template tag."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.entry = Entry.objects.create(title='Entry', title_es='Entrada',
+                                          created_by=self.user)
+
+    def render(self, entry):
+        return Template(TEMPLATE).render(Context({'e': entry}))
+
+    def test_fragment_is_cached_by_version(self):
+        self.assertEqual(self.render(self.entry), 'Entry|')
+        stale = Entry.objects.get(pk=self.entry.pk)
+        stale.title = 'Not saved'
+        self.assertEqual(self.render(stale), 'Entry|')
+        self.entry.title = 'Renamed'
+        self.entry.save()
+        self.assertEqual(self.render(self.entry), 'Renamed|')
+
+    def test_fragment_is_cached_per_language(self):
+        self.assertEqual(self.render(self.entry), 'Entry|')
+        with translation.override('es'):
+            self.assertEqual(self.render(self.entry), 'Entrada|')
+
+    def test_fragment_follows_cover(self):
+        self.entry.set_cover_image(Image(
+            title='Cover', caption='Caption', created_by=self.user,
+            image=SimpleUploadedFile(name='cover.jpg',
+                                     content=open(IMAGE_PATH, 'rb').read(),
+                                     content_type='image/jpeg')))
+        self.assertEqual(self.render(self.entry), 'Entry|Caption')
+        cover = self.entry.cover
+        cover.caption = 'New caption'
+        cover.save()
+        self.assertEqual(self.render(self.entry), 'Entry|New caption')
+
+    def test_tag_requires_objects(self):
+        with self.assertRaises(TemplateSyntaxError):
+            Template("{% load fragments %}{% versioned_cache 'card' %}"
+                     "{% endversioned_cache %}")
@@ -0,0 +1,201 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for the metadata of uploads."""
+import datetime
+import io
+import struct
+from io import StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image as PILImage, TiffImagePlugin
+
+from photoblog import metadata, placeholders, renditions
+from photoblog.models import Image, ImageMetadata
+from accounts.models import User
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+
+XMP = b'''<?xpacket begin="" id="W5M0MpCehiHzreSzNTczkc9d"?>
+<x:xmpmeta xmlns:x="adobe:ns:meta/">
+ <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+  <rdf:Description rdf:about=""
+    xmlns:dc="http://purl.org/dc/elements/1.1/"
+    xmlns:photoshop="http://ns.adobe.com/photoshop/1.0/"
+    photoshop:DateCreated="2017">
+   <dc:subject><rdf:Bag><rdf:li>ochre</rdf:li><rdf:li>sea</rdf:li></rdf:Bag></dc:subject>
+   <dc:creator><rdf:Seq><rdf:li>Jane Doe</rdf:li></rdf:Seq></dc:creator>
+  </rdf:Description>
+ </rdf:RDF>
+</x:xmpmeta>
+<?xpacket end="w"?>'''
+
+
+def exif(**tags):
+    ifd = TiffImagePlugin.ImageFileDirectory_v2()
+    for tag, value in tags.items():
+        ifd[int(tag[1:])] = value
+    output = io.BytesIO()
+    output.write(b'II*\x00\x08\x00\x00\x00')
+    ifd.save(output)
+    return b'Exif\x00\x00' + output.getvalue()
+
+
+def iptc(**datasets):
+    records = b''.join(
+        b'\x1c\x02' + bytes([int(name[1:])]) + struct.pack('>H', len(value))
+        + value for name, value in datasets.items())
+    block = b'8BIM\x04\x04\x00\x00' + struct.pack('>I', len(records)) \
+        + records
+    return b'Photoshop 3.0\x00' + block
+
+
+def icc_profile(description):
+    text = description.encode('ascii') + b'\x00'
+    tag = b'desc\x00\x00\x00\x00' + struct.pack('>I', len(text)) + text
+    header = bytearray(128)
+    table = struct.pack('>I', 1) + b'desc' + struct.pack('>II', 144, len(tag))
+    return bytes(header) + table + tag
+
+
+def segment(marker, payload):
+    return marker + struct.pack('>H', len(payload) + 2) + payload
+
+
+def jpeg(size=(40, 20), exif_data=None, xmp=None, iptc_data=None,
+         profile=None):
+    """Returns a JPEG of 'size', left half red and right half blue, with
+    the metadata given."""
+    img = PILImage.new('RGB', size, 'blue')
+    img.paste('red', (0, 0, size[0] // 2, size[1]))
+    output = io.BytesIO()
+    options = {}
+    if exif_data:
+        options['exif'] = exif_data
+    if profile:
+        options['icc_profile'] = profile
+    img.save(output, 'JPEG', **options)
+    data = output.getvalue()
+    extra = b''
+    if xmp:
+        extra += segment(b'\xff\xe1', metadata.XMP_HEADER + xmp)
+    if iptc_data:
+        extra += segment(b'\xff\xed', iptc_data)
+    return data[:2] + extra + data[2:]
+
+
+class ExtractTests(TestCase):
+    """Unit tests for metadata.extract."""
+
+    def test_exif(self):
+        values = metadata.extract(jpeg(exif_data=exif(
+            t271='Nikon', t272='FM2', t36867='2017:05:04 10:20:30',
+            t41728=b'\x01', t274=6, t33437=(28, 10))))
+        self.assertEqual(values['camera_make'], 'Nikon')
+        self.assertEqual(values['camera_model'], 'FM2')
+        self.assertEqual(values['taken_at'], '2017-05-04T10:20:30')
+        self.assertEqual(values['source'], 'film')
+        self.assertEqual(values['orientation'], 6)
+        self.assertEqual((values['width'], values['height']), (20, 40))
+        self.assertEqual(values['exif']['f_number'], 2.8)
+
+    def test_xmp_iptc_and_profile(self):
+        values = metadata.extract(jpeg(
+            xmp=XMP, iptc_data=iptc(d80=b'John Roe', d55=b'20160101',
+                                    d25=b'film'),
+            profile=icc_profile('Display P3')))
+        self.assertEqual(values['taken_at'], '2017-01-01T00:00:00')
+        self.assertEqual(values['keywords'], ['ochre', 'sea'])
+        self.assertEqual(values['creator'], 'Jane Doe')
+        self.assertEqual(values['iptc']['by_line'], 'John Roe')
+        self.assertEqual(values['color_profile'], 'Display P3')
+        self.assertEqual(values['orientation'], 1)
+        # IPTC when there is nothing better
+        self.assertEqual(metadata.extract(jpeg(iptc_data=iptc(
+            d55=b'20160101')))['taken_at'], '2016-01-01T00:00:00')
+
+    def test_malformed_metadata_is_ignored(self):
+        values = metadata.extract(jpeg(
+            exif_data=exif(t36867='0000:00:00 00:00:00'),
+            xmp=b'<!DOCTYPE x [<!ENTITY a "aaaa">]><x>&a;</x>'))
+        self.assertIsNone(values['taken_at'])
+        self.assertEqual(values['xmp'], {})
+        self.assertEqual(metadata.extract(jpeg(xmp=b'<unclosed'))['xmp'], {})
+
+    def test_header_bytes_are_enough(self):
+        data = jpeg(size=(600, 400), exif_data=exif(t271='Canon'))
+        # Up to the start of the scan
+        header = data[:data.index(b'\xff\xda') + 16]
+        self.assertLess(len(header), len(data) / 2)
+        self.assertEqual(metadata.extract(header)['camera_make'], 'Canon')
+
+
+class OrientationTests(TestCase):
+    """Unit tests for the EXIF orientation of derived images."""
+
+    def test_renditions_are_upright(self):
+        data = jpeg(size=(400, 200), exif_data=exif(t274=6))
+        content, width, height = renditions.render(io.BytesIO(data), 100)
+        self.assertEqual((width, height), (100, 200))
+        with PILImage.open(io.BytesIO(content)) as img:
+            # Red, the left half, is now on top
+            red, _, blue = img.convert('RGB').getpixel((50, 20))
+            self.assertGreater(red, blue)
+
+    def test_placeholders_are_upright(self):
+        data = jpeg(size=(400, 200), exif_data=exif(t274=8))
+        self.assertEqual(placeholders.describe(data)[:2], (200, 400))
+
+    def test_no_orientation(self):
+        data = jpeg(size=(400, 200))
+        self.assertEqual(renditions.render(io.BytesIO(data), 100)[1:],
+                         (100, 50))
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0)
+class ImageMetadataTests(TestCase):
+    """Unit tests for the metadata of Images."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+
+    def create_image(self, title, content):
+        return Image.objects.create(
+            title=title, created_by=self.user,
+            image=SimpleUploadedFile(f'{title}.jpg', content,
+                                     content_type='image/jpeg'))
+
+    def test_metadata_is_stored_at_ingest(self):
+        film = self.create_image('Film', jpeg(exif_data=exif(
+            t271='Nikon', t272='FM2', t36867='2017:05:04 10:20:30',
+            t41728=b'\x01')))
+        digital = self.create_image('Digital', jpeg(
+            size=(30, 20), exif_data=exif(t271='Canon', t41728=b'\x03'),
+            xmp=XMP))
+        self.create_image('Bare', jpeg(size=(20, 20)))
+        self.assertEqual(film.metadata.taken_at, timezone.make_aware(
+            datetime.datetime(2017, 5, 4, 10, 20, 30)))
+        self.assertEqual(digital.metadata.values['keywords'],
+                         ['ochre', 'sea'])
+        self.assertEqual(list(Image.objects.shot_on_film()), [film])
+        self.assertEqual(set(Image.objects.taken_in(2017)), {film, digital})
+        self.assertEqual(list(Image.objects.taken_with('Nikon', 'FM2')),
+                         [film])
+        film.image = SimpleUploadedFile('new.jpg', jpeg(size=(10, 10)),
+                                        content_type='image/jpeg')
+        film.save()
+        self.assertEqual(ImageMetadata.objects.get(image=film).source, '')
+
+    def test_extract_metadata_command(self):
+        image = self.create_image('Film', jpeg(exif_data=exif(
+            t41728=b'\x01')))
+        ImageMetadata.objects.all().delete()
+        out = StringIO()
+        call_command('extract_metadata', stdout=out)
+        self.assertIn('1 images read, 0 failed', out.getvalue())
+        self.assertEqual(list(Image.objects.shot_on_film()), [image])
+        call_command('extract_metadata', stdout=out)
+        self.assertIn('0 images read', out.getvalue())
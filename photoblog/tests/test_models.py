@@ -5,7 +5,9 @@ import os
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from photoblog.models import (
     Category,
@@ -45,6 +47,53 @@ class DimensionModelTests(TestCase):
         self.assertEqual(two_by_four.unit, 'in')
 
 
+    def test_sizes_are_stored_in_millimeters(self):
+        dimension = Dimension.objects.create(height=2, length=3, unit='ft')
+        self.assertAlmostEqual(dimension.height_mm, 609.6)
+        self.assertAlmostEqual(dimension.length_mm, 914.4)
+        self.assertIsNone(dimension.width_mm)
+        dimension.convert_unit('cm')
+        dimension.refresh_from_db()
+        self.assertAlmostEqual(dimension.height_mm, 609.6, places=0)
+
+    def test_size_between_compares_across_units(self):
+        small = Dimension.objects.create(height=50, length=40, unit='cm')
+        tall = Dimension.objects.create(height=1, length=0.5, unit='m')
+        inches = Dimension.objects.create(height=20, length=16, unit='in')
+        self.assertEqual(
+            set(Dimension.objects.size_between(max_height=60)),
+            {small, inches})
+        self.assertEqual(
+            list(Dimension.objects.size_between('in', min_height=30)), [tall])
+        with self.assertRaises(TypeError):
+            Dimension.objects.size_between(max_depth=3)
+
+    def test_fits_within(self):
+        wide = Dimension.objects.create(height=30, length=90, unit='cm')
+        deep = Dimension.objects.create(height=30, length=30, width=40,
+                                        unit='cm')
+        self.assertEqual(list(Dimension.objects.fits_within(100, 50)), [deep])
+        self.assertEqual(
+            set(Dimension.objects.fits_within(100, 50, rotate=True)),
+            {wide, deep})
+        self.assertEqual(list(Dimension.objects.fits_within(
+            100, 100, width=10)), [wide])
+
+    def test_entries_fit_within(self):
+        user = User.objects.create_user(email='test.user@example.com',
+                                         username='test_user223',
+                                         password='testpassword')
+        small = Entry.objects.create(
+            title='Small', created_by=user,
+            size=Dimension.objects.create(height=20, length=20, unit='in'))
+        Entry.objects.create(
+            title='Large', created_by=user,
+            size=Dimension.objects.create(height=2, length=2, unit='m'))
+        Entry.objects.create(title='Unknown', created_by=user)
+        self.assertEqual(list(Entry.objects.fits_within(60, 60)), [small])
+        self.assertEqual(list(Entry.objects.size_between(max_length=60)),
+                         [small])
+
 class CategoryModelTests(TestCase):
     """Unit tests for Category model."""
     @classmethod
@@ -248,6 +297,27 @@ class ImageModelTests(TestCase):
         self.assertIn(image, story.images.all())
         self.assertIn(story, image.stories.all())
 
+    def test_adding_image_to_items_does_not_save_it(self):
+        entry = Entry.objects.create(title='Entry',
+                                     created_by=self.user1['obj'])
+        story = Story.objects.create(title='Story', text='Text',
+                                     created_by=self.user1['obj'])
+        image = Image.objects.create(
+            title='Image',
+            created_by=self.user1['obj'],
+            image=SimpleUploadedFile(
+                name='image.jpg',
+                content=open(IMAGE_PATH, 'rb').read(),
+                content_type='image/jpeg'
+            )
+        )
+        version = Image.objects.get(pk=image.pk).version
+        image.add_to_entry(entry.id)
+        image.add_to_story(story.id)
+        self.assertEqual(Image.objects.get(pk=image.pk).version, version)
+        self.assertEqual(list(entry.images.all()), [image])
+        self.assertEqual(list(story.images.all()), [image])
+
     def test_image_is_deleted_from_filesystem_on_delete(self):
         image = Image.objects.create(
             title='I am created',
@@ -632,6 +702,113 @@ class EntryModelTests(TestCase):
         entry.add_images()
         self.assertEqual(initial_count, Image.objects.count())
 
+    def test_publish_is_a_single_update(self):
+        entry = Entry.objects.create(
+            title='Existential dread',
+            description="Don't let it set in",
+            created_by=self.user1['obj'],
+        )
+        for change in (entry.publish, entry.un_publish):
+            with CaptureQueriesContext(connection) as queries:
+                change()
+            updates = [q for q in queries
+                       if q['sql'].startswith('UPDATE "photoblog_entry"')]
+            self.assertEqual(len(updates), 1)
+        entry.refresh_from_db()
+        self.assertIsNone(entry.published_at)
+        self.assertEqual(entry.version, 3)
+
+    def test_publish_saves_new_entries(self):
+        entry = Entry(title='Existential dread',
+                      created_by=self.user1['obj'])
+        entry.publish()
+        self.assertIsNotNone(Entry.objects.get(pk=entry.pk).published_at)
+
+    def test_update_fields_validate_saved_fields(self):
+        Entry.objects.create(title='Taken', created_by=self.user1['obj'])
+        entry = Entry.objects.create(title='Free',
+                                     created_by=self.user1['obj'])
+        entry.title = 'Taken'
+        with self.assertRaises(ValidationError):
+            entry.save(update_fields=['title'])
+        entry.title = 'Renamed'
+        entry.save(update_fields=['title'])
+        entry = Entry.objects.get(pk=entry.pk)
+        self.assertEqual((entry.title_en, entry.slug), ('Renamed', 'renamed'))
+
+    def test_add_images_query_count_does_not_depend_on_image_count(self):
+        entry = Entry.objects.create(
+            title='Entry full of images',
+            description="It's the first of its kind",
+            created_by=self.user1['obj']
+        )
+        images = [
+            Image.objects.create(
+                title=f'Batch image {i}',
+                created_by=entry.created_by,
+                image=SimpleUploadedFile(
+                    name='batch_image.jpg',
+                    content=open(IMAGE_PATH, 'rb').read(),
+                    content_type='image/jpeg',
+                ),
+            )
+            for i in range(6)
+        ]
+        # Lookup, m2m select and insert, cover update
+        with self.assertNumQueries(4):
+            entry.add_images([i.pk for i in images[:2]], cover=images[0].pk)
+        with self.assertNumQueries(4):
+            entry.add_images([i.pk for i in images[2:]], cover=images[5].pk)
+        self.assertEqual(entry.images.count(), 6)
+        entry.refresh_from_db()
+        self.assertEqual(entry.cover, images[5])
+
+    def test_add_images_creates_images_at_once(self):
+        entry = Entry.objects.create(
+            title='Entry full of images',
+            description="It's the first of its kind",
+            created_by=self.user1['obj']
+        )
+        images = [
+            Image(
+                title=f'Batch image {i}',
+                created_by=entry.created_by,
+                image=SimpleUploadedFile(
+                    name='batch_image.jpg',
+                    content=open(IMAGE_PATH, 'rb').read(),
+                    content_type='image/jpeg',
+                ),
+            )
+            for i in range(3)
+        ]
+        entry.add_images(images, cover=images[1])
+        self.assertEqual(set(entry.images.all()), set(images))
+        self.assertEqual(images[1].slug, 'batch-image-1')
+        entry.refresh_from_db()
+        self.assertEqual(entry.cover, images[1])
+
+    def test_add_images_rejects_taken_titles(self):
+        entry = Entry.objects.create(
+            title='Entry full of images',
+            description="It's the first of its kind",
+            created_by=self.user1['obj']
+        )
+        images = [
+            Image(
+                title='Same title',
+                created_by=entry.created_by,
+                image=SimpleUploadedFile(
+                    name='batch_image.jpg',
+                    content=open(IMAGE_PATH, 'rb').read(),
+                    content_type='image/jpeg',
+                ),
+            )
+            for i in range(2)
+        ]
+        with self.assertRaises(ValidationError):
+            entry.add_images(images)
+        self.assertFalse(Image.objects.filter(title='Same title').exists())
+
     def test_remove_images_empty_method_does_nothing(self):
         entry = Entry.objects.create(
             title='Entry full of images',
@@ -0,0 +1,107 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for the full-page cache."""
+import datetime
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from photoblog import cache
+from photoblog.models import Entry
+from photoblog.pagecache import last_modified, newest_change, page_key
+from accounts.models import User
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0)
+class PageCacheTests(TestCase):
+    """Unit tests for page_cache."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.entry = Entry.objects.create(title='Entry', title_es='Entrada',
+                                          created_by=self.user)
+        self.entry.publish(timezone.now())
+
+    def url(self, language='en'):
+        with translation.override(language):
+            return reverse('gallery:entry-detail', args=(self.entry.pk,))
+
+    def test_page_is_cached(self):
+        response = self.client.get(self.url())
+        self.assertContains(response, 'Entry')
+        self.assertTrue(response['ETag'])
+        self.assertTrue(response['Last-Modified'])
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url())
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_pages_are_cached_per_language(self):
+        self.assertContains(self.client.get(self.url('en')), 'Entry')
+        self.assertContains(self.client.get(self.url('es')), 'Entrada')
+
+    def test_etag_gives_not_modified(self):
+        etag = self.client.get(self.url())['ETag']
+        response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_etag_is_checked_before_reading_the_page(self):
+        etag = self.client.get(self.url())['ETag']
+        cache.get_cache().delete(page_key(
+            RequestFactory().get(self.url())))
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_key_only_depends_on_known_parameters(self):
+        factory = RequestFactory()
+        with translation.override('en'):
+            key = page_key(factory.get('/', {'size': 'large', 'price': 100}))
+            self.assertEqual(page_key(factory.get(
+                '/?price=100&utm_source=feed&size=large')), key)
+            self.assertNotEqual(page_key(factory.get('/?size=small')), key)
+            self.assertNotEqual(page_key(factory.get('/')), key)
+
+    def test_last_modified_gives_not_modified(self):
+        modified = self.client.get(self.url())['Last-Modified']
+        response = self.client.get(self.url(), HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_change_gives_new_page(self):
+        etag = self.client.get(self.url())['ETag']
+        self.entry.title = 'Renamed'
+        self.entry.save()
+        response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Renamed')
+
+    def test_errors_are_not_cached(self):
+        self.entry.un_publish()
+        self.assertEqual(self.client.get(self.url()).status_code, 404)
+        self.entry.publish(timezone.now())
+        self.assertEqual(self.client.get(self.url()).status_code, 200)
+
+    def test_authenticated_users_are_not_cached(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url())
+        self.assertContains(response, 'Entry')
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_last_modified_falls_back_to_database(self):
+        published_at = timezone.now() - datetime.timedelta(days=1)
+        Entry.objects.update(published_at=published_at,
+                             created_at=published_at)
+        cache.get_cache().clear()
+        self.assertEqual(newest_change(), published_at)
+        self.assertEqual(last_modified(), published_at)
+        self.entry.save()
+        self.assertGreater(last_modified(), published_at)
@@ -0,0 +1,86 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for keyset pagination."""
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from photoblog.models import Entry
+from photoblog.pagination import (
+    CursorPaginator,
+    InvalidCursor,
+    decode_cursor,
+    encode_cursor,
+)
+from accounts.models import User
+
+
+class CursorTests(TestCase):
+    """Unit tests for cursor tokens."""
+
+    def test_cursor_round_trip(self):
+        now = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor('n', now, 42)),
+                         ('n', now, 42))
+
+    def test_malformed_cursor_raises(self):
+        for token in ('garbage', encode_cursor('x', timezone.now(), 1), '!'):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(token)
+
+
+class CursorPaginatorTests(TestCase):
+    """Unit tests for CursorPaginator and EntryListView pagination."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+        for i in range(25):
+            Entry.objects.create(title=f'Entry {i}', created_by=cls.user)
+        # Ties on created_at are broken by id
+        Entry.objects.filter(title__in=('Entry 3', 'Entry 4', 'Entry 5'))\
+            .update(created_at=Entry.objects.get(title='Entry 3').created_at)
+        Entry.objects.update(published_at=timezone.now())
+        cls.expected = list(Entry.objects.order_by('-created_at', '-id'))
+
+    def test_pages_cover_every_entry_once(self):
+        paginator = CursorPaginator(Entry.objects.all(), 10)
+        page = paginator.page()
+        seen = list(page)
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            seen.extend(page)
+        self.assertEqual(seen, self.expected)
+
+    def test_first_page_has_no_previous(self):
+        page = CursorPaginator(Entry.objects.all(), 10).page()
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_previous_cursor_returns_previous_page(self):
+        paginator = CursorPaginator(Entry.objects.all(), 10)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        third = paginator.page(second.next_cursor)
+        self.assertFalse(third.has_next())
+        self.assertEqual(list(paginator.page(third.previous_cursor)),
+                         list(second))
+        self.assertEqual(list(paginator.page(second.previous_cursor)),
+                         list(first))
+        self.assertFalse(paginator.page(second.previous_cursor).has_previous())
+
+    def test_view_paginates_with_cursor(self):
+        url = reverse('gallery:entry-list')
+        response = self.client.get(url)
+        self.assertEqual(list(response.context['entry_list']),
+                         self.expected[:24])
+        page = response.context['page_obj']
+        response = self.client.get(url, {'cursor': page.next_cursor})
+        self.assertEqual(list(response.context['entry_list']),
+                         self.expected[24:])
+
+    def test_view_returns_404_on_invalid_cursor(self):
+        response = self.client.get(reverse('gallery:entry-list'),
+                                   {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,154 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for color palettes."""
+import datetime
+import io
+from io import StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from photoblog import cache, palettes
+from photoblog.models import Entry, Image, ImageColor
+from accounts.models import User
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+
+TEAL = (0, 128, 128)
+OCHRE = (204, 119, 34)
+WHITE = (255, 255, 255)
+
+
+def painting(*stripes):
+    """Returns a PNG made of vertical stripes of (color, width)."""
+    img = PILImage.new('RGB', (sum(width for _, width in stripes), 50))
+    left = 0
+    for color, width in stripes:
+        img.paste(color, (left, 0, left + width, 50))
+        left += width
+    output = io.BytesIO()
+    img.save(output, 'PNG')
+    return output.getvalue()
+
+
+class ColorTests(TestCase):
+    """Unit tests for the color helpers."""
+
+    def test_parse_color(self):
+        self.assertEqual(palettes.parse_color('Teal'), TEAL)
+        self.assertEqual(palettes.parse_color('#CC7722'), OCHRE)
+        self.assertEqual(palettes.parse_color('cc7722'), OCHRE)
+        self.assertIsNone(palettes.parse_color('fuchsia-ish'))
+        self.assertIsNone(palettes.parse_color('#abc'))
+
+    def test_to_lab(self):
+        for value, expected in zip(palettes.to_lab(WHITE), (100, 0, 0)):
+            self.assertAlmostEqual(value, expected, places=1)
+        self.assertAlmostEqual(palettes.to_lab((0, 0, 0))[0], 0)
+
+    def test_buckets_near_cover_the_radius(self):
+        for rgb in (TEAL, OCHRE, WHITE, (0, 0, 0), (255, 0, 0)):
+            lab = tuple(round(v) for v in palettes.to_lab(rgb))
+            near = palettes.buckets_near(lab, 20)
+            self.assertIn(palettes.bucket(lab), near)
+            for shift in ((19, 0, 0), (0, -19, 0), (0, 0, 19), (11, 11, 11)):
+                other = tuple(v + s for v, s in zip(lab, shift))
+                if 0 <= other[0] <= 100:
+                    self.assertIn(palettes.bucket(other), near)
+            self.assertLess(len(near), 64)
+
+    def test_extract(self):
+        colors = palettes.extract(painting((TEAL, 60), (OCHRE, 30),
+                                           (WHITE, 10)))
+        self.assertEqual([c[:3] for c in colors], [TEAL, OCHRE, WHITE])
+        self.assertEqual([c[3] for c in colors], [0.6, 0.3, 0.1])
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0)
+class ColorSearchTests(TestCase):
+    """Unit tests for palettes at ingest and entries by color."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+
+    def setUp(self):
+        cache.get_cache().clear()
+
+    def create_image(self, title, *stripes):
+        return Image.objects.create(
+            title=title, created_by=self.user,
+            image=SimpleUploadedFile(f'{title}.png', painting(*stripes),
+                                     content_type='image/png'))
+
+    def create_entry(self, title, cover):
+        entry = Entry.objects.create(title_en=title, cover=cover,
+                                     created_by=self.user)
+        entry.publish(timezone.now() - datetime.timedelta(minutes=1))
+        return entry
+
+    def test_palette_is_extracted_at_ingest(self):
+        image = self.create_image('Teal', (TEAL, 80), (OCHRE, 20))
+        self.assertEqual([(c.hex, c.share) for c in image.palette.all()],
+                         [('#008080', 0.8), ('#cc7722', 0.2)])
+        image.image = SimpleUploadedFile('ochre.png', painting((OCHRE, 10)),
+                                         content_type='image/png')
+        image.save()
+        self.assertEqual([c.hex for c in image.palette.all()], ['#cc7722'])
+
+    def test_entries_by_color(self):
+        both = self.create_entry('Both', self.create_image(
+            'Both', (TEAL, 50), (OCHRE, 50)))
+        close = self.create_entry('Close', self.create_image(
+            'Close', ((10, 135, 125), 50), ((200, 125, 40), 50)))
+        teal = self.create_entry('Teal', self.create_image(
+            'Teal', (TEAL, 100)))
+        self.create_entry('White', self.create_image('White', (WHITE, 100)))
+        found = list(Entry.objects.with_colors([TEAL]))
+        self.assertEqual(set(found), {both, close, teal})
+        self.assertEqual(found[-1], close)
+        self.assertEqual(list(Entry.objects.with_colors([TEAL, OCHRE])),
+                         [both, close])
+        self.assertEqual(list(Entry.objects.with_colors([(255, 0, 255)])),
+                         [])
+        self.assertEqual(list(Entry.objects.with_colors([])), [])
+
+    def test_only_published_covers_expire_listings(self):
+        image = self.create_image('Teal', (TEAL, 100))
+        self.assertEqual(cache.generation(), 0)
+        entry = self.create_entry('Teal', image)
+        generation = cache.generation()
+        image.image = SimpleUploadedFile('ochre.png', painting((OCHRE, 10)),
+                                         content_type='image/png')
+        image.save()
+        self.assertGreater(cache.generation(), generation)
+        entry.un_publish()
+        generation = cache.generation()
+        palettes.save_palette(image, image.image.name, [(*TEAL, 1.0)])
+        self.assertEqual(cache.generation(), generation)
+
+    def test_color_search_view(self):
+        self.create_entry('Teal and ochre', self.create_image(
+            'Both', (TEAL, 50), (OCHRE, 50)))
+        self.create_entry('White', self.create_image('White', (WHITE, 100)))
+        url = reverse('gallery:color-search')
+        response = self.client.get(url, {'color': 'teal, ochre'})
+        self.assertEqual(response.context['colors'], ['#008080', '#cc7722'])
+        self.assertContains(response, 'Teal and ochre')
+        self.assertNotContains(response, 'White')
+        with self.assertNumQueries(0):
+            self.client.get(url, {'color': 'teal, ochre'})
+        response = self.client.get(url, {'color': 'nothing'})
+        self.assertEqual(response.context['entries'], [])
+
+    def test_ingest_images_command(self):
+        image = self.create_image('Teal', (TEAL, 100))
+        ImageColor.objects.all().delete()
+        out = StringIO()
+        call_command('ingest_images', stdout=out)
+        self.assertIn('1 images ingested', out.getvalue())
+        self.assertEqual([c.hex for c in image.palette.all()], ['#008080'])
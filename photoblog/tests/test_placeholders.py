@@ -0,0 +1,65 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for low quality image placeholders."""
+import os
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from photoblog.models import Image
+from photoblog.placeholders import describe
+from accounts.models import User
+
+IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/diy.jpg')
+OTHER_IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/temple.jpg')
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+
+
+def upload(path):
+    return SimpleUploadedFile(name=os.path.basename(path),
+                              content=open(path, 'rb').read(),
+                              content_type='image/jpeg')
+
+
+class DescribeTests(TestCase):
+    """Unit tests for describe."""
+
+    def test_describe_returns_size_and_data_uri(self):
+        width, height, placeholder = describe(IMAGE_PATH)
+        self.assertEqual((width, height), (960, 640))
+        self.assertTrue(placeholder.startswith('data:image/jpeg;base64,'))
+        self.assertLess(len(placeholder), 1000)
+
+    def test_describe_accepts_bytes(self):
+        self.assertEqual(describe(open(IMAGE_PATH, 'rb').read())[:2],
+                         (960, 640))
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0)
+class ImagePlaceholderTests(TestCase):
+    """Unit tests for the placeholder of Image."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+
+    def test_placeholder_is_computed_on_save(self):
+        image = Image.objects.create(title='Placeholder', created_by=self.user,
+                                     image=upload(IMAGE_PATH))
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (960, 640))
+        self.assertEqual(image.aspect_ratio, 66.6667)
+        self.assertTrue(image.placeholder)
+
+    def test_placeholder_is_replaced_with_upload(self):
+        image = Image.objects.create(title='Placeholder', created_by=self.user,
+                                     image=upload(IMAGE_PATH))
+        image = Image.objects.get(pk=image.pk)
+        image.image = upload(OTHER_IMAGE_PATH)
+        image.save()
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (1024, 680))
@@ -0,0 +1,100 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for bulk and scheduled publishing."""
+import datetime
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from photoblog import cache
+from photoblog.models import Collection, Entry, SchedulerRun
+from accounts.models import User
+
+
+class PublishingTests(TestCase):
+    """Unit tests for publish_bulk, unpublish_bulk and scheduling."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+
+    def setUp(self):
+        cache.get_cache().clear()
+        for i in range(5):
+            Entry.objects.create(title=f'Entry {i}', created_by=self.user)
+
+    def test_publish_default_time_is_call_time(self):
+        entry = Entry.objects.first()
+        before = timezone.now()
+        entry.publish()
+        self.assertGreaterEqual(entry.published_at, before)
+
+    def test_publish_bulk_is_a_single_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            count = Entry.objects.all().publish_bulk()
+        updates = [q for q in queries
+                   if q['sql'].startswith('UPDATE "photoblog_entry"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(count, 5)
+        self.assertEqual(Entry.objects.published().count(), 5)
+        self.assertEqual(Entry.objects.first().version, 2)
+
+    def test_unpublish_bulk(self):
+        Entry.objects.all().publish_bulk()
+        Entry.objects.filter(title='Entry 0').unpublish_bulk()
+        self.assertEqual(Entry.objects.published().count(), 4)
+
+    def test_publish_bulk_invalidates_cache(self):
+        entry = Entry.objects.first()
+        self.assertIsNone(cache.get_item(Entry, entry.pk, 'en'))
+        Entry.objects.all().publish_bulk()
+        self.assertIsNotNone(cache.get_item(Entry, entry.pk, 'en'))
+
+    def test_collection_is_published_with_entries(self):
+        collection = Collection.objects.create(title='Launch',
+                                               created_by=self.user)
+        collection.add_entries(list(Entry.objects.all()))
+        when = timezone.now() + datetime.timedelta(hours=1)
+        self.assertEqual(collection.publish_with_entries(when), 5)
+        self.assertEqual(Entry.objects.filter(published_at=when).count(), 5)
+        self.assertEqual(Collection.objects.get().published_at, when)
+        self.assertFalse(Entry.objects.published().exists())
+
+    def test_scheduled_items_are_flushed_once_due(self):
+        entry = Entry.objects.first()
+        Entry.objects.filter(pk=entry.pk).publish_bulk(
+            timezone.now() + datetime.timedelta(seconds=1))
+        self.assertIsNone(cache.get_item(Entry, entry.pk, 'en'))
+        # Due, but still cached as unpublished
+        Entry.objects.filter(pk=entry.pk).update(
+            published_at=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertIsNone(cache.get_item(Entry, entry.pk, 'en'))
+        SchedulerRun.objects.create(
+            pk=1, ran_at=timezone.now() - datetime.timedelta(minutes=1))
+        generation = cache.generation()
+        out = StringIO()
+        call_command('publish_scheduled', stdout=out)
+        self.assertIn('1 scheduled items published', out.getvalue())
+        self.assertIsNotNone(cache.get_item(Entry, entry.pk, 'en'))
+        self.assertGreater(cache.generation(), generation)
+
+    def test_last_run_is_kept_in_the_database(self):
+        call_command('publish_scheduled', stdout=StringIO())
+        cache.get_cache().clear()
+        # Within the window, but before the last run
+        Entry.objects.filter(pk=Entry.objects.first().pk).update(
+            published_at=timezone.now() - datetime.timedelta(minutes=30))
+        out = StringIO()
+        call_command('publish_scheduled', stdout=out)
+        self.assertIn('0 scheduled items published', out.getvalue())
+
+    def test_scheduler_only_looks_at_new_publications(self):
+        Entry.objects.all().update(
+            published_at=timezone.now() - datetime.timedelta(days=1))
+        out = StringIO()
+        call_command('publish_scheduled', stdout=out)
+        self.assertIn('0 scheduled items published', out.getvalue())
@@ -0,0 +1,116 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for photoblog image renditions."""
+import os
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+
+from photoblog.models import Image, Rendition
+from photoblog.renditions import render, rendition_filename
+from accounts.models import User
+
+IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/diy.jpg')
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+
+TEST_RENDITIONS = {
+    'thumbnail': {'width': 120, 'quality': 70, 'format': 'JPEG'},
+    'medium': {'width': 480, 'quality': 80, 'format': 'JPEG'},
+    'large': {'width': 2000, 'quality': 85, 'format': 'JPEG'},
+}
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0,
+                   PHOTOBLOG_RENDITIONS=TEST_RENDITIONS)
+class RenditionTests(TestCase):
+    """Unit tests for Rendition model and pipeline."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+
+    def create_image(self, title='Rendered image'):
+        return Image.objects.create(
+            title=title,
+            caption='caption',
+            created_by=self.user,
+            image=SimpleUploadedFile(
+                name='rendered.jpg',
+                content=open(IMAGE_PATH, 'rb').read(),
+                content_type='image/jpeg',
+            ),
+        )
+
+    def test_renditions_are_created_on_save(self):
+        image = self.create_image()
+        self.assertEqual(
+            sorted(image.renditions.values_list('name', flat=True)),
+            ['large', 'medium', 'thumbnail'])
+
+    def test_renditions_are_resized(self):
+        image = self.create_image()
+        thumbnail = image.get_rendition('thumbnail')
+        self.assertEqual(thumbnail.width, 120)
+        self.assertEqual(thumbnail.height, 80)
+
+    def test_renditions_are_never_upscaled(self):
+        image = self.create_image()
+        self.assertEqual(image.get_rendition('large').width, 960)
+
+    def test_renditions_are_stored_as_blobs(self):
+        image = self.create_image()
+        medium = image.get_rendition('medium')
+        self.assertTrue(medium.file.name.startswith('blobs/'))
+        self.assertTrue(medium.file.name.endswith('.jpg'))
+
+    def test_saving_again_does_not_regenerate(self):
+        image = self.create_image()
+        names = list(image.renditions.values_list('file', flat=True))
+        image.caption = 'Another caption'
+        image.save()
+        self.assertEqual(
+            list(image.renditions.values_list('file', flat=True)), names)
+
+    def test_renditions_are_deleted_with_image(self):
+        image = self.create_image()
+        path = image.get_rendition('thumbnail').file.path
+        image.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(Rendition.objects.count(), 0)
+
+    def test_srcset_lists_every_rendition(self):
+        image = self.create_image()
+        self.assertEqual(image.srcset.count('w,'), 2)
+        self.assertIn('120w', image.srcset)
+
+    def test_rendition_url_tag(self):
+        image = self.create_image()
+        template = Template("{% load renditions %}"
+                            "{% rendition_url image 'medium' %}")
+        self.assertEqual(template.render(Context({'image': image})),
+                         image.get_rendition('medium').file.url)
+
+    def test_rendition_url_tag_falls_back_to_original(self):
+        image = self.create_image()
+        template = Template("{% load renditions %}"
+                            "{% rendition_url image 'huge' %}")
+        self.assertEqual(template.render(Context({'image': image})),
+                         image.image.url)
+
+
+class RenderTests(TestCase):
+    """Unit tests for the render helpers."""
+
+    def test_render_returns_encoded_image(self):
+        data, width, height = render(IMAGE_PATH, 300, 70, 'JPEG')
+        self.assertTrue(data.startswith(b'\xff\xd8'))
+        self.assertEqual((width, height), (300, 200))
+
+    def test_rendition_filename(self):
+        self.assertEqual(
+            rendition_filename('user_1/2018-04/a.png', 'thumbnail', 'WEBP'),
+            'a_thumbnail.webp')
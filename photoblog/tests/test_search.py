@@ -0,0 +1,210 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for full-text search."""
+import datetime
+import os
+from io import StringIO
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from photoblog import cache, search
+from photoblog.models import (Category, Entry, Image, SearchDocument,
+                              Story)
+from photoblog.pagination import InvalidCursor, encode_token
+from accounts.models import User
+
+IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/diy.jpg')
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0)
+class SearchTests(TestCase):
+    """Unit tests for photoblog.search."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+
+    def setUp(self):
+        cache.get_cache().clear()
+
+    def create_entry(self, title, description='', published=True, **kwargs):
+        entry = Entry.objects.create(title=title, description=description,
+                                     created_by=self.user, **kwargs)
+        if published:
+            entry.publish(timezone.now() - datetime.timedelta(minutes=1))
+        return entry
+
+    def ids(self, results):
+        return [(r.model, r.object_id) for r in results]
+
+    def test_saving_indexes_every_language(self):
+        entry = self.create_entry('Sunset', 'Over the sea')
+        documents = SearchDocument.objects.filter(model='entry',
+                                                  object_id=entry.pk)
+        self.assertEqual(sorted(d.language for d in documents), ['en', 'es'])
+
+    def test_matches_title_and_description(self):
+        entry = self.create_entry('Sunset', 'Over the sea')
+        self.assertEqual(self.ids(search.search('sunset', 'en')[0]),
+                         [('entry', entry.pk)])
+        self.assertEqual(self.ids(search.search('sea', 'en')[0]),
+                         [('entry', entry.pk)])
+
+    def test_every_word_must_match(self):
+        self.create_entry('Sunset', 'Over the sea')
+        self.assertEqual(search.search('sunset mountains', 'en')[0], [])
+
+    def test_stems_words(self):
+        entry = self.create_entry('Painting boats')
+        self.assertEqual(self.ids(search.search('boat', 'en')[0]),
+                         [('entry', entry.pk)])
+
+    def test_searches_translations(self):
+        entry = self.create_entry('Sunset', title_en='Sunset',
+                                  title_es='Atardecer',
+                                  description_es='Sobre el mar')
+        self.assertEqual(self.ids(search.search('atardecer', 'es')[0]),
+                         [('entry', entry.pk)])
+        self.assertEqual(search.search('atardecer', 'en')[0], [])
+
+    def test_untranslated_falls_back_to_default_language(self):
+        entry = self.create_entry('Sunset')
+        self.assertEqual(self.ids(search.search('sunset', 'es')[0]),
+                         [('entry', entry.pk)])
+
+    def test_untranslated_falls_back_to_any_translation(self):
+        entry = self.create_entry('', title_en='', title_es='Atardecer')
+        self.assertEqual(self.ids(search.search('atardecer', 'en')[0]),
+                         [('entry', entry.pk)])
+
+    def test_title_matches_rank_first(self):
+        in_description = self.create_entry('Boats', 'A sunset')
+        in_title = self.create_entry('Sunset', 'Boats')
+        self.assertEqual(self.ids(search.search('sunset', 'en')[0]),
+                         [('entry', in_title.pk),
+                          ('entry', in_description.pk)])
+
+    def test_drafts_and_scheduled_items_are_not_found(self):
+        self.create_entry('Sunset draft', published=False)
+        scheduled = self.create_entry('Sunset scheduled', published=False)
+        scheduled.publish(timezone.now() + datetime.timedelta(days=1))
+        self.assertEqual(search.search('sunset', 'en')[0], [])
+
+    def test_bulk_publishing_updates_the_index(self):
+        entry = self.create_entry('Sunset', published=False)
+        Entry.objects.filter(pk=entry.pk).publish_bulk()
+        self.assertEqual(self.ids(search.search('sunset', 'en')[0]),
+                         [('entry', entry.pk)])
+        Entry.objects.filter(pk=entry.pk).unpublish_bulk()
+        self.assertEqual(search.search('sunset', 'en')[0], [])
+
+    def test_searches_stories_and_categories(self):
+        story = Story.objects.create(title='Diary', text='A stormy night',
+                                     created_by=self.user)
+        story.publish(timezone.now() - datetime.timedelta(minutes=1))
+        category = Category.objects.create(name='Storms',
+                                           created_by=self.user)
+        self.assertEqual(self.ids(search.search('stormy', 'en')[0]),
+                         [('story', story.pk)])
+        self.assertEqual(
+            self.ids(search.search('storms', 'en', models=['category'])[0]),
+            [('category', category.pk)])
+
+    def test_changes_and_deletions_update_the_index(self):
+        entry = self.create_entry('Sunset')
+        entry.title = 'Sunrise'
+        entry.save()
+        self.assertEqual(search.search('sunset', 'en')[0], [])
+        self.assertEqual(len(search.search('sunrise', 'en')[0]), 1)
+        entry.delete()
+        self.assertEqual(search.search('sunrise', 'en')[0], [])
+        self.assertFalse(SearchDocument.objects.exists())
+
+    def create_image(self, title):
+        return Image.objects.create(
+            title=title, created_by=self.user,
+            image=SimpleUploadedFile(name='image.jpg',
+                                     content=open(IMAGE_PATH, 'rb').read(),
+                                     content_type='image/jpeg'))
+
+    def test_images_are_found_once_an_item_is_published(self):
+        image = self.create_image('Harbour')
+        self.assertEqual(search.search('harbour', 'en')[0], [])
+        entry = self.create_entry('Boats', published=False)
+        entry.images.add(image)
+        self.assertEqual(search.search('harbour', 'en')[0], [])
+        Entry.objects.filter(pk=entry.pk).publish_bulk()
+        self.assertEqual(self.ids(search.search('harbour', 'en')[0]),
+                         [('image', image.pk)])
+        Entry.objects.filter(pk=entry.pk).unpublish_bulk()
+        self.assertEqual(search.search('harbour', 'en')[0], [])
+
+    def test_images_follow_their_items(self):
+        image = self.create_image('Harbour')
+        entry = self.create_entry('Boats')
+        entry.images.add(image)
+        self.assertEqual(len(search.search('harbour', 'en')[0]), 1)
+        entry.images.clear()
+        self.assertEqual(search.search('harbour', 'en')[0], [])
+        story = Story.objects.create(title='Diary', text='At sea',
+                                     created_by=self.user)
+        story.update_cover(image)
+        self.assertEqual(search.search('harbour', 'en')[0], [])
+        story.publish(timezone.now() - datetime.timedelta(minutes=1))
+        self.assertEqual(len(search.search('harbour', 'en')[0]), 1)
+        story.delete()
+        self.assertEqual(search.search('harbour', 'en')[0], [])
+
+    def test_query_operators_are_taken_literally(self):
+        self.create_entry('Sunset')
+        self.assertEqual(search.search('"sunset* ^(', 'en')[0][0].title,
+                         'Sunset')
+        self.assertEqual(search.search('  !! ', 'en'), ([], None))
+
+    def test_keyset_pagination_visits_every_result_once(self):
+        entries = [self.create_entry(f'Sunset {i}') for i in range(7)]
+        seen = []
+        cursor = None
+        while True:
+            results, cursor = search.search('sunset', 'en', cursor=cursor,
+                                            limit=3)
+            seen.extend(r.object_id for r in results)
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), [e.pk for e in entries])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            search.search('sunset', 'en', cursor='garbage')
+        with self.assertRaises(InvalidCursor):
+            search.search('sunset', 'en', cursor=encode_token(['a', 1]))
+
+    def test_rebuild_search_index_command(self):
+        entry = self.create_entry('Sunset')
+        SearchDocument.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('1 objects indexed', out.getvalue())
+        self.assertEqual(self.ids(search.search('sunset', 'en')[0]),
+                         [('entry', entry.pk)])
+
+    def test_search_view(self):
+        entry = self.create_entry('Sunset')
+        response = self.client.get(reverse('gallery:search'),
+                                   {'q': 'sunset'}, HTTP_ACCEPT_LANGUAGE='en')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            response, reverse('gallery:entry-detail', args=[entry.pk]))
+
+    def test_search_view_invalid_cursor(self):
+        response = self.client.get(reverse('gallery:search'),
+                                   {'q': 'sunset', 'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
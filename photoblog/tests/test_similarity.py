@@ -0,0 +1,172 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for visual similarity."""
+import datetime
+import io
+import os
+import shutil
+from io import StringIO
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from photoblog import cache, similarity
+from photoblog.models import Entry, Image
+from accounts.models import User
+
+IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/diy.jpg')
+OTHER_IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/temple.jpg')
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+TEST_INDEX = os.path.join(TEST_MEDIA_ROOT, 'similarity', 'index.npy')
+
+
+def variant(path, width, quality=60):
+    """Returns the image at 'path' resized to 'width' and recompressed,
+    as JPEG bytes."""
+    with PILImage.open(path) as img:
+        img = img.resize((width, round(img.height * width / img.width)),
+                         PILImage.BILINEAR)
+        output = io.BytesIO()
+        img.save(output, 'JPEG', quality=quality)
+    return output.getvalue()
+
+
+def upload(content, name='image.jpg'):
+    return SimpleUploadedFile(name=name, content=content,
+                              content_type='image/jpeg')
+
+
+class FeatureTests(TestCase):
+    """Unit tests for the features and distances."""
+
+    def test_compute_packs_features(self):
+        features = similarity.compute(IMAGE_PATH)
+        self.assertEqual(len(features), similarity.FEATURE_SIZE)
+        self.assertEqual(features,
+                         similarity.compute(open(IMAGE_PATH, 'rb').read()))
+        self.assertEqual(similarity.distance(features, features), 0)
+
+    def test_copies_are_closer_than_other_images(self):
+        original = similarity.compute(IMAGE_PATH)
+        copy = similarity.compute(variant(IMAGE_PATH, 400))
+        other = similarity.compute(OTHER_IMAGE_PATH)
+        self.assertLess(similarity.distance(original, copy), 0.1)
+        self.assertLess(similarity.distance(original, copy),
+                        similarity.distance(original, other))
+        phash, dhash = similarity.hashes(original)
+        copy_phash, copy_dhash = similarity.hashes(copy)
+        self.assertLessEqual(bin(phash ^ copy_phash).count('1'), 6)
+        self.assertLessEqual(bin(dhash ^ copy_dhash).count('1'), 6)
+
+    def test_vectorized_distances_match(self):
+        if similarity.numpy is None:
+            self.skipTest('NumPy is not installed')
+        rows = [similarity.compute(path)
+                for path in (IMAGE_PATH, OTHER_IMAGE_PATH)]
+        index = similarity.numpy.array(
+            [similarity.to_record(pk, row) for pk, row in enumerate(rows)],
+            dtype=similarity.DTYPE)
+        found = similarity.distances(index, rows[0])
+        for value, row in zip(found, rows):
+            self.assertAlmostEqual(float(value),
+                                   similarity.distance(rows[0], row),
+                                   places=5)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0,
+                   PHOTOBLOG_SIMILARITY_INDEX=TEST_INDEX)
+class SimilarImagesTests(TestCase):
+    """Unit tests for Image.similar and its index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+
+    def setUp(self):
+        cache.get_cache().clear()
+        shutil.rmtree(os.path.dirname(TEST_INDEX), ignore_errors=True)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(TEST_INDEX), ignore_errors=True)
+
+    def create_images(self):
+        return [
+            Image.objects.create(title=title, created_by=self.user,
+                                 image=upload(content, f'{title}.jpg'))
+            for title, content in (
+                ('DIY', open(IMAGE_PATH, 'rb').read()),
+                ('Temple', open(OTHER_IMAGE_PATH, 'rb').read()),
+                ('DIY small', variant(IMAGE_PATH, 300)),
+                ('Temple small', variant(OTHER_IMAGE_PATH, 300)),
+            )]
+
+    def test_features_are_computed_at_ingest(self):
+        image = Image.objects.create(title='DIY', created_by=self.user,
+                                     image=upload(open(IMAGE_PATH, 'rb')
+                                                  .read()))
+        image.refresh_from_db()
+        self.assertEqual(bytes(image.features),
+                         similarity.compute(IMAGE_PATH))
+        image.image = upload(open(OTHER_IMAGE_PATH, 'rb').read())
+        image.save()
+        image.refresh_from_db()
+        self.assertEqual(bytes(image.features),
+                         similarity.compute(OTHER_IMAGE_PATH))
+
+    def test_similar_without_index(self):
+        diy, temple, diy_small, temple_small = self.create_images()
+        self.assertEqual(diy.similar(1), [diy_small])
+        self.assertEqual(temple_small.similar(1), [temple])
+        self.assertEqual(len(diy.similar(10)), 3)
+
+    def test_similar_with_index(self):
+        if similarity.numpy is None:
+            self.skipTest('NumPy is not installed')
+        diy, temple, diy_small, temple_small = self.create_images()
+        out = StringIO()
+        call_command('build_similarity_index', stdout=out)
+        self.assertIn('4 images indexed', out.getvalue())
+        self.assertEqual(len(similarity.load_index()), 4)
+        # Ingested since the index was built
+        newest = Image.objects.create(
+            title='DIY smaller', created_by=self.user,
+            image=upload(variant(IMAGE_PATH, 200), 'smaller.jpg'))
+        self.assertEqual(set(diy.similar(2)), {diy_small, newest})
+        # Replaced since, though older than the newest image indexed
+        temple_small.image = upload(variant(IMAGE_PATH, 250), 'again.jpg')
+        temple_small.save()
+        diy.refresh_from_db()
+        temple_small.refresh_from_db()
+        found = {pk: value for value, pk in similarity.nearest(
+            diy.features, 4, exclude=diy.pk)}
+        self.assertAlmostEqual(found[temple_small.pk], similarity.distance(
+            bytes(diy.features), bytes(temple_small.features)), places=5)
+        # Deleted since the index was built
+        diy_small.delete()
+        newest.delete()
+        self.assertEqual(set(diy.similar(5)), {temple, temple_small})
+
+    def test_similar_entries_on_detail_page(self):
+        diy, temple, diy_small, _temple_small = self.create_images()
+        entries = []
+        for title, cover in (('A', diy), ('B', temple), ('C', diy_small)):
+            entry = Entry.objects.create(title_en=title, cover=cover,
+                                         created_by=self.user)
+            entry.publish(timezone.now() - datetime.timedelta(minutes=1))
+            entries.append(entry)
+        self.assertEqual(
+            similarity.similar_entries(entries[0].pk, diy.pk, 1),
+            [entries[2]])
+        response = self.client.get(reverse('gallery:entry-detail',
+                                           args=[entries[0].pk]))
+        self.assertEqual([s['id'] for s in response.context['similar']],
+                         [entries[2].pk, entries[1].pk])
+        self.assertContains(response, 'More like this')
@@ -0,0 +1,88 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for the content addressed image storage."""
+import hashlib
+import os
+from unittest import mock
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from photoblog import renditions
+from photoblog.models import Image
+from photoblog.storage import ContentAddressedStorage, blob_name
+from accounts.models import User
+
+IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/diy.jpg')
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+
+IMAGE_DIGEST = hashlib.sha256(open(IMAGE_PATH, 'rb').read()).hexdigest()
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+    """Unit tests for ContentAddressedStorage."""
+
+    def test_files_are_named_by_digest(self):
+        storage = ContentAddressedStorage()
+        name = storage.save('some/dir/photo.JPG', ContentFile(b'contents'))
+        digest = hashlib.sha256(b'contents').hexdigest()
+        self.assertEqual(name, blob_name(digest, '.jpg'))
+        self.assertEqual(storage.open(name).read(), b'contents')
+
+    def test_same_contents_are_stored_once(self):
+        storage = ContentAddressedStorage()
+        first = storage.save('a.png', ContentFile(b'same'))
+        second = storage.save('b.png', ContentFile(b'same'))
+        self.assertEqual(first, second)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0)
+class ImageDeduplicationTests(TestCase):
+    """Unit tests for Image rows sharing a blob."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+
+    def create_image(self, title):
+        return Image.objects.create(
+            title=title,
+            created_by=self.user,
+            image=SimpleUploadedFile(
+                name=f'{title}.jpg',
+                content=open(IMAGE_PATH, 'rb').read(),
+                content_type='image/jpeg',
+            ),
+        )
+
+    def test_duplicate_uploads_share_a_blob(self):
+        first = self.create_image('first')
+        second = self.create_image('second')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(second.digest, IMAGE_DIGEST)
+
+    def test_duplicate_uploads_share_renditions(self):
+        first = self.create_image('first')
+        with mock.patch.object(renditions, 'render_all') as render_all:
+            second = self.create_image('second')
+        render_all.assert_not_called()
+        self.assertEqual(
+            list(first.renditions.values_list('name', 'file')),
+            list(second.renditions.values_list('name', 'file')))
+
+    def test_blob_is_kept_while_referenced(self):
+        first = self.create_image('first')
+        second = self.create_image('second')
+        path = first.image.path
+        thumbnail = first.get_rendition('thumbnail').file.path
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue(os.path.exists(thumbnail))
+        second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(thumbnail))
@@ -0,0 +1,104 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for Deep Zoom tile pyramids."""
+import os
+import shutil
+import tempfile
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image as PILImage
+
+from photoblog import tiles
+from photoblog.models import Image
+from accounts.models import User
+
+IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/diy.jpg')
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+
+
+class BuildPyramidTests(TestCase):
+    """Unit tests for build_pyramid."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def assertPyramid(self, source):
+        width, height, levels = tiles.build_pyramid(
+            source, self.directory, 'art')
+        self.assertEqual((width, height, levels), (960, 640, 11))
+        files = os.path.join(self.directory, 'art_files')
+        self.assertEqual(sorted(os.listdir(os.path.join(files, '10'))),
+                         ['0_0.jpg', '0_1.jpg', '0_2.jpg', '1_0.jpg',
+                          '1_1.jpg', '1_2.jpg', '2_0.jpg', '2_1.jpg',
+                          '2_2.jpg', '3_0.jpg', '3_1.jpg', '3_2.jpg'])
+        # Inner tiles overlap their neighbours by one pixel on each side
+        self.assertEqual(
+            PILImage.open(os.path.join(files, '10', '1_1.jpg')).size,
+            (258, 258))
+        self.assertEqual(
+            PILImage.open(os.path.join(files, '9', '1_1.jpg')).size,
+            (225, 65))
+        self.assertEqual(os.listdir(os.path.join(files, '0')), ['0_0.jpg'])
+        self.assertTrue(os.path.exists(
+            os.path.join(self.directory, 'art.dzi')))
+
+    def test_pyramid_from_jpeg(self):
+        self.assertPyramid(IMAGE_PATH)
+
+    def test_pyramid_from_striped_image(self):
+        path = os.path.join(self.directory, 'art.ppm')
+        PILImage.open(IMAGE_PATH).save(path)
+        self.assertEqual(len(list(tiles.iter_strips(path, 100))), 7)
+        self.assertPyramid(path)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0)
+class DeepZoomImageTests(TestCase):
+    """Unit tests for the pyramids of Image and their views."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+
+    def create_image(self, deep_zoom=True):
+        return Image.objects.create(
+            title='Zoomable',
+            created_by=self.user,
+            deep_zoom=deep_zoom,
+            image=SimpleUploadedFile(
+                name='zoom.jpg',
+                content=open(IMAGE_PATH, 'rb').read(),
+                content_type='image/jpeg',
+            ),
+        )
+
+    def test_pyramid_is_built_for_flagged_images(self):
+        image = self.create_image()
+        self.assertTrue(image.dzi_url.endswith(f'{image.digest}.dzi'))
+        image.delete()
+        self.assertFalse(os.path.exists(tiles.descriptor_path(image.digest)))
+
+    def test_pyramid_is_not_built_for_other_images(self):
+        image = self.create_image(deep_zoom=False)
+        self.assertIsNone(image.dzi_url)
+
+    def test_tiles_are_served_with_long_cache_headers(self):
+        image = self.create_image()
+        response = self.client.get(
+            f'/gallery/tiles/{image.digest}_files/10/1_1.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(image.dzi_url)
+        self.assertEqual(response.status_code, 200)
+        image.delete()
+
+    def test_missing_tile_returns_404(self):
+        response = self.client.get(f'/gallery/tiles/{"0" * 64}_files/1/0_0.jpg')
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,82 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for bulk unit conversion."""
+from django.template import Context, Template
+from django.test import TestCase
+
+from photoblog import units
+from photoblog.models import Dimension, Entry
+from accounts.models import User
+
+
+class ConvertTests(TestCase):
+    """Unit tests for photoblog.units."""
+
+    def test_factor(self):
+        self.assertAlmostEqual(units.factor('ft', 'in'), 12)
+        self.assertEqual(units.factor('cm', 'mm'), 10)
+        with self.assertRaises(ValueError):
+            units.factor('cm', 'yd')
+
+    def test_convert_rows_from_mixed_units(self):
+        rows = [(3, 1, None), (100, 50, 2)]
+        self.assertEqual(units.convert(rows, ['ft', 'cm'], 'in'),
+                         [(36.0, 12.0, None), (39.3701, 19.685, 0.7874)])
+
+    def test_convert_without_numpy(self):
+        rows = [(3, 1, None), (100, 50, 2)]
+        expected = units.convert(rows, ['ft', 'cm'], 'in')
+        numpy, units.numpy = units.numpy, None
+        try:
+            self.assertEqual(units.convert(rows, ['ft', 'cm'], 'in'),
+                             expected)
+        finally:
+            units.numpy = numpy
+
+    def test_convert_nothing(self):
+        self.assertEqual(units.convert([], [], 'cm'), [])
+
+
+class DimensionConversionTests(TestCase):
+    """Unit tests for converting many Dimensions."""
+
+    def test_display_as_unit_without_width(self):
+        dimension = Dimension.objects.create(height=1, length=2, unit='ft')
+        self.assertEqual(dimension.display_as_unit('in'),
+                         'h: 12.0 in, l: 24.0 in')
+
+    def test_queryset_convert_unit(self):
+        Dimension.objects.create(height=1, length=2, unit='ft')
+        Dimension.objects.create(height=10, length=20, width=5, unit='mm')
+        with self.assertNumQueries(4):
+            # Select, savepoint, update, release
+            count = Dimension.objects.all().convert_unit('cm', batch_size=2)
+        self.assertEqual(count, 2)
+        self.assertEqual(
+            sorted(Dimension.objects.values_list('unit', 'height', 'length',
+                                                 'width')),
+            [('cm', 1.0, 2.0, 0.5), ('cm', 30.48, 60.96, None)])
+
+    def test_queryset_convert_unit_in_batches(self):
+        for i in range(1, 6):
+            Dimension.objects.create(height=i, length=i, unit='m')
+        Dimension.objects.all().convert_unit('mm', batch_size=2)
+        self.assertEqual(sorted(Dimension.objects.values_list(
+            'height', flat=True)), [1000, 2000, 3000, 4000, 5000])
+        self.assertFalse(Dimension.objects.exclude(unit='mm').exists())
+
+    def test_filters(self):
+        user = User.objects.create_user(email='test.user@example.com',
+                                        username='test_user223',
+                                        password='testpassword')
+        Entry.objects.create(
+            title='Sized', created_by=user,
+            size=Dimension.objects.create(height=1, length=2, unit='ft'))
+        Entry.objects.create(title='Unsized', created_by=user)
+        template = Template(
+            "{% load dimensions %}"
+            "{% for e, size in entries|with_sizes:'in' %}"
+            "{{ e.title }}: {{ size }}|{% endfor %}")
+        entries = Entry.objects.select_related('size').order_by('title')
+        self.assertEqual(
+            template.render(Context({'entries': entries})),
+            'Sized: h: 12.0 in, l: 24.0 in|Unsized: |')
@@ -0,0 +1,136 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for chunked uploads."""
+import datetime
+import hashlib
+import os
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.core.management import call_command
+from django.contrib.auth.models import Permission
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from photoblog import uploads
+from photoblog.models import ChunkedUpload, Image
+from accounts.models import User
+
+IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/diy.jpg')
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0,
+                   PHOTOBLOG_UPLOAD_DIR='/tmp/django_test_uploads')
+class ChunkedUploadTests(TestCase):
+    """Unit tests for the chunked upload views."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+        cls.user.user_permissions.add(
+            Permission.objects.get(codename='add_image'))
+        cls.content = open(IMAGE_PATH, 'rb').read()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def start(self):
+        response = self.client.post(reverse('gallery:upload-start'), {
+            'filename': 'scan.jpg', 'size': len(self.content)})
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def send(self, upload, first, last, checksum=None):
+        chunk = self.content[first:last + 1]
+        return self.client.put(
+            upload['url'], chunk, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {first}-{last}/{len(self.content)}',
+            HTTP_X_CHECKSUM_SHA256=checksum or hashlib.sha256(chunk).hexdigest(),
+        )
+
+    def test_upload_in_chunks_creates_image(self):
+        upload = self.start()
+        size = len(self.content)
+        for first in range(0, size, 20000):
+            response = self.send(upload, first, min(first + 20000, size) - 1)
+            self.assertEqual(response.status_code, 200)
+        # Test transactions never commit
+        with mock.patch.object(uploads.transaction, 'on_commit',
+                               lambda func: func()):
+            response = self.client.post(upload['finalize_url'],
+                                        {'title': 'Big scan'})
+        self.assertEqual(response.status_code, 201)
+        image = Image.objects.get(pk=response.json()['id'])
+        self.assertEqual(image.image.read(), self.content)
+        self.assertFalse(os.path.exists(
+            uploads.upload_path(ChunkedUpload.objects.get())))
+
+    def test_finalizing_twice_returns_the_same_image(self):
+        upload = self.start()
+        self.send(upload, 0, len(self.content) - 1)
+        first = ChunkedUpload.objects.get()
+        # Read before the other request finalized it
+        second = ChunkedUpload.objects.get()
+        with mock.patch.object(uploads.transaction, 'on_commit',
+                               lambda func: func()):
+            image = uploads.finalize(first, title='Scan')
+            self.assertEqual(uploads.finalize(second, title='Scan'), image)
+        self.assertEqual(Image.objects.count(), 1)
+
+    def test_abandoned_uploads_expire(self):
+        stale, fresh, done = self.start(), self.start(), self.start()
+        self.send(done, 0, len(self.content) - 1)
+        uploads.finalize(ChunkedUpload.objects.get(pk=done['id']),
+                         title='Done')
+        ChunkedUpload.objects.update(
+            created_at=timezone.now() - datetime.timedelta(days=2))
+        path = uploads.upload_path(ChunkedUpload.objects.get(pk=stale['id']))
+        os.utime(path, (0, 0))
+        out = StringIO()
+        call_command('expire_uploads', stdout=out)
+        self.assertIn('1 abandoned uploads discarded', out.getvalue())
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(
+            set(str(pk) for pk in
+                ChunkedUpload.objects.values_list('pk', flat=True)),
+            {fresh['id'], done['id']})
+
+    def test_bad_checksum_is_rejected_and_discarded(self):
+        upload = self.start()
+        self.send(upload, 0, 999)
+        response = self.send(upload, 1000, 1999, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['offset'], 1000)
+        status = self.client.get(upload['url']).json()
+        self.assertEqual(status['offset'], 1000)
+        self.assertEqual(self.send(upload, 1000, 1999).status_code, 200)
+
+    def test_unexpected_offset_returns_resume_offset(self):
+        upload = self.start()
+        self.send(upload, 0, 999)
+        response = self.send(upload, 2000, 2999)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 1000)
+
+    def test_incomplete_upload_cannot_be_finalized(self):
+        upload = self.start()
+        self.send(upload, 0, 999)
+        response = self.client.post(upload['finalize_url'], {'title': 'x'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Image.objects.count(), 0)
+
+    def test_oversized_chunk_is_rejected(self):
+        upload = self.start()
+        with self.settings(PHOTOBLOG_UPLOAD_MAX_CHUNK_SIZE=100):
+            self.assertEqual(self.send(upload, 0, 999).status_code, 413)
+
+    def test_users_without_permission_are_forbidden(self):
+        self.client.logout()
+        response = self.client.post(reverse('gallery:upload-start'), {
+            'filename': 'scan.jpg', 'size': 10})
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,95 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for photoblog views."""
+import datetime
+import hashlib
+import os
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from photoblog import cache
+from photoblog.models import Category, Entry, Image
+from accounts.models import User
+
+IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/diy.jpg')
+
+TEST_MEDIA_ROOT = "/tmp/django_test_media_dump"
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PHOTOBLOG_IMAGE_WORKERS=0)
+class EntryListViewTests(TestCase):
+    """Unit tests for EntryListView."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='test.user@example.com',
+                                            username='test_user223',
+                                            password='testpassword')
+        cls.category = Category.objects.create(name='Oil paintings',
+                                               created_by=cls.user)
+
+    def setUp(self):
+        cache.get_cache().clear()
+
+    def create_entries(self, count, published=True):
+        for i in range(Entry.objects.count(), Entry.objects.count() + count):
+            entry = Entry.objects.create(
+                title=f'Entry {i}',
+                category=self.category,
+                created_by=self.user,
+            )
+            entry.set_cover_image(Image(
+                title=f'Cover {i}',
+                caption=f'Caption {i}',
+                created_by=self.user,
+                image=SimpleUploadedFile(
+                    name='cover.jpg',
+                    content=open(IMAGE_PATH, 'rb').read(),
+                    content_type='image/jpeg',
+                ),
+            ))
+            if published:
+                entry.publish(timezone.now())
+
+    def test_only_published_entries_are_listed(self):
+        self.create_entries(2)
+        self.create_entries(1, published=False)
+        Entry.objects.filter(title='Entry 0').update(
+            published_at=timezone.now() + datetime.timedelta(days=1))
+        response = self.client.get(reverse('gallery:entry-list'))
+        self.assertEqual([e.title for e in response.context['entry_list']],
+                         ['Entry 1'])
+
+    def test_query_count_does_not_depend_on_entry_count(self):
+        url = reverse('gallery:entry-list')
+        self.create_entries(2)
+        # Entries and renditions, facet counts and category names
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertContains(response, 'Caption 1')
+        self.create_entries(10)
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertContains(response, 'Caption 11')
+        self.assertContains(response, 'srcset')
+
+    def test_stale_page_is_served_while_refreshed(self):
+        url = reverse('gallery:entry-list')
+        self.create_entries(1)
+        self.client.get(url)
+        self.create_entries(1)
+        # Other processes are rebuilding the page and its facets
+        empty = hashlib.md5(b'').hexdigest()
+        keys = [f'photoblog:listing:entry:24:{empty}:{empty}',
+                f'photoblog:facets:en:{empty}']
+        for key in keys:
+            cache.get_cache().add(f'{key}:lock', 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertNotContains(response, 'Caption 1')
+        for key in keys:
+            cache.get_cache().delete(f'{key}:lock')
+        self.assertContains(self.client.get(url), 'Caption 1')
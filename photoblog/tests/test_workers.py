@@ -0,0 +1,63 @@
+# pylint: disable=no-member, missing-docstring, invalid-name
+"""Unit tests for the photoblog image worker pool."""
+import hashlib
+import os
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from photoblog.renditions import render_all
+from photoblog.workers import ImageWorkerPool, PoolFull, hash_file
+
+IMAGE_PATH = os.path.join(
+    settings.BASE_DIR, 'photoblog/static/photoblog/img/diy.jpg')
+
+
+class ImageWorkerPoolTests(SimpleTestCase):
+    """Unit tests for ImageWorkerPool."""
+
+    def setUp(self):
+        self.pool = ImageWorkerPool(workers=2, queue_size=2)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_job_result_is_reported(self):
+        job_id = self.pool.submit(hash_file, IMAGE_PATH)
+        result = self.pool.result(job_id, timeout=30)
+        expected = hashlib.sha256(open(IMAGE_PATH, 'rb').read()).hexdigest()
+        self.assertTrue(result.ok)
+        self.assertEqual(result.value, expected)
+        self.assertIn(result, self.pool.finished)
+
+    def test_failed_job_is_reported(self):
+        job_id = self.pool.submit(hash_file, '/does/not/exist.jpg')
+        result = self.pool.result(job_id, timeout=30)
+        self.assertFalse(result.ok)
+        self.assertIn('FileNotFoundError', result.error)
+        self.assertIn(result, self.pool.failed)
+
+    def test_callback_receives_result(self):
+        received = []
+        job_id = self.pool.submit(
+            render_all, IMAGE_PATH, {'thumbnail': {'width': 96}},
+            callback=received.append)
+        result = self.pool.result(job_id, timeout=30)
+        self.assertEqual(received, [result])
+        name, data, width, height, fmt = result.value[0]
+        self.assertEqual((name, width, height, fmt),
+                         ('thumbnail', 96, 64, 'JPEG'))
+
+    def test_submit_raises_when_queue_is_full(self):
+        pool = ImageWorkerPool(workers=1, queue_size=0)
+        try:
+            pool.submit(os.system, 'sleep 1')
+            with self.assertRaises(PoolFull):
+                pool.submit(hash_file, IMAGE_PATH, timeout=0.01)
+        finally:
+            pool.shutdown()
+
+    def test_inline_pool_runs_in_calling_thread(self):
+        pool = ImageWorkerPool(workers=0, queue_size=0)
+        job_id = pool.submit(hash_file, IMAGE_PATH)
+        self.assertEqual(pool.pending, 0)
+        self.assertTrue(pool.result(job_id).ok)
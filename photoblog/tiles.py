@@ -0,0 +1,294 @@
+"""Deep Zoom (DZI) tile pyramids for high resolution artworks.
+
+Images flagged with Image.deep_zoom get a pyramid of 256px tiles at
+ingest (see photoblog.ingest), so a viewer such as OpenSeadragon can zoom
+into a scan while only fetching the tiles on screen. Pyramids are stored
+by blob digest under MEDIA_ROOT/tiles:
+
+    tiles/<digest>.dzi
+    tiles/<digest>_files/<level>/<column>_<row>.jpg
+
+The original is read in horizontal strips, each level being built from
+the strips of the level above it, so only a few rows of every level are
+held in memory. Uncompressed and strip based files (TIFF, PPM) are decoded
+strip by strip too; other formats, JPEG included, are decoded at once.
+"""
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from PIL import Image as PILImage
+
+from photoblog import cache
+
+TILE_SIZE = 256
+OVERLAP = 1
+TILE_FORMAT = 'jpg'
+TILE_QUALITY = 85
+STRIP_HEIGHT = 256
+
+DZI_TEMPLATE = '<?xml version="1.0" encoding="UTF-8"?>\n'\
+    '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '\
+    'TileSize="{tile_size}" Overlap="{overlap}" Format="{format}">'\
+    '<Size Width="{width}" Height="{height}"/></Image>\n'
+
+
+def tiles_root() -> str:
+    return os.path.join(settings.MEDIA_ROOT, 'tiles')
+
+
+def descriptor_path(digest: str) -> str:
+    return os.path.join(tiles_root(), f'{digest}.dzi')
+
+
+def tile_path(digest: str, level: int, column: int, row: int) -> str:
+    return os.path.join(tiles_root(), f'{digest}_files', str(level),
+                        f'{column}_{row}.{TILE_FORMAT}')
+
+
+def level_count(width: int, height: int) -> int:
+    """Number of levels of the pyramid, the last one at full size."""
+    return (max(width, height) - 1).bit_length() + 1
+
+
+def iter_strips(path: str, height: int = STRIP_HEIGHT):
+    """Yields the image at 'path' as consecutive RGB strips, top to
+    bottom, decoding a strip at a time when the format allows it.
+
+    Keyword arguments:
+    path -- path to the image
+    height -- rows per strip for uncompressed images (default 256)
+    """
+    with PILImage.open(path) as img:
+        mode = img.mode
+        width, total = img.size
+        tiles = list(img.tile)
+        lengths = _lengths(img)
+    bands = _bands(tiles, width, total, height, lengths)
+    if bands is None:
+        with PILImage.open(path) as img:
+            img = img.convert('RGB')
+            for top in range(0, total, height):
+                yield img.crop((0, top, width, min(top + height, total)))
+        return
+    with open(path, 'rb') as fd:
+        for top, bottom, band_tiles in bands:
+            band = PILImage.new(mode, (width, bottom - top))
+            for codec, (x0, y0, x1, y1), offset, args, length in band_tiles:
+                fd.seek(offset)
+                band.paste(PILImage.frombytes(
+                    mode, (x1 - x0, y1 - y0), fd.read(length), codec, args),
+                    (x0, y0))
+            yield band.convert('RGB')
+
+
+def _lengths(img) -> dict:
+    """Returns the byte counts of the strips or tiles of a TIFF 'img', by
+    offset, or an empty dict."""
+    tags = getattr(img, 'tag_v2', None)
+    if tags is None:
+        return {}
+    for offsets, counts in ((273, 279), (324, 325)):
+        if offsets in tags and counts in tags:
+            return dict(zip(tags[offsets], tags[counts]))
+    return {}
+
+
+def _stride(rawmode, width):
+    return len(PILImage.new(rawmode, (width, 1)).tobytes())
+
+
+def _bands(tiles, width, total, height, lengths):
+    """Returns (top, bottom, tiles) for every strip of the image, the
+    tiles being shifted to decode the strip alone, with the number of
+    bytes to read for each, or None if the image can't be decoded in
+    strips."""
+    if len(tiles) == 1 and tiles[0][0] == 'raw':
+        codec, (x0, y0, x1, y1), offset, args = tiles[0]
+        if isinstance(args, str):
+            args = (args,)
+        rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+        if (x0, y0, x1, y1) != (0, 0, width, total) or orientation != 1:
+            return None
+        stride = stride or _stride(rawmode, width)
+        bands = []
+        for top in range(0, total, height):
+            rows = min(top + height, total) - top
+            bands.append((top, top + rows, [(
+                codec, (0, 0, width, rows), offset + top * stride,
+                (rawmode, stride, 1), rows * stride)]))
+        return bands
+    if len(tiles) < 2:
+        return None
+    rows = {}
+    for codec, (x0, y0, x1, y1), offset, args in tiles:
+        if codec == 'raw':
+            if isinstance(args, str):
+                args = (args,)
+            rawmode, stride = (tuple(args) + (0,))[:2]
+            length = (stride or _stride(rawmode, x1 - x0)) * (y1 - y0)
+        elif offset in lengths:
+            length = lengths[offset]
+        else:
+            return None
+        rows.setdefault((y0, y1), []).append(
+            (codec, (x0, 0, x1, y1 - y0), offset, args, length))
+    bands = sorted((top, bottom, t) for (top, bottom), t in rows.items())
+    expected = 0
+    for top, bottom, _ in bands:
+        if top != expected:
+            return None
+        expected = bottom
+    return bands if expected == total else None
+
+
+def _stack(top, bottom):
+    img = PILImage.new('RGB', (top.width, top.height + bottom.height))
+    img.paste(top, (0, 0))
+    img.paste(bottom, (0, top.height))
+    return img
+
+
+class _Level:
+    """One level of the pyramid being built. Keeps the rows it received
+    until a row of tiles can be cut from them, and passes them on,
+    halved, to the level below."""
+    def __init__(self, level, width, height, directory, below):
+        self.level = level
+        self.width = width
+        self.height = height
+        self.directory = os.path.join(directory, str(level))
+        self.below = below
+        self.buffer = None
+        self.top = 0
+        self.received = 0
+        self.row = 0
+        self.carry = None
+        os.makedirs(self.directory)
+
+    def feed(self, strip):
+        self.buffer = strip if self.buffer is None \
+            else _stack(self.buffer, strip)
+        self.received += strip.height
+        self._emit()
+        if self.below is not None:
+            self._halve(strip)
+
+    def finish(self):
+        if self.below is not None:
+            if self.carry is not None:
+                self.below.feed(self.carry.resize((self.below.width, 1),
+                                                  PILImage.BOX))
+            self.below.finish()
+        self._emit()
+
+    def _halve(self, strip):
+        if self.carry is not None:
+            strip = _stack(self.carry, strip)
+            self.carry = None
+        even = strip.height - strip.height % 2
+        if even < strip.height:
+            self.carry = strip.crop((0, even, self.width, strip.height))
+        if even:
+            self.below.feed(
+                strip.crop((0, 0, self.width, even)).resize(
+                    (self.below.width, even // 2), PILImage.BOX))
+
+    def _emit(self):
+        while self.row * TILE_SIZE < self.height:
+            y0 = max(self.row * TILE_SIZE - OVERLAP, 0)
+            y1 = min((self.row + 1) * TILE_SIZE + OVERLAP, self.height)
+            if self.received < y1:
+                return
+            band = self.buffer.crop((0, y0 - self.top, self.width,
+                                     y1 - self.top))
+            for column in range(0, (self.width - 1) // TILE_SIZE + 1):
+                x0 = max(column * TILE_SIZE - OVERLAP, 0)
+                x1 = min((column + 1) * TILE_SIZE + OVERLAP, self.width)
+                band.crop((x0, 0, x1, y1 - y0)).save(
+                    os.path.join(self.directory,
+                                 f'{column}_{self.row}.{TILE_FORMAT}'),
+                    quality=TILE_QUALITY)
+            self.row += 1
+            # Past the last row there is nothing left to keep
+            keep = min(max(self.row * TILE_SIZE - OVERLAP, 0), self.received)
+            if keep > self.top:
+                self.buffer = self.buffer.crop(
+                    (0, keep - self.top, self.width, self.buffer.height))
+                self.top = keep
+
+
+def build_pyramid(source, directory: str, name: str) -> tuple:
+    """Builds the pyramid of the image in 'source' as 'name'.dzi and
+    'name'_files in 'directory'. The pyramid only appears once complete.
+
+    Returns the (width, height, levels) of the pyramid.
+
+    Keyword arguments:
+    source -- path to the image, or its contents as bytes
+    directory -- directory to write the pyramid to
+    name -- base name of the pyramid, i.e. the blob digest
+    """
+    os.makedirs(directory, exist_ok=True)
+    work = tempfile.mkdtemp(prefix='.tmp-', dir=directory)
+    try:
+        if isinstance(source, bytes):
+            path = os.path.join(work, 'source')
+            with open(path, 'wb') as fd:
+                fd.write(source)
+            source = path
+        with PILImage.open(source) as img:
+            width, height = img.size
+        levels = level_count(width, height)
+        files = os.path.join(work, f'{name}_files')
+        below = None
+        for level in range(levels):
+            scale = 2 ** (levels - 1 - level)
+            below = _Level(level, -(-width // scale), -(-height // scale),
+                           files, below)
+        for strip in iter_strips(source):
+            below.feed(strip)
+        below.finish()
+        with open(os.path.join(work, f'{name}.dzi'), 'w') as fd:
+            fd.write(DZI_TEMPLATE.format(
+                tile_size=TILE_SIZE, overlap=OVERLAP, format=TILE_FORMAT,
+                width=width, height=height))
+        final_files = os.path.join(directory, f'{name}_files')
+        if os.path.exists(final_files):
+            shutil.rmtree(final_files)
+        os.replace(files, final_files)
+        # The descriptor last: its presence marks a complete pyramid
+        os.replace(os.path.join(work, f'{name}.dzi'),
+                   os.path.join(directory, f'{name}.dzi'))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return width, height, levels
+
+
+def delete_pyramid(digest: str) -> None:
+    """Removes the pyramid of blob 'digest', if any."""
+    if not digest:
+        return
+    if os.path.exists(descriptor_path(digest)):
+        os.remove(descriptor_path(digest))
+    shutil.rmtree(os.path.join(tiles_root(), f'{digest}_files'),
+                  ignore_errors=True)
+
+
+def pending_step(image, force: bool = False):
+    """Ingest step: the arguments of build_pyramid if 'image' is flagged
+    for deep zoom and its blob has no pyramid yet, or None. Uploads made
+    before the blob storage have no digest and are skipped."""
+    if not image.deep_zoom or not image.digest:
+        return None
+    if os.path.exists(descriptor_path(image.digest)) and not force:
+        return None
+    return {'directory': tiles_root(), 'name': image.digest}
+
+
+def pyramid_built(image, source_name: str, value: tuple) -> None:
+    """Ingest step: nothing to record, the descriptor marks the pyramid
+    as built. Cached items using the image are dropped to pick up its
+    dzi_url."""
+    cache.invalidate_image(image.pk)
@@ -0,0 +1,83 @@
+"""Unit conversion of Dimension sizes, in bulk.
+
+Conversion factors between every pair of units are precomputed in a
+matrix, indexed by the position of the units in UNITS. When NumPy is
+installed the matrix is an array and whole columns of sizes are converted
+at once; otherwise the same computation runs in plain Python.
+"""
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+UNITS = ('mm', 'cm', 'm', 'in', 'ft')
+MILLIMETERS_PER_UNIT = {'mm': 1.0, 'cm': 10.0, 'm': 1000.0, 'in': 25.4,
+                        'ft': 304.8}
+# Decimals kept by conversions, hides floating point noise (36.00000001)
+PRECISION = 4
+
+FACTORS = [[MILLIMETERS_PER_UNIT[source] / MILLIMETERS_PER_UNIT[target]
+            for target in UNITS] for source in UNITS]
+MATRIX = numpy.array(FACTORS) if numpy is not None else FACTORS
+
+
+def unit_index(unit: str) -> int:
+    """Returns the position of 'unit' in the conversion matrix.
+
+    Raises ValueError if 'unit' is unknown.
+    """
+    try:
+        return UNITS.index(unit)
+    except ValueError:
+        raise ValueError(f"Unit must be one of: {', '.join(UNITS)}")
+
+
+def factor(source: str, target: str) -> float:
+    """Returns the factor converting 'source' units to 'target' units."""
+    return FACTORS[unit_index(source)][unit_index(target)]
+
+
+def convert(rows, sources, target: str) -> list:
+    """Converts every row of sizes in 'rows', in the matching unit of
+    'sources', to 'target'. Sizes may be None.
+
+    Returns a list of tuples of converted sizes.
+
+    Keyword arguments:
+    rows -- sequence of equally long tuples of sizes
+    sources -- sequence of units, one per row
+    target -- unit to convert to
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    column = unit_index(target)
+    indexes = [unit_index(unit) for unit in sources]
+    if numpy is None:
+        return [
+            tuple(round(v * FACTORS[i][column], PRECISION)
+                  if v is not None else None for v in row)
+            for row, i in zip(rows, indexes)
+        ]
+    values = numpy.array(rows, dtype=float)  # None becomes nan
+    factors = MATRIX[indexes, column][:, numpy.newaxis]
+    converted = numpy.round(values * factors, PRECISION)
+    return [
+        tuple(None if numpy.isnan(v) else float(v) for v in row)
+        for row in converted
+    ]
+
+
+def convert_dimensions(dimensions, target: str) -> list:
+    """Returns the (height, length, width) of every Dimension in
+    'dimensions' in 'target' units, converted at once."""
+    dimensions = list(dimensions)
+    return convert(((d.height, d.length, d.width) for d in dimensions),
+                   [d.unit for d in dimensions], target)
+
+
+def format_size(height, length, width, unit: str) -> str:
+    """Formats a size the way Dimension.__str__ does."""
+    if width is not None:
+        return f'h: {height} {unit}, l: {length}  {unit}, w: {width}  {unit}'
+    return f'h: {height} {unit}, l: {length} {unit}'
@@ -0,0 +1,194 @@
+"""Chunked, resumable uploads of large originals.
+
+An upload is started with its file name and size, then its bytes are
+appended in order, one chunk per request, each with its SHA-256 checksum.
+Chunks are streamed to a temporary file, so memory use does not depend
+on the size of the file. A client that lost its connection asks for the
+offset reached so far and carries on from there. Once every byte is in,
+finalizing the upload creates the photoblog Image. Uploads left
+unfinished are discarded by the expire_uploads command once untouched
+for PHOTOBLOG_UPLOAD_MAX_AGE.
+
+Settings:
+
+    PHOTOBLOG_UPLOAD_DIR -- directory holding partial uploads
+                            (default <tempdir>/photoblog_uploads)
+    PHOTOBLOG_UPLOAD_MAX_CHUNK_SIZE -- largest chunk accepted, in bytes
+                                       (default 8MB)
+    PHOTOBLOG_UPLOAD_MAX_AGE -- seconds an unfinished upload is kept
+                                since its last chunk (default 1 day)
+"""
+import datetime
+import hashlib
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+READ_SIZE = 64 * 1024
+
+
+class ChunkError(Exception):
+    """Raised when a chunk is rejected. 'status' is the HTTP status the
+    client should get, 'offset' the offset to resume from."""
+    def __init__(self, message: str, status: int = 400, offset: int = None):
+        super(ChunkError, self).__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def upload_dir() -> str:
+    return getattr(settings, 'PHOTOBLOG_UPLOAD_DIR', os.path.join(
+        tempfile.gettempdir(), 'photoblog_uploads'))
+
+
+def max_chunk_size() -> int:
+    return getattr(settings, 'PHOTOBLOG_UPLOAD_MAX_CHUNK_SIZE',
+                   8 * 1024 * 1024)
+
+
+def max_age() -> int:
+    return getattr(settings, 'PHOTOBLOG_UPLOAD_MAX_AGE', 24 * 60 * 60)
+
+
+def upload_path(upload) -> str:
+    """Returns the path of the temporary file of 'upload'."""
+    return os.path.join(upload_dir(), f'{upload.pk}.part')
+
+
+def start(user, filename: str, size: int):
+    """Creates a ChunkedUpload of 'size' bytes for 'user'.
+
+    Keyword arguments:
+    user -- owner of the upload
+    filename -- name of the original file
+    size -- total size of the file in bytes
+    """
+    from photoblog.models import ChunkedUpload
+
+    if size <= 0:
+        raise ChunkError('Size must be a positive number of bytes')
+    upload = ChunkedUpload.objects.create(
+        filename=os.path.basename(filename), size=size, created_by=user)
+    os.makedirs(upload_dir(), exist_ok=True)
+    open(upload_path(upload), 'wb').close()
+    return upload
+
+
+def append(upload, stream, offset: int, length: int, checksum: str):
+    """Appends 'length' bytes read from 'stream' at 'offset'. The chunk
+    is read in small pieces and written straight to disk. A chunk that
+    doesn't match 'checksum' is discarded.
+
+    Raises ChunkError if the chunk is rejected.
+
+    Keyword arguments:
+    upload -- photoblog.models.ChunkedUpload instance
+    stream -- file-like object to read the chunk from
+    offset -- position of the chunk in the file
+    length -- size of the chunk in bytes
+    checksum -- hex SHA-256 digest of the chunk
+    """
+    from photoblog.models import ChunkedUpload
+
+    if length > max_chunk_size():
+        raise ChunkError('Chunk too large', status=413)
+    with transaction.atomic():
+        upload = ChunkedUpload.objects.select_for_update().get(pk=upload.pk)
+        if upload.image_id is not None:
+            raise ChunkError('Upload already finalized', status=409)
+        if offset != upload.offset:
+            raise ChunkError('Unexpected offset', status=409,
+                             offset=upload.offset)
+        if offset + length > upload.size:
+            raise ChunkError('Chunk goes past the end of the file')
+        digest = hashlib.sha256()
+        received = 0
+        with open(upload_path(upload), 'r+b') as fd:
+            fd.seek(offset)
+            while received < length:
+                data = stream.read(min(READ_SIZE, length - received))
+                if not data:
+                    break
+                digest.update(data)
+                fd.write(data)
+                received += len(data)
+            if received != length or digest.hexdigest() != checksum.lower():
+                fd.truncate(offset)
+                raise ChunkError('Checksum mismatch', offset=offset)
+        upload.offset += length
+        upload.save(update_fields=['offset'])
+    return upload
+
+
+def finalize(upload, **fields):
+    """Creates the photoblog Image from a complete upload, and removes
+    the temporary file once committed. Finalizing an upload again
+    returns the same Image.
+
+    Raises ChunkError if bytes are missing.
+
+    Keyword arguments:
+    upload -- photoblog.models.ChunkedUpload instance
+    fields -- Image fields, i.e. title and caption
+    """
+    from photoblog.models import ChunkedUpload, Image
+
+    with transaction.atomic():
+        # Concurrent requests finalize one at a time
+        upload = ChunkedUpload.objects.select_for_update().get(pk=upload.pk)
+        if upload.image_id is not None:
+            return upload.image
+        if not upload.is_complete:
+            raise ChunkError('Upload is incomplete', status=409,
+                             offset=upload.offset)
+        path = upload_path(upload)
+        with open(path, 'rb') as fd:
+            image = Image.objects.create(
+                created_by=upload.created_by,
+                image=File(fd, name=upload.filename),
+                **fields,
+            )
+        upload.image = image
+        upload.save(update_fields=['image'])
+        transaction.on_commit(lambda: _remove(path))
+    return image
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def discard(upload) -> None:
+    """Deletes 'upload' and its temporary file."""
+    _remove(upload_path(upload))
+    upload.delete()
+
+
+def expire(age: int = None) -> int:
+    """Discards the unfinished uploads that received no chunk for 'age'
+    seconds (default PHOTOBLOG_UPLOAD_MAX_AGE). Returns their number."""
+    from photoblog.models import ChunkedUpload
+
+    age = max_age() if age is None else age
+    cutoff = time.time() - age
+    count = 0
+    started = ChunkedUpload.objects.filter(
+        image=None,
+        created_at__lt=timezone.now() - datetime.timedelta(seconds=age))
+    for upload in started.iterator():
+        try:
+            touched = os.path.getmtime(upload_path(upload))
+        except FileNotFoundError:
+            touched = 0
+        if touched < cutoff:
+            discard(upload)
+            count += 1
+    return count
@@ -1,7 +1,29 @@
-from django.urls import path
+from django.urls import path, re_path
+
+from photoblog.pagecache import page_cache
 
 from . import views
 
 urlpatterns = [
-    path('', views.EntryListView.as_view(), name='entry-list'),
+    path('', page_cache(views.EntryListView.as_view()), name='entry-list'),
+    path('entries/<int:pk>/', page_cache(views.EntryDetailView.as_view()),
+         name='entry-detail'),
+    path('search/', views.SearchView.as_view(), name='search'),
+    path('autocomplete/', views.suggestions, name='autocomplete'),
+    path('colors/', views.ColorSearchView.as_view(), name='color-search'),
+    path('uploads/', views.ChunkedUploadStartView.as_view(),
+         name='upload-start'),
+    path('uploads/<uuid:pk>/', views.ChunkedUploadView.as_view(),
+         name='upload'),
+    path('uploads/<uuid:pk>/finalize/',
+         views.ChunkedUploadFinalizeView.as_view(), name='upload-finalize'),
+]
+
+# Served without a language prefix, see gallery/urls.py
+tile_urlpatterns = [
+    re_path(r'^(?P<digest>[0-9a-f]{64})\.dzi$', views.deep_zoom_descriptor,
+            name='photoblog-dzi'),
+    re_path(r'^(?P<digest>[0-9a-f]{64})_files/(?P<level>\d+)/'
+            r'(?P<column>\d+)_(?P<row>\d+)\.jpg$', views.deep_zoom_tile,
+            name='photoblog-tile'),
 ]
@@ -1,8 +1,294 @@
-from django.views.generic import ListView
+import hashlib
+import re
 
-from photoblog.models import Entry
+from django.core.exceptions import ValidationError
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import translation
+from django.utils.cache import patch_cache_control
+from django.utils.http import urlencode
+from django.utils.translation import gettext as _
+from django.views.decorators.http import require_safe
+from django.views.generic import ListView, TemplateView, View
 
-class EntryListView(ListView):
+from photoblog import (autocomplete, cache, facets, palettes, search,
+                       similarity, tiles, uploads)
+from photoblog.models import ChunkedUpload, Entry
+from photoblog.pagination import (CursorPaginationMixin, CursorPaginator,
+                                  InvalidCursor)
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+class EntryListView(CursorPaginationMixin, ListView):
     model = Entry
+    paginate_by = 24
+
     def get_queryset(self):
-        return super(EntryListView, self).get_queryset()
+        self.selected = facets.selection(self.request.GET)
+        return Entry.objects.for_listing().with_facets(self.selected)
+
+    def selection_key(self) -> str:
+        return hashlib.md5(urlencode(
+            sorted(self.selected.items()), doseq=True).encode()).hexdigest()
+
+    def paginate_queryset(self, queryset, page_size):
+        """Pages are read through photoblog.cache, so publishing an entry
+        only sends a single process to the database to rebuild them."""
+        cursor = self.request.GET.get(self.cursor_kwarg) or ''
+        key = 'photoblog:listing:entry:{}:{}:{}'.format(
+            page_size, self.selection_key(),
+            hashlib.md5(cursor.encode()).hexdigest())
+        parent = super(EntryListView, self).paginate_queryset
+        page = cache.get_or_compute(
+            key, lambda: parent(queryset, page_size)[1])
+        return (CursorPaginator(queryset, page_size), page, page.object_list,
+                page.has_other_pages())
+
+    def get_context_data(self, **kwargs):
+        """Adds the facets of the listed entries, each option with the
+        'url' selecting or unselecting it."""
+        context = super(EntryListView, self).get_context_data(**kwargs)
+        key = 'photoblog:facets:{}:{}'.format(translation.get_language(),
+                                              self.selection_key())
+        found = cache.get_or_compute(key,
+                                     lambda: facets.facets(self.selected))
+        for facet in found:
+            for option in facet['options']:
+                selected = {name: list(values)
+                            for name, values in self.selected.items()}
+                values = selected.setdefault(facet['name'], [])
+                if option['selected']:
+                    values.remove(option['value'])
+                else:
+                    values.append(option['value'])
+                option['url'] = '?' + urlencode(sorted(selected.items()),
+                                                doseq=True)
+        context['facets'] = found
+        context['facet_query'] = urlencode(sorted(self.selected.items()),
+                                           doseq=True)
+        return context
+
+
+class EntryDetailView(TemplateView):
+    """A published Entry, read through photoblog.cache, with the entries
+    whose covers look like its own."""
+    template_name = 'photoblog/entry_detail.html'
+    similar_count = 6
+
+    def get_context_data(self, **kwargs):
+        context = super(EntryDetailView, self).get_context_data(**kwargs)
+        entry = cache.get_item(Entry, kwargs['pk'])
+        if entry is None:
+            raise Http404('No such entry')
+        context['entry'] = entry
+        context['similar'] = []
+        if entry['cover'] is not None:
+            key = 'photoblog:similar:entry:{}:{}'.format(
+                translation.get_language(), entry['id'])
+            context['similar'] = cache.get_or_compute(
+                key, lambda: self.similar(entry))
+        return context
+
+    def similar(self, entry: dict) -> list:
+        return [{
+            'id': found.pk,
+            'title': found.title,
+            'cover': cache.serialize_image(found.cover),
+        } for found in similarity.similar_entries(
+            entry['id'], entry['cover']['id'], self.similar_count)]
+
+
+class SearchView(TemplateView):
+    """Published items, images and categories matching the words in the
+    'q' parameter, in the active language, paginated with 'cursor'."""
+    template_name = 'photoblog/search.html'
+    paginate_by = 20
+
+    def get_context_data(self, **kwargs):
+        context = super(SearchView, self).get_context_data(**kwargs)
+        query = self.request.GET.get('q', '')[:200]
+        try:
+            results, next_cursor = search.search(
+                query, cursor=self.request.GET.get('cursor') or None,
+                limit=self.paginate_by)
+        except InvalidCursor:
+            raise Http404(_('Invalid page.'))
+        context.update({'query': query, 'results': results,
+                        'next_cursor': next_cursor})
+        return context
+
+
+class ColorSearchView(TemplateView):
+    """Published entries whose cover has every color of the 'color'
+    parameters, color names or hex codes, closest first."""
+    template_name = 'photoblog/colors.html'
+    max_colors = 3
+    max_results = 48
+
+    def get_colors(self) -> list:
+        words = [word for value in self.request.GET.getlist('color')
+                 for word in re.split(r'[\s,]+', value) if word]
+        colors = []
+        for word in words:
+            rgb = palettes.parse_color(word)
+            if rgb is not None and rgb not in colors:
+                colors.append(rgb)
+        return colors[:self.max_colors]
+
+    def get_context_data(self, **kwargs):
+        context = super(ColorSearchView, self).get_context_data(**kwargs)
+        colors = self.get_colors()
+        entries = []
+        if colors:
+            key = 'photoblog:colors:entry:{}'.format(hashlib.md5(
+                repr(sorted(colors)).encode()).hexdigest())
+            entries = cache.get_or_compute(key, lambda: list(
+                Entry.objects.for_listing().with_colors(colors)
+                [:self.max_results]))
+        context.update({
+            'query': ' '.join(self.request.GET.getlist('color')),
+            'colors': ['#{:02x}{:02x}{:02x}'.format(*rgb) for rgb in colors],
+            'entries': entries,
+        })
+        return context
+
+
+class UploadPermissionMixin:
+    """Only lets users allowed to add images through, answering in JSON."""
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.has_perm('photoblog.add_image'):
+            return JsonResponse({'error': 'Forbidden'}, status=403)
+        return super(UploadPermissionMixin, self).dispatch(
+            request, *args, **kwargs)
+
+    def get_upload(self):
+        return get_object_or_404(ChunkedUpload, pk=self.kwargs['pk'],
+                                 created_by=self.request.user)
+
+
+def upload_state(upload, status=200):
+    return JsonResponse({
+        'id': str(upload.pk),
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.offset,
+        'max_chunk_size': uploads.max_chunk_size(),
+        'url': reverse('gallery:upload', args=(upload.pk,)),
+        'finalize_url': reverse('gallery:upload-finalize', args=(upload.pk,)),
+    }, status=status)
+
+
+def chunk_error(error):
+    return JsonResponse({'error': str(error), 'offset': error.offset},
+                        status=error.status)
+
+
+class ChunkedUploadStartView(UploadPermissionMixin, View):
+    """Starts a chunked upload. Expects 'filename' and 'size' (bytes)."""
+    def post(self, request):
+        try:
+            size = int(request.POST.get('size', ''))
+        except ValueError:
+            return JsonResponse({'error': 'Invalid size'}, status=400)
+        filename = request.POST.get('filename', '')
+        if not filename:
+            return JsonResponse({'error': 'Missing filename'}, status=400)
+        try:
+            upload = uploads.start(request.user, filename, size)
+        except uploads.ChunkError as error:
+            return chunk_error(error)
+        return upload_state(upload, status=201)
+
+
+class ChunkedUploadView(UploadPermissionMixin, View):
+    """GET returns the offset to resume from, PUT appends the chunk in
+    the request body, DELETE abandons the upload. Chunks are sent with
+    'Content-Range: bytes <first>-<last>/<size>' and 'X-Checksum-SHA256'
+    headers."""
+    def get(self, request, pk):
+        return upload_state(self.get_upload())
+
+    def put(self, request, pk):
+        upload = self.get_upload()
+        match = CONTENT_RANGE.match(request.META.get('HTTP_CONTENT_RANGE', ''))
+        checksum = request.META.get('HTTP_X_CHECKSUM_SHA256', '')
+        if not match or not checksum:
+            return JsonResponse(
+                {'error': 'Content-Range and X-Checksum-SHA256 are required'},
+                status=400)
+        first, last, size = (int(g) for g in match.groups())
+        length = last - first + 1
+        if size != upload.size or length <= 0 or \
+                length != int(request.META.get('CONTENT_LENGTH') or 0):
+            return JsonResponse({'error': 'Invalid Content-Range'},
+                                status=400)
+        try:
+            upload = uploads.append(upload, request, first, length, checksum)
+        except uploads.ChunkError as error:
+            return chunk_error(error)
+        return upload_state(upload)
+
+    def delete(self, request, pk):
+        uploads.discard(self.get_upload())
+        return HttpResponse(status=204)
+
+
+class ChunkedUploadFinalizeView(UploadPermissionMixin, View):
+    """Creates the Image of a complete upload. Accepts the translated
+    'title' and 'caption' fields of Image. Answers with the near-duplicates
+    of the image when it was ingested right away."""
+    fields = ('title', 'title_es', 'caption', 'caption_es')
+
+    def post(self, request, pk):
+        upload = self.get_upload()
+        fields = {f: request.POST[f] for f in self.fields if f in request.POST}
+        try:
+            image = uploads.finalize(upload, **fields)
+        except uploads.ChunkError as error:
+            return chunk_error(error)
+        except ValidationError as error:
+            return JsonResponse({'error': error.message_dict}, status=400)
+        return JsonResponse({
+            'id': image.pk,
+            'url': image.image.url,
+            'duplicates': [{'id': other.pk, 'title': other.title}
+                           for other in image.near_duplicates()],
+        }, status=201)
+
+
+def immutable_file(path, content_type):
+    """Serves 'path', which never changes once written, for a year."""
+    try:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    except FileNotFoundError:
+        raise Http404('No such tile')
+    patch_cache_control(response, public=True, max_age=365 * 24 * 60 * 60,
+                        immutable=True)
+    return response
+
+
+@require_safe
+def suggestions(request):
+    """Titles and category names starting with the 'q' parameter, in the
+    active language, as JSON. Served from memory, see
+    photoblog.autocomplete."""
+    response = JsonResponse(
+        {'results': autocomplete.suggest(request.GET.get('q', '')[:100])})
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+
+@require_safe
+def deep_zoom_descriptor(request, digest):
+    """Deep Zoom descriptor of the pyramid of blob 'digest'."""
+    return immutable_file(tiles.descriptor_path(digest), 'application/xml')
+
+
+@require_safe
+def deep_zoom_tile(request, digest, level, column, row):
+    """A tile of the pyramid of blob 'digest'. Pyramids are addressed by
+    content, so tiles can be cached forever."""
+    return immutable_file(
+        tiles.tile_path(digest, int(level), int(column), int(row)),
+        'image/jpeg')
@@ -0,0 +1,199 @@
+"""Process pool for CPU heavy image work (decoding, resizing, encoding,
+hashing), so it runs on every core instead of on the request thread.
+
+The pool is configured through these settings:
+
+    PHOTOBLOG_IMAGE_WORKERS -- number of worker processes. 0 runs every
+                               job in the calling thread. (default 0)
+    PHOTOBLOG_IMAGE_QUEUE_SIZE -- jobs allowed to wait for a free worker
+                                  before submit() blocks. (default 32)
+
+Jobs must be plain functions taking picklable arguments; they must not
+use the ORM, which is only touched from the parent process.
+"""
+import collections
+import hashlib
+import logging
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, NamedTuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class PoolFull(Exception):
+    """Raised when a job can't be queued before the timeout expires."""
+
+
+class JobResult(NamedTuple):
+    """Outcome of a job run by an ImageWorkerPool."""
+    job_id: str
+    name: str
+    ok: bool
+    value: object = None
+    error: str = ''
+
+
+class ImageWorkerPool:
+    """ProcessPoolExecutor with a bounded queue that keeps a record of
+    the jobs that finished or failed.
+
+    Keyword arguments:
+    workers -- number of worker processes, 0 to run jobs inline
+    queue_size -- number of jobs that may wait for a free worker
+    history -- number of finished jobs to keep results for (default 1000)
+    """
+    def __init__(self, workers: int, queue_size: int, history: int = 1000):
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(workers) if workers else None
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._results = collections.OrderedDict()
+        self._history = history
+
+    def submit(self, func: Callable, *args, callback: Callable = None,
+               name: str = '', timeout: float = None) -> str:
+        """Queues func(*args) and returns the id of the job. Blocks while
+        the queue is full, for at most 'timeout' seconds.
+
+        Keyword arguments:
+        func -- job function, must be importable by the workers
+        callback -- called in the parent process with the JobResult
+                    once the job is done (default None)
+        name -- label reported with the result (default func.__name__)
+        timeout -- seconds to wait for a queue slot, None to wait
+                   forever (default None)
+        """
+        job_id = uuid.uuid4().hex
+        name = name or func.__name__
+        if self._executor is None:
+            future = Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as exc:  # pylint: disable=broad-except
+                future.set_exception(exc)
+            self._finish(job_id, name, callback, future)
+            return job_id
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolFull(f'No room in the queue for {name}')
+        with self._lock:
+            self._pending[job_id] = threading.Event()
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            with self._lock:
+                self._pending.pop(job_id)
+            self._slots.release()
+            raise
+        future.add_done_callback(
+            lambda f: self._done(job_id, name, callback, f))
+        return job_id
+
+    def _done(self, job_id, name, callback, future):
+        self._slots.release()
+        try:
+            self._finish(job_id, name, callback, future)
+        finally:
+            # Callbacks run on the executor's own thread, which must not
+            # keep the connections opened by the callback.
+            close_old_connections()
+
+    def _finish(self, job_id, name, callback, future):
+        exc = future.exception()
+        if exc is None:
+            result = JobResult(job_id, name, True, future.result())
+        else:
+            logger.error('Image job %s (%s) failed: %r', job_id, name, exc)
+            result = JobResult(job_id, name, False, error=repr(exc))
+        if callback is not None:
+            try:
+                callback(result)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception('Callback of image job %s failed', job_id)
+                result = result._replace(ok=False, error=repr(exc))
+        with self._lock:
+            self._results[job_id] = result
+            while len(self._results) > self._history:
+                self._results.popitem(last=False)
+            event = self._pending.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    def result(self, job_id: str, timeout: float = None):
+        """Returns the JobResult of 'job_id', waiting for it to finish
+        for at most 'timeout' seconds. Returns None for unknown jobs and
+        jobs still running when the timeout expires.
+        """
+        with self._lock:
+            event = self._pending.get(job_id)
+        if event is not None:
+            event.wait(timeout)
+        with self._lock:
+            return self._results.get(job_id)
+
+    @property
+    def finished(self) -> list:
+        """Results of the jobs that completed successfully."""
+        with self._lock:
+            return [r for r in self._results.values() if r.ok]
+
+    @property
+    def failed(self) -> list:
+        """Results of the jobs that raised an exception."""
+        with self._lock:
+            return [r for r in self._results.values() if not r.ok]
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs queued or running."""
+        with self._lock:
+            return len(self._pending)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stops the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ImageWorkerPool:
+    """Returns the process wide pool, creating it on first use."""
+    global _pool  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is None:
+            _pool = ImageWorkerPool(
+                getattr(settings, 'PHOTOBLOG_IMAGE_WORKERS', 0),
+                getattr(settings, 'PHOTOBLOG_IMAGE_QUEUE_SIZE', 32))
+        return _pool
+
+
+@receiver(setting_changed)
+def reset_pool(setting, **kwargs):
+    """Drops the pool when its settings are overridden, i.e. in tests."""
+    global _pool  # pylint: disable=global-statement
+    if setting in ('PHOTOBLOG_IMAGE_WORKERS', 'PHOTOBLOG_IMAGE_QUEUE_SIZE'):
+        with _pool_lock:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = None
+
+
+def hash_file(path: str, algorithm: str = 'sha256') -> str:
+    """Returns the hex digest of the file at 'path', read in chunks."""
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
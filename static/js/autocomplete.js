@@ -0,0 +1,41 @@
+// Search-as-you-type suggestions for the header search box, read from
+// the autocomplete endpoint of the photoblog (see photoblog/autocomplete.py)
+(function () {
+  var input = document.querySelector('input[data-autocomplete-url]');
+  if (!input) {
+    return;
+  }
+  var list = document.getElementById(input.getAttribute('list'));
+  var urls = {};
+  var pending = null;
+
+  input.addEventListener('input', function () {
+    var query = input.value.trim();
+    if (urls[query]) {
+      window.location = urls[query];
+      return;
+    }
+    if (pending) {
+      pending.abort();
+    }
+    if (!query) {
+      list.innerHTML = '';
+      return;
+    }
+    pending = new XMLHttpRequest();
+    pending.open('GET', input.dataset.autocompleteUrl + '?q=' + encodeURIComponent(query));
+    pending.responseType = 'json';
+    pending.onload = function () {
+      list.innerHTML = '';
+      (this.response.results || []).forEach(function (result) {
+        var option = document.createElement('option');
+        option.value = result.label;
+        if (result.url) {
+          urls[result.label] = result.url;
+        }
+        list.appendChild(option);
+      });
+    };
+    pending.send();
+  });
+})();